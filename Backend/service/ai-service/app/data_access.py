@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+
+import httpx
+
+from app.ml_pipeline.timing import timed
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+
+IN_FILTER_CHUNK_SIZE = 100
+# PostgREST truncates every response to its max-rows setting (1000 by default)
+# without signalling it, so larger reads are paged explicitly.
+PAGE_SIZE = 1000
+# Upper bound for unfiltered listings such as every farm of the platform.
+MAX_LIST_ROWS = 20000
+
+
+class FarmDataAccess:
+    """Async access to the Supabase tables used by the AI endpoints.
+
+    Every query goes through one `httpx.AsyncClient`, so concurrent requests
+    share a bounded keep-alive connection pool instead of blocking a worker
+    thread or the event loop on a synchronous round-trip.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        http_client: Optional[httpx.AsyncClient] = None,
+        max_connections: int = 20,
+        timeout_seconds: float = 10.0,
+    ):
+        self.url = url
+        self.key = key
+        self._http_client = http_client
+        self._owns_http_client = http_client is None
+        self.max_connections = int(max_connections)
+        self.timeout_seconds = float(timeout_seconds)
+        self._client: Optional[AsyncClient] = None
+        self._client_lock: Optional[asyncio.Lock] = None
+
+    async def client(self) -> AsyncClient:
+        if self._client is not None:
+            return self._client
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
+        async with self._client_lock:
+            if self._client is None:
+                # supabase pulls in a large import tree; load it with the first client.
+                from supabase import AsyncClientOptions, acreate_client
+
+                if self._http_client is None:
+                    self._http_client = httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        ),
+                        timeout=httpx.Timeout(self.timeout_seconds),
+                    )
+                self._client = await acreate_client(
+                    self.url,
+                    self.key,
+                    options=AsyncClientOptions(httpx_client=self._http_client),
+                )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._http_client is not None and self._owns_http_client:
+            await self._http_client.aclose()
+            self._http_client = None
+        self._client = None
+        self._client_lock = None
+
+    async def _gather_chunks(
+        self,
+        ids: Sequence[str],
+        build_query: Callable[[AsyncClient, List[str]], Any],
+    ) -> List[Dict[str, Any]]:
+        """Run one paged `in_` query per chunk of ids concurrently, keeping URLs short.
+
+        A chunk can match more rows than PostgREST returns at once (farms with
+        many devices, say), so each one is paged; `build_query` must apply a
+        total order.
+        """
+        unique_ids = list(dict.fromkeys(str(item) for item in ids if item))
+        if not unique_ids:
+            return []
+        chunks = [
+            unique_ids[start : start + IN_FILTER_CHUNK_SIZE]
+            for start in range(0, len(unique_ids), IN_FILTER_CHUNK_SIZE)
+        ]
+        pages = await asyncio.gather(
+            *[self._fetch_pages(lambda client, chunk=chunk: build_query(client, chunk)) for chunk in chunks]
+        )
+        return [row for page in pages for row in page]
+
+    async def _fetch_pages(
+        self,
+        build_query: Callable[[AsyncClient], Any],
+        max_rows: Optional[int] = None,
+        done: Optional[Callable[[List[Dict[str, Any]]], bool]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Page through a query with `.range()` until it is exhausted, `max_rows` is reached or `done(rows)`.
+
+        `build_query` must apply a total order, or pages can overlap or skip rows.
+        """
+        client = await self.client()
+        rows: List[Dict[str, Any]] = []
+        while max_rows is None or len(rows) < max_rows:
+            size = PAGE_SIZE if max_rows is None else min(PAGE_SIZE, max_rows - len(rows))
+            response = await build_query(client).range(len(rows), len(rows) + size - 1).execute()
+            page = list(response.data or [])
+            rows.extend(page)
+            if len(page) < size or (done is not None and done(rows)):
+                break
+        return rows
+
+    @timed("supabase")
+    async def get_farm(self, farm_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        client = await self.client()
+        response = await client.table("farms").select(columns).eq("id", farm_id).limit(1).execute()
+        rows = response.data or []
+        return rows[0] if rows else None
+
+    @timed("supabase")
+    async def get_farms(self, farm_ids: Sequence[str], columns: str = "*") -> List[Dict[str, Any]]:
+        return await self._gather_chunks(
+            farm_ids,
+            lambda client, chunk: client.table("farms").select(columns).in_("id", chunk).order("id"),
+        )
+
+    @timed("supabase")
+    async def list_farms(
+        self,
+        user_id: Optional[str] = None,
+        columns: str = "*",
+        max_rows: int = MAX_LIST_ROWS,
+    ) -> List[Dict[str, Any]]:
+        """Farms of one user, or of every user, paged and capped at `max_rows`."""
+
+        def build_query(client: AsyncClient) -> Any:
+            query = client.table("farms").select(columns)
+            if user_id:
+                query = query.eq("user_id", user_id)
+            return query.order("id")
+
+        return await self._fetch_pages(build_query, max_rows=max_rows)
+
+    @timed("supabase")
+    async def list_farm_device_ids(self, farm_id: str, limit: Optional[int] = None) -> List[str]:
+        client = await self.client()
+        query = client.table("iot_devices").select("id").eq("farm_id", farm_id)
+        if limit is not None:
+            query = query.limit(limit)
+        response = await query.execute()
+        return [str(row["id"]) for row in response.data or [] if row.get("id")]
+
+    @timed("supabase")
+    async def list_devices_for_farms(self, farm_ids: Sequence[str]) -> List[Dict[str, Any]]:
+        rows = await self._gather_chunks(
+            farm_ids,
+            lambda client, chunk: client.table("iot_devices").select("id,farm_id").in_("farm_id", chunk).order("id"),
+        )
+        return [row for row in rows if row.get("id")]
+
+    @timed("supabase")
+    async def list_sensor_readings(
+        self,
+        device_ids: Sequence[str],
+        columns: str = "device_id,salinity,ph,temperature,timestamp",
+        limit: int = 2000,
+        newest_first: bool = False,
+    ) -> List[Dict[str, Any]]:
+        if not device_ids:
+            return []
+        client = await self.client()
+        response = await (
+            client.table("sensor_readings")
+            .select(columns)
+            .in_("device_id", list(device_ids))
+            .order("timestamp", desc=newest_first)
+            .limit(limit)
+            .execute()
+        )
+        return list(response.data or [])
+
+    @timed("supabase")
+    async def list_recent_readings_for_devices(
+        self,
+        device_ids: Sequence[str],
+        since: Optional[str] = None,
+        columns: str = "device_id,salinity,ph,temperature,timestamp",
+        per_device: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Newest readings at or after `since` (all history when None) for many devices, newest first.
+
+        Each chunk of device ids is paged concurrently. A chunk stops as soon as
+        every device in it has `per_device` rows, and at most that many are kept
+        per device. A chunk with a silent device would otherwise page through
+        its whole range, so it also stops after MAX_LIST_ROWS rows. With
+        `per_device=None` the whole window is read.
+        """
+        unique_ids = list(dict.fromkeys(str(item) for item in device_ids if item))
+        chunks = [
+            unique_ids[start : start + IN_FILTER_CHUNK_SIZE]
+            for start in range(0, len(unique_ids), IN_FILTER_CHUNK_SIZE)
+        ]
+
+        def build_query(chunk: List[str]) -> Callable[[AsyncClient], Any]:
+            def query(client: AsyncClient) -> Any:
+                builder = client.table("sensor_readings").select(columns).in_("device_id", chunk)
+                if since is not None:
+                    builder = builder.gte("timestamp", since)
+                return builder.order("timestamp", desc=True).order("device_id")
+
+            return query
+
+        def covered(chunk: List[str]) -> Optional[Callable[[List[Dict[str, Any]]], bool]]:
+            if per_device is None:
+                return None
+
+            def done(rows: List[Dict[str, Any]]) -> bool:
+                counts: Dict[str, int] = {}
+                for row in rows:
+                    device_id = str(row.get("device_id"))
+                    counts[device_id] = counts.get(device_id, 0) + 1
+                return all(counts.get(device_id, 0) >= per_device for device_id in chunk)
+
+            return done
+
+        pages = await asyncio.gather(
+            *[
+                self._fetch_pages(
+                    build_query(chunk),
+                    max_rows=None if per_device is None else MAX_LIST_ROWS,
+                    done=covered(chunk),
+                )
+                for chunk in chunks
+            ]
+        )
+        rows: List[Dict[str, Any]] = []
+        kept: Dict[str, int] = {}
+        for row in (row for page in pages for row in page):
+            device_id = str(row.get("device_id"))
+            if per_device is not None and kept.get(device_id, 0) >= per_device:
+                continue
+            kept[device_id] = kept.get(device_id, 0) + 1
+            rows.append(row)
+        return rows
+
+    @timed("supabase")
+    async def get_active_season(self, farm_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        client = await self.client()
+        response = await (
+            client.table("seasons")
+            .select(columns)
+            .eq("farm_id", farm_id)
+            .eq("status", "active")
+            .limit(1)
+            .execute()
+        )
+        rows = response.data or []
+        return rows[0] if rows else None
+
+    @timed("supabase")
+    async def list_active_seasons(self, farm_ids: Sequence[str], columns: str = "*") -> List[Dict[str, Any]]:
+        return await self._gather_chunks(
+            farm_ids,
+            lambda client, chunk: client.table("seasons")
+            .select(columns)
+            .in_("farm_id", chunk)
+            .eq("status", "active")
+            .order("id"),
+        )
+
+    @timed("supabase")
+    async def get_latest_season_recommendation(self, farm_id: str) -> Optional[Dict[str, Any]]:
+        client = await self.client()
+        response = await (
+            client.table("season_recommendations")
+            .select("*")
+            .eq("farm_id", farm_id)
+            .order("created_at", desc=True)
+            .limit(1)
+            .execute()
+        )
+        rows = response.data or []
+        return rows[0] if rows else None
+
+    @timed("supabase")
+    async def insert_season_recommendation(self, row: Dict[str, Any]) -> None:
+        client = await self.client()
+        await client.table("season_recommendations").insert(row).execute()
+
+    @timed("supabase")
+    async def list_analysis_requests(self, farm_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        client = await self.client()
+        response = await (
+            client.table("analysis_requests")
+            .select("*")
+            .eq("farm_id", farm_id)
+            .order("created_at", desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return list(response.data or [])
+
+    @timed("supabase")
+    async def insert_analysis_request(self, row: Dict[str, Any]) -> None:
+        client = await self.client()
+        await client.table("analysis_requests").insert(row).execute()
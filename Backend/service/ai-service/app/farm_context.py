@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.data_access import FarmDataAccess
+from app.ml_pipeline.cache import TTLCache
+from app.ml_pipeline.singleflight import SingleFlight
+
+
+FARM_COLUMNS = "id,user_id,farm_name,farm_type,address,farm_code"
+SEASON_COLUMNS = "season_type,start_date,variety,status"
+
+
+@dataclass(frozen=True)
+class FarmContext:
+    farm_id: str
+    farm: Dict[str, Any]
+    province: Optional[str]
+    device_ids: List[str] = field(default_factory=list)
+    active_season: Optional[Dict[str, Any]] = None
+
+    @property
+    def farm_code(self) -> Optional[str]:
+        return self.farm.get("farm_code")
+
+    @property
+    def farm_type(self) -> Optional[str]:
+        return self.farm.get("farm_type")
+
+
+class FarmContextCache:
+    """Farm row, resolved province, device ids and active season per farm_id.
+
+    A miss loads the three pieces concurrently. Concurrent misses for the same
+    farm share one load. Entries expire after `ttl_seconds` and can be dropped
+    explicitly when the backend changes a farm, its devices or its season.
+    Each invalidation bumps the farm's generation, so a load that started
+    before it is neither joined by later callers nor stored in the cache.
+    """
+
+    def __init__(
+        self,
+        data: FarmDataAccess,
+        resolve_province: Callable[[Dict[str, Any]], Optional[str]],
+        maxsize: int = 1024,
+        ttl_seconds: float = 300.0,
+        single_flight: Optional[SingleFlight] = None,
+    ):
+        self.data = data
+        self._resolve_province = resolve_province
+        self._cache = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+        self._single_flight = single_flight or SingleFlight()
+        self._generation_lock = threading.Lock()
+        self._epoch = 0
+        self._generations: Dict[str, int] = {}
+
+    def _generation(self, farm_id: str) -> Tuple[int, int]:
+        with self._generation_lock:
+            return self._epoch, self._generations.get(farm_id, 0)
+
+    async def get(self, farm_id: str) -> Optional[FarmContext]:
+        cached = self._cache.get(farm_id)
+        if cached is not None:
+            return cached
+        generation = self._generation(farm_id)
+        return await self._single_flight.do_async(
+            ("farm", farm_id, generation), lambda: self._load(farm_id, generation)
+        )
+
+    async def _load(self, farm_id: str, generation: Tuple[int, int]) -> Optional[FarmContext]:
+        farm, device_ids, season = await asyncio.gather(
+            self.data.get_farm(farm_id, columns=FARM_COLUMNS),
+            self.data.list_farm_device_ids(farm_id),
+            self.data.get_active_season(farm_id, columns=SEASON_COLUMNS),
+        )
+        if not farm:
+            return None
+        context = FarmContext(
+            farm_id=farm_id,
+            farm=farm,
+            province=self._resolve_province(farm),
+            device_ids=device_ids,
+            active_season=season,
+        )
+        # Checked and stored under the lock, so an invalidate cannot slip in between.
+        with self._generation_lock:
+            if (self._epoch, self._generations.get(farm_id, 0)) == generation:
+                self._cache.set(farm_id, context)
+        return context
+
+    def invalidate(self, farm_ids: Optional[Iterable[str]] = None) -> int:
+        """Drop the given farms, or every farm when `farm_ids` is None; returns the count dropped."""
+        with self._generation_lock:
+            if farm_ids is None:
+                self._epoch += 1
+                self._generations.clear()
+                dropped = len(self._cache)
+                self._cache.clear()
+                return dropped
+            dropped = 0
+            for farm_id in set(farm_ids):
+                self._generations[farm_id] = self._generations.get(farm_id, 0) + 1
+                if self._cache.pop(farm_id) is not None:
+                    dropped += 1
+            return dropped
+
+    def stats(self) -> Dict[str, object]:
+        return self._cache.stats()
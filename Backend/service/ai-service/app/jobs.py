@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    next_run_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_dedupe ON jobs (kind, dedupe_key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_run_at);
+CREATE INDEX IF NOT EXISTS jobs_dedupe_key ON jobs (dedupe_key, created_at);
+"""
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help, e.g. the target no longer exists."""
+
+
+def _iso(epoch: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat() if epoch is not None else None
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    dedupe_key: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str]
+    created_at: float
+    updated_at: float
+    next_run_at: float
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        values = dict(row)
+        values["payload"] = json.loads(values["payload"])
+        return cls(**values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "dedupe_key": self.dedupe_key,
+            "payload": self.payload,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "last_error": self.last_error,
+            "created_at": _iso(self.created_at),
+            "updated_at": _iso(self.updated_at),
+            "next_run_at": _iso(self.next_run_at) if self.status == PENDING else None,
+        }
+
+
+class JobStore:
+    """SQLite-backed job table, so queued and failed jobs survive restarts.
+
+    Claims run in an immediate transaction, so several worker processes can
+    share one database file without running a job twice.
+    """
+
+    def __init__(self, path: Path, clock: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self._clock = clock
+        self._lock = threading.Lock()
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        with self._lock:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def reopen(self) -> None:
+        """Open a new connection, e.g. in a forked worker; SQLite connections must not cross fork()."""
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def add(
+        self,
+        kind: str,
+        dedupe_key: str,
+        payload: Dict[str, Any],
+        max_attempts: int,
+        max_pending: Optional[int] = None,
+    ) -> Tuple[Optional[Job], bool]:
+        """Insert a pending job, or return the pending job with the same key.
+
+        Returns `(None, False)` when `max_pending` jobs are already waiting.
+        """
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._conn.execute(
+                    "SELECT * FROM jobs WHERE kind = ? AND dedupe_key = ? AND status = ?",
+                    (kind, dedupe_key, PENDING),
+                ).fetchone()
+                if existing is not None:
+                    self._conn.execute("COMMIT")
+                    return Job.from_row(existing), False
+                if max_pending is not None:
+                    (pending,) = self._conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE status = ?", (PENDING,)
+                    ).fetchone()
+                    if pending >= max_pending:
+                        self._conn.execute("COMMIT")
+                        return None, False
+                job = Job(
+                    id=uuid.uuid4().hex,
+                    kind=kind,
+                    dedupe_key=dedupe_key,
+                    payload=dict(payload),
+                    status=PENDING,
+                    attempts=0,
+                    max_attempts=int(max_attempts),
+                    last_error=None,
+                    created_at=now,
+                    updated_at=now,
+                    next_run_at=now,
+                )
+                self._conn.execute(
+                    "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job.id,
+                        job.kind,
+                        job.dedupe_key,
+                        json.dumps(job.payload),
+                        job.status,
+                        job.attempts,
+                        job.max_attempts,
+                        job.last_error,
+                        job.created_at,
+                        job.updated_at,
+                        job.next_run_at,
+                    ),
+                )
+                self._conn.execute("COMMIT")
+                return job, True
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim(self) -> Optional[Job]:
+        """Move the oldest due pending job to running and return it."""
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND next_run_at <= ? ORDER BY next_run_at, created_at LIMIT 1",
+                    (PENDING, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (RUNNING, now, row["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = Job.from_row(row)
+        job.status = RUNNING
+        job.attempts += 1
+        job.updated_at = now
+        return job
+
+    def finish(
+        self,
+        job: Job,
+        status: str,
+        error: Optional[str] = None,
+        retry_in: Optional[float] = None,
+    ) -> None:
+        """Record the outcome of a run; `status=PENDING` schedules a retry `retry_in` seconds from now."""
+        now = self._clock()
+        with self._lock:
+            if status == PENDING:
+                self._requeue(job.id, now + (retry_in or 0.0), error, payload=job.payload)
+                return
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, payload = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(job.payload), error, now, job.id),
+            )
+
+    def _requeue(
+        self,
+        job_id: str,
+        run_at: float,
+        error: Optional[str],
+        payload: Optional[Dict[str, Any]] = None,
+        refund_attempt: bool = False,
+    ) -> None:
+        # A newer pending job with the same key already covers this work; the
+        # pending dedupe index would reject a second one, so close this one.
+        now = self._clock()
+        attempts = "MAX(attempts - 1, 0)" if refund_attempt else "attempts"
+        payload_sql = ", payload = ?" if payload is not None else ""
+        params: List[Any] = [PENDING, error, now, run_at]
+        if payload is not None:
+            params.append(json.dumps(payload))
+        try:
+            self._conn.execute(
+                f"UPDATE jobs SET status = ?, last_error = ?, updated_at = ?, next_run_at = ?, "
+                f"attempts = {attempts}{payload_sql} WHERE id = ?",
+                (*params, job_id),
+            )
+        except sqlite3.IntegrityError:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (FAILED, "Superseded by a newer pending job.", now, job_id),
+            )
+
+    def release(self, job: Job) -> None:
+        """Put an interrupted run back in the queue without counting the attempt."""
+        with self._lock:
+            self._requeue(job.id, self._clock(), job.last_error, payload=job.payload, refund_attempt=True)
+
+    def requeue_running(self) -> int:
+        """Return jobs left running by a crashed or killed process to the queue."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, last_error FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            for row in rows:
+                self._requeue(row["id"], self._clock(), row["last_error"], refund_attempt=True)
+            return len(rows)
+
+    def prune(self, older_than_seconds: float) -> int:
+        cutoff = self._clock() - older_than_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (SUCCEEDED, FAILED, cutoff),
+            )
+            return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def list(
+        self,
+        dedupe_key: Optional[str] = None,
+        limit: int = 20,
+        dedupe_prefix: Optional[str] = None,
+    ) -> List[Job]:
+        """Newest jobs first, optionally only those whose key equals `dedupe_key` or starts with `dedupe_prefix`."""
+        query = "SELECT * FROM jobs"
+        params: List[Any] = []
+        if dedupe_key is not None:
+            query += " WHERE dedupe_key = ?"
+            params.append(dedupe_key)
+        elif dedupe_prefix:
+            # A range rather than LIKE, so the dedupe_key index is used.
+            query += " WHERE dedupe_key >= ? AND dedupe_key < ?"
+            params.extend([dedupe_prefix, dedupe_prefix[:-1] + chr(ord(dedupe_prefix[-1]) + 1)])
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: int(count) for status, count in rows}
+
+
+JobHandler = Callable[[Job], Awaitable[None]]
+
+
+@dataclass
+class JobEngine:
+    """A fixed number of worker tasks draining a `JobStore`.
+
+    Handlers are coroutines and may update `job.payload` to record progress
+    that a retry should not repeat; the payload is saved with the outcome.
+    Store calls run in a worker thread, so SQLite never blocks the event loop.
+    A failed run is retried after `retry_backoff_seconds * 2 ** (attempt - 1)`
+    until `max_attempts` is reached; a `PermanentJobError` fails it at once.
+    """
+
+    store: JobStore
+    handlers: Dict[str, JobHandler]
+    workers: int = 2
+    max_attempts: int = 3
+    retry_backoff_seconds: float = 5.0
+    max_pending: Optional[int] = 500
+    poll_interval: float = 1.0
+    # Off when a supervisor already recovered stale jobs, so one worker
+    # restarting cannot requeue jobs its siblings are still running.
+    recover_on_start: bool = True
+    _tasks: List["asyncio.Task[None]"] = field(default_factory=list, init=False, repr=False)
+    _wakeup: Optional[asyncio.Event] = field(default=None, init=False, repr=False)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        if self.recover_on_start:
+            await asyncio.to_thread(self.store.requeue_running)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(max(1, int(self.workers)))]
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, kind: str, dedupe_key: str, payload: Dict[str, Any]) -> Tuple[Optional[Job], bool]:
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        job, created = await asyncio.to_thread(
+            self.store.add, kind, dedupe_key, payload, self.max_attempts, self.max_pending
+        )
+        if created and self._wakeup is not None:
+            self._wakeup.set()
+        return job, created
+
+    async def _worker(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self.store.claim)
+            if job is None:
+                await self._wait_for_work()
+                continue
+            await self._run(job)
+
+    async def _wait_for_work(self) -> None:
+        assert self._wakeup is not None
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            return
+        self._wakeup.clear()
+
+    async def _run(self, job: Job) -> None:
+        try:
+            await self.handlers[job.kind](job)
+        except asyncio.CancelledError:
+            await asyncio.shield(asyncio.to_thread(self.store.release, job))
+            raise
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            if job.attempts < job.max_attempts and not isinstance(exc, PermanentJobError):
+                retry_in = self.retry_backoff_seconds * 2 ** (job.attempts - 1)
+                await asyncio.to_thread(self.store.finish, job, PENDING, error, retry_in)
+            else:
+                await asyncio.to_thread(self.store.finish, job, FAILED, error)
+            print(f"[AI] Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {error}")
+            return
+        await asyncio.to_thread(self.store.finish, job, SUCCEEDED)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "workers": len(self._tasks),
+            "max_attempts": self.max_attempts,
+            "max_pending": self.max_pending,
+            "jobs": self.store.counts(),
+        }
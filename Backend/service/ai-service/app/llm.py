@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class LLMUnavailableError(RuntimeError):
+    """No model could be initialised, or all slots stayed busy for too long."""
+
+
+class LLMTimeoutError(RuntimeError):
+    """The model did not answer within the per-call timeout."""
+
+
+ModelFactory = Callable[[], Tuple[Optional[Any], str]]
+
+
+class LLMGateway:
+    """Runs a synchronous `generate_content` model off the event loop.
+
+    Calls go to a dedicated thread pool, so slow LLM round-trips never take
+    threads from the pool that serves forecasts and other blocking work. A
+    semaphore caps concurrent calls. A call that times out still holds its
+    slot until the underlying request returns, so a hung upstream cannot pile
+    up threads. The model is built lazily by `factory`, also in that pool,
+    and a failed build is retried after `init_retry_seconds`.
+    """
+
+    def __init__(
+        self,
+        factory: ModelFactory,
+        max_concurrency: int = 4,
+        timeout_seconds: float = 30.0,
+        queue_timeout_seconds: float = 10.0,
+        init_retry_seconds: float = 60.0,
+    ):
+        self._factory = factory
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout_seconds = float(timeout_seconds)
+        self.queue_timeout_seconds = float(queue_timeout_seconds)
+        self.init_retry_seconds = float(init_retry_seconds)
+        # One extra thread so a model rebuild is not stuck behind busy calls.
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency + 1, thread_name_prefix="llm")
+        # Created on first use so it binds to the serving event loop.
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._init_lock = threading.Lock()
+        self._model: Optional[Any] = None
+        self.model_name = ""
+        self._last_init_attempt: Optional[float] = None
+        self.calls = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.errors = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def _build(self, force: bool = False) -> Optional[Any]:
+        with self._init_lock:
+            if self._model is not None and not force:
+                return self._model
+            now = time.monotonic()
+            if (
+                not force
+                and self._last_init_attempt is not None
+                and now - self._last_init_attempt < self.init_retry_seconds
+            ):
+                return None
+            self._last_init_attempt = now
+            model, name = self._factory()
+            self._model, self.model_name = model, name if model is not None else ""
+            return self._model
+
+    async def ensure_model(self, force: bool = False) -> Optional[Any]:
+        if self._model is not None and not force:
+            return self._model
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._build, force)
+
+    def reset(self) -> None:
+        """Drop the current model so the next call selects one again."""
+        with self._init_lock:
+            self._model = None
+            self.model_name = ""
+            self._last_init_attempt = None
+
+    async def generate(self, content: Any) -> Tuple[str, str]:
+        """Return `(reply_text, model_name)` for `content`."""
+        model = await self.ensure_model()
+        if model is None:
+            raise LLMUnavailableError("Gemini model chưa sẵn sàng.")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        slots = self._slots
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout_seconds)
+        except asyncio.TimeoutError as exc:
+            self.rejected += 1
+            raise LLMUnavailableError("Gemini đang quá tải, vui lòng thử lại sau.") from exc
+
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(model.generate_content, content)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release))
+        try:
+            response = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError as exc:
+            self.timeouts += 1
+            raise LLMTimeoutError(f"Gemini did not respond within {self.timeout_seconds:g}s.") from exc
+        except Exception:
+            self.errors += 1
+            raise
+        return response.text, self.model_name
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready,
+            "model": self.model_name,
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout_seconds,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
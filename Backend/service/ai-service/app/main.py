@@ -5,25 +5,28 @@ import csv
 import io
 import json
 import os
-from datetime import datetime, timedelta
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
 import sys
 
-try:
-    import google.generativeai as genai  # type: ignore[import]
-except ImportError:
-    genai = None  # type: ignore[assignment]
+_IMPORT_STARTED = time.perf_counter()
+
+# google.generativeai, supabase, joblib and sklearn are imported where they are
+# first used, so the process can serve /health before those large trees load.
 import numpy as np
 import pandas as pd
-import joblib
 from dotenv import load_dotenv
-from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from supabase import Client, create_client
 
 # Allow running from either repo root or `app/` directory.
 # Without this, `python main.py` (when CWD is `app/`) cannot resolve `import app.*`.
@@ -31,14 +34,48 @@ _SERVICE_ROOT = Path(__file__).resolve().parent.parent
 if str(_SERVICE_ROOT) not in sys.path:
     sys.path.insert(0, str(_SERVICE_ROOT))
 
-from app.ml_pipeline.config import DEFAULT_METADATA_PATH, MODELS_DIR
-from app.ml_pipeline.infer import ForecastError, ForecastResult, ForecastService
-from app.ml_pipeline.data_loader import parse_province_from_address
+from app.data_access import MAX_LIST_ROWS, FarmDataAccess
+from app.jobs import Job, JobEngine, JobStore, PermanentJobError
+from app.llm import LLMGateway, LLMTimeoutError, LLMUnavailableError
+from app.farm_context import FARM_COLUMNS, SEASON_COLUMNS, FarmContext, FarmContextCache
+from app.reading_state import READING_COLUMNS, ReadingStateStore
+from app.report_cache import FileResponseCache, file_signature as _file_signature
+from app.table_stream import CsvTable, CursorError, RowFilter, stream_page
+from app.ml_pipeline.ai2_features import build_ai2_features, predict_risk
+from app.ml_pipeline.cache import TTLCache
+from app.ml_pipeline.config import (
+    DATA_DIR,
+    DEFAULT_METADATA_PATH,
+    DEFAULT_PREDICTIONS_CSV,
+    DEFAULT_TRAIN_FEATURES_CSV,
+    MODELS_DIR,
+)
+from app.ml_pipeline.infer import ForecastError, ForecastResult, ForecastService, service_today
+from app.ml_pipeline.materialize import materialize_forecasts
+from app.ml_pipeline.data_loader import normalize_province_name, parse_province_from_address
+from app.ml_pipeline.reloader import HotSwapLoader
+from app.ml_pipeline.singleflight import SingleFlight
+from app.ml_pipeline.timing import STARTUP_SECONDS, TimingMiddleware, render_metrics, stage
 
 load_dotenv()
 
-app = FastAPI(title="Mekong Sight AI Service")
 
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    await _startup()
+    try:
+        yield
+    finally:
+        await _shutdown()
+
+
+app = FastAPI(title="Mekong Sight AI Service", lifespan=_lifespan)
+
+# Stage timings are always collected; the Server-Timing header is opt-in.
+app.add_middleware(
+    TimingMiddleware,
+    server_timing=os.getenv("METRICS_SERVER_TIMING", "false").strip().lower() in {"1", "true", "yes"},
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -53,40 +90,41 @@ CHARTS_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/api/ai/reports/static/charts", StaticFiles(directory=str(CHARTS_DIR)), name="ai-report-charts")
 
 
-def _init_supabase_client() -> Optional[Client]:
+def _init_data_access() -> Optional[FarmDataAccess]:
     url = os.environ.get("SUPABASE_URL", "")
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
     if not url or not key:
         return None
-    try:
-        return create_client(url, key)
-    except Exception as exc:
-        print(f"WARNING: Supabase client init failed: {exc}")
-        return None
+    return FarmDataAccess(
+        url,
+        key,
+        max_connections=int(os.environ.get("SUPABASE_MAX_CONNECTIONS", "20")),
+        timeout_seconds=float(os.environ.get("SUPABASE_TIMEOUT_SECONDS", "10")),
+    )
 
 
-supabase = _init_supabase_client()
+data_access = _init_data_access()
 
 
-def _require_supabase() -> Client:
-    if supabase is None:
+def _require_data_access() -> FarmDataAccess:
+    if data_access is None:
         raise HTTPException(status_code=500, detail="Supabase is not configured.")
-    return supabase
+    return data_access
 
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "").strip()
-gemini_model = None
-gemini_model_name = ""
 
 
-def _init_gemini_model():
-    global gemini_model, gemini_model_name
-    if not GEMINI_API_KEY or genai is None:
-        gemini_model = None
-        gemini_model_name = ""
+def _create_gemini_model() -> tuple[Optional[object], str]:
+    if not GEMINI_API_KEY:
         print("WARNING: GEMINI_API_KEY not found in environment variables.")
-        return
+        return None, ""
+    try:
+        import google.generativeai as genai  # type: ignore[import]
+    except ImportError:
+        print("WARNING: google-generativeai is not installed.")
+        return None, ""
 
     try:
         genai.configure(api_key=GEMINI_API_KEY)
@@ -133,16 +171,23 @@ def _init_gemini_model():
                 "No Gemini model with generateContent is available for this API key/project."
             )
 
-        gemini_model = genai.GenerativeModel(chosen)
-        gemini_model_name = chosen
+        model = genai.GenerativeModel(chosen)
         print(f"SUCCESS: Gemini AI initialized with model: {chosen}")
+        return model, chosen
     except Exception as exc:
         print(f"ERROR: Failed to initialize Gemini: {exc}")
-        gemini_model = None
-        gemini_model_name = ""
+        return None, ""
 
 
-_init_gemini_model()
+# Gemini calls run in their own small thread pool with a timeout and a
+# concurrency cap, so chat traffic cannot stall the event loop or the
+# threadpool that serves forecasts.
+chat_llm = LLMGateway(
+    _create_gemini_model,
+    max_concurrency=int(os.environ.get("GEMINI_MAX_CONCURRENCY", "4")),
+    timeout_seconds=float(os.environ.get("GEMINI_TIMEOUT_SECONDS", "30")),
+    queue_timeout_seconds=float(os.environ.get("GEMINI_QUEUE_TIMEOUT_SECONDS", "10")),
+)
 
 
 SYSTEM_PROMPT = """
@@ -177,6 +222,29 @@ class AnalysisRequest(BaseModel):
     analysis_type: str
 
 
+class FarmContextInvalidateRequest(BaseModel):
+    farm_ids: Optional[list[str]] = None
+
+
+class SensorReadingIn(BaseModel):
+    device_id: str
+    timestamp: str
+    salinity: Optional[float] = None
+    temperature: Optional[float] = None
+    ph: Optional[float] = None
+
+
+class ReadingIngestRequest(BaseModel):
+    readings: list[SensorReadingIn]
+
+
+class DecisionBatchRequest(BaseModel):
+    farm_ids: Optional[list[str]] = None
+    user_id: Optional[str] = None
+    province: Optional[str] = None
+    current_date: Optional[str] = None
+
+
 class ForecastPointResponse(BaseModel):
     day_ahead: int
     date: str
@@ -191,10 +259,37 @@ class Forecast7DResponse(BaseModel):
     forecast: list[ForecastPointResponse]
 
 
-_forecast_service: Optional[ForecastService] = None
-_forecast_service_metadata_mtime: Optional[float] = None
-_ai2_bundle: Optional[dict] = None
-_ai2_bundle_mtime: Optional[tuple[float, float, float]] = None
+class ForecastBatchItem(BaseModel):
+    province: Optional[str] = None
+    farm_id: Optional[str] = None
+    as_of: Optional[str] = None
+
+
+class Forecast7DBatchRequest(BaseModel):
+    items: list[ForecastBatchItem]
+    model_set: str = "champion"
+
+
+FORECAST_BATCH_MAX_ITEMS = 200
+FORECAST_RANGE_MAX_DAYS = 366
+DECISION_BATCH_MAX_FARMS = 500
+AI2_BATCH_LOOKBACK_DAYS = int(os.environ.get("AI2_BATCH_LOOKBACK_DAYS", "30"))
+READING_INGEST_MAX_ITEMS = 5000
+
+# AI2 features use at most the last 8 readings of a farm; 16 per device leaves headroom.
+reading_state = ReadingStateStore(
+    capacity=int(os.environ.get("READING_STATE_CAPACITY", "16")),
+    max_age_seconds=float(os.environ.get("READING_STATE_MAX_AGE_SECONDS", "60")),
+)
+
+_forecast_result_cache = TTLCache(
+    maxsize=int(os.environ.get("FORECAST_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.environ.get("FORECAST_CACHE_TTL_SECONDS", "900")),
+)
+_single_flight = SingleFlight()
+MODEL_RELOAD_INTERVAL_SECONDS = float(os.environ.get("MODEL_RELOAD_INTERVAL_SECONDS", "5"))
+FORECAST_FLAT_TREES = os.environ.get("FORECAST_FLAT_TREES", "0").strip().lower() in {"1", "true", "yes"}
+FORECAST_TABLE_AUTO_REBUILD = os.environ.get("FORECAST_TABLE_AUTO_REBUILD", "1").strip().lower() in {"1", "true", "yes"}
 FARM_CODE_PROVINCE = {
     "ST": "Soc Trang",
     "BL": "Bac Lieu",
@@ -207,139 +302,226 @@ AI2_MAIN_PATH = MODELS_DIR / "ai2_risk_xgboost.pkl"
 AI2_BASELINE_PATH = MODELS_DIR / "ai2_risk_baseline.pkl"
 
 
-def _read_csv_report(file_name: str):
-    report_path = REPORTS_DIR / file_name
+def _read_csv_report(report_path: Path) -> dict:
     if not report_path.exists():
-        return []
+        return {"success": True, "data": []}
     with report_path.open("r", encoding="utf-8") as handle:
         reader = csv.DictReader(handle)
-        return list(reader)
+        return {"success": True, "data": list(reader)}
 
 
-def _read_model_metadata() -> dict:
-    if not DEFAULT_METADATA_PATH.exists():
+def _read_model_metadata(metadata_path: Path) -> dict:
+    if not metadata_path.exists():
         raise HTTPException(status_code=404, detail="Model metadata not found. Train AI1 first.")
-    return json.loads(DEFAULT_METADATA_PATH.read_text(encoding="utf-8"))
+    return {"success": True, "data": json.loads(metadata_path.read_text(encoding="utf-8"))}
 
 
-def _get_metadata_mtime() -> Optional[float]:
-    if not DEFAULT_METADATA_PATH.exists():
-        return None
-    return DEFAULT_METADATA_PATH.stat().st_mtime
+# Dashboards poll the report endpoints, but the files only change after training.
+_report_cache = FileResponseCache()
+
+
+def _csv_report_response(request: Request, file_name: str) -> Response:
+    return _report_cache.respond(request, file_name, REPORTS_DIR / file_name, _read_csv_report)
+
+
+# Large tables are exported page by page instead of through the JSON report cache.
+TABLE_PAGE_DEFAULT_ROWS = int(os.getenv("TABLE_PAGE_DEFAULT_ROWS", "1000"))
+TABLE_PAGE_MAX_ROWS = int(os.getenv("TABLE_PAGE_MAX_ROWS", "50000"))
+_predictions_table = CsvTable(DEFAULT_PREDICTIONS_CSV)
+_train_features_table = CsvTable(DEFAULT_TRAIN_FEATURES_CSV)
+
+
+def _table_stream_response(
+    table: CsvTable,
+    row_filter: RowFilter,
+    limit: int,
+    cursor: Optional[str],
+    fmt: str,
+    missing_detail: str,
+) -> StreamingResponse:
+    if not table.exists():
+        raise HTTPException(status_code=404, detail=missing_detail)
+    try:
+        body, headers = stream_page(table, row_filter, limit=limit, cursor=cursor, fmt=fmt)
+    except CursorError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+def _validate_forecast_service(service: ForecastService) -> None:
+    # Load every horizon up front so the swapped-in service never reads model
+    # files lazily while training may be overwriting them.
+    service.preload_models()
+    provinces = service.metadata.get("provinces") or []
+    if not provinces:
+        raise ForecastError(500, "Model metadata has no provinces to smoke-test.")
+    # Bypass the materialized table so both model families really predict.
+    for model_set in ("xgboost", "baseline"):
+        service.forecast(province=provinces[0], model_set=model_set, live=True)
+
+
+_table_rebuild_lock = threading.Lock()
+_table_rebuild_thread: Optional[threading.Thread] = None
+_table_rebuild_queued: Optional[ForecastService] = None
+
+
+def _rebuild_forecast_table(service: ForecastService) -> None:
+    # A queued rebuild may have been overtaken by a swap or an earlier rebuild.
+    if _forecast_loader.current() is not service or service.materialized_table_current():
+        return
+    try:
+        materialize_forecasts(
+            metadata_path=service.metadata_path,
+            output_path=service.materialized_path,
+            service=service,
+        )
+    except Exception as exc:
+        print(f"WARNING: forecast table rebuild failed: {exc}")
+        return
+    _forecast_result_cache.clear()
+
+
+def _run_forecast_table_rebuilds(service: Optional[ForecastService]) -> None:
+    global _table_rebuild_thread, _table_rebuild_queued
+    while service is not None:
+        _rebuild_forecast_table(service)
+        with _table_rebuild_lock:
+            service, _table_rebuild_queued = _table_rebuild_queued, None
+            if service is None:
+                _table_rebuild_thread = None
+
+
+def _schedule_forecast_table_rebuild(service: ForecastService) -> None:
+    """Rebuild the forecast table in the background once the served dataset no longer matches it.
+
+    Only the service `_forecast_loader` is serving may rebuild; a request made
+    while a rebuild runs is queued and runs after it.
+    """
+    global _table_rebuild_thread, _table_rebuild_queued
+    if not FORECAST_TABLE_AUTO_REBUILD or service.materialized_path is None:
+        return
+    if _forecast_loader.current() is not service or service.materialized_table_current():
+        return
+    with _table_rebuild_lock:
+        if _table_rebuild_thread is not None:
+            _table_rebuild_queued = service
+            return
+        _table_rebuild_thread = threading.Thread(
+            target=_run_forecast_table_rebuilds, args=(service,), name="forecast-table-rebuild", daemon=True
+        )
+        _table_rebuild_thread.start()
+
+
+def _wait_for_forecast_table_rebuild() -> None:
+    with _table_rebuild_lock:
+        thread = _table_rebuild_thread
+    if thread is not None:
+        thread.join()
+
+
+def _build_forecast_service() -> ForecastService:
+    # Candidates get a private result cache so building and validating one
+    # never touches what the serving version has cached.
+    return ForecastService(
+        result_cache=TTLCache(
+            maxsize=_forecast_result_cache.maxsize,
+            ttl_seconds=_forecast_result_cache.ttl_seconds,
+        ),
+        flat_trees=FORECAST_FLAT_TREES,
+    )
+
+
+def _on_forecast_service_swap(service: ForecastService) -> None:
+    _forecast_result_cache.clear()
+    service.result_cache = _forecast_result_cache
+    service.on_dataset_change = _schedule_forecast_table_rebuild
+    # The candidate's feature index was built during validation, before it
+    # could schedule anything, so check its dataset against the table now.
+    _schedule_forecast_table_rebuild(service)
+
+
+_forecast_loader: HotSwapLoader[ForecastService] = HotSwapLoader(
+    name="forecast-service",
+    build=_build_forecast_service,
+    signature=lambda: _file_signature(DEFAULT_METADATA_PATH),
+    validate=_validate_forecast_service,
+    on_swap=_on_forecast_service_swap,
+    poll_interval=MODEL_RELOAD_INTERVAL_SECONDS,
+)
 
 
 def get_forecast_service() -> ForecastService:
-    global _forecast_service, _forecast_service_metadata_mtime
-    metadata_mtime = _get_metadata_mtime()
-    if _forecast_service is None or _forecast_service_metadata_mtime != metadata_mtime:
-        _forecast_service = ForecastService()
-        _forecast_service_metadata_mtime = metadata_mtime
-    return _forecast_service
+    return _forecast_loader.get()
 
 
-def _get_ai2_model_bundle() -> dict:
-    global _ai2_bundle, _ai2_bundle_mtime
+def _forecast_flight_key(province: str, as_of: Optional[str], model_set: str) -> tuple:
+    return ("ai1", normalize_province_name(province or ""), as_of or "", (model_set or "champion").strip().lower())
 
+
+def _forecast_coalesced(province: str, as_of: Optional[str], model_set: str) -> ForecastResult:
+    """Forecast from a threadpool handler, sharing the result with identical in-flight calls."""
+    return _single_flight.do(
+        _forecast_flight_key(province, as_of, model_set),
+        lambda: get_forecast_service().forecast(province=province, as_of=as_of, model_set=model_set),
+    )
+
+
+async def _forecast_coalesced_async(province: str, as_of: Optional[str], model_set: str) -> ForecastResult:
+    return await _single_flight.do_async(
+        _forecast_flight_key(province, as_of, model_set),
+        lambda: run_in_threadpool(
+            lambda: get_forecast_service().forecast(province=province, as_of=as_of, model_set=model_set)
+        ),
+    )
+
+
+def _ai2_artifact_signature() -> tuple:
+    return (
+        _file_signature(AI2_METADATA_PATH),
+        _file_signature(AI2_MAIN_PATH),
+        _file_signature(AI2_BASELINE_PATH),
+    )
+
+
+def _load_ai2_model_bundle() -> dict:
     if not AI2_METADATA_PATH.exists() or not AI2_MAIN_PATH.exists():
         raise HTTPException(status_code=404, detail="AI2 model artifacts not found. Train AI2 first.")
 
-    baseline_mtime = AI2_BASELINE_PATH.stat().st_mtime if AI2_BASELINE_PATH.exists() else 0.0
-    current_mtime = (
-        AI2_METADATA_PATH.stat().st_mtime,
-        AI2_MAIN_PATH.stat().st_mtime,
-        baseline_mtime,
-    )
-    if _ai2_bundle is not None and _ai2_bundle_mtime == current_mtime:
-        return _ai2_bundle
+    import joblib
 
     metadata = json.loads(AI2_METADATA_PATH.read_text(encoding="utf-8"))
     main_model = joblib.load(AI2_MAIN_PATH)
     baseline_model = joblib.load(AI2_BASELINE_PATH) if AI2_BASELINE_PATH.exists() else None
 
-    _ai2_bundle = {
+    return {
         "metadata": metadata,
         "main_model": main_model,
         "baseline_model": baseline_model,
     }
-    _ai2_bundle_mtime = current_mtime
-    return _ai2_bundle
 
 
-def _build_ai2_feature_row(
-    readings_df: pd.DataFrame,
-    feature_columns: list[str],
-    province: Optional[str],
-) -> tuple[pd.DataFrame, dict]:
-    if readings_df.empty:
-        raise HTTPException(status_code=422, detail="No sensor readings for this farm.")
-
-    readings_df = readings_df.copy()
-    readings_df["timestamp"] = pd.to_datetime(readings_df["timestamp"], errors="coerce")
-    readings_df["salinity"] = pd.to_numeric(readings_df["salinity"], errors="coerce")
-    readings_df["temperature"] = pd.to_numeric(readings_df["temperature"], errors="coerce")
-    readings_df["ph"] = pd.to_numeric(readings_df["ph"], errors="coerce")
-    readings_df = readings_df.dropna(subset=["timestamp", "salinity", "temperature"])
-    if readings_df.empty:
-        raise HTTPException(status_code=422, detail="Sensor readings invalid for AI2 inference.")
-
-    readings_df = readings_df.sort_values("timestamp")
-    latest = readings_df.iloc[-1]
-
-    sal = readings_df["salinity"].to_numpy(dtype=float)
-    temp = readings_df["temperature"].to_numpy(dtype=float)
-    ph_series = readings_df["ph"].dropna()
-
-    sal_t_1 = float(sal[-2]) if len(sal) >= 2 else float(sal[-1])
-    sal_t_3 = float(sal[-4]) if len(sal) >= 4 else sal_t_1
-    sal_t_7 = float(sal[-8]) if len(sal) >= 8 else sal_t_3
-    sal_3d_avg = float(np.mean(sal[-3:]))
-    sal_7d_avg = float(np.mean(sal[-7:]))
-    temp_7d_avg = float(np.mean(temp[-7:]))
-    sal_change_1d = float(sal[-1] - sal_t_1)
-    sal_change_3d = float(sal[-1] - sal_t_3)
-    ts = latest["timestamp"]
-    month = int(ts.month)
-    day_of_year = int(ts.dayofyear)
-    is_dry = 1 if month in (12, 1, 2, 3, 4) else 0
-
-    ph_value = float(ph_series.iloc[-1]) if not ph_series.empty else 7.4
-    base_values = {
-        "salinity": float(sal[-1]),
-        "temperature": float(temp[-1]),
-        "ph": ph_value,
-        "sal_t-1": sal_t_1,
-        "sal_t-3": sal_t_3,
-        "sal_t-7": sal_t_7,
-        "sal_3d_avg": sal_3d_avg,
-        "sal_7d_avg": sal_7d_avg,
-        "temp_7d_avg": temp_7d_avg,
-        "sal_change_1d": sal_change_1d,
-        "sal_change_3d": sal_change_3d,
-        "month": float(month),
-        "day_of_year": float(day_of_year),
-        "is_dry_season": float(is_dry),
-    }
+def _validate_ai2_model_bundle(bundle: dict) -> None:
+    feature_columns = bundle["metadata"].get("feature_columns", [])
+    if not feature_columns:
+        raise HTTPException(status_code=500, detail="AI2 metadata missing feature_columns.")
+    smoke_row = pd.DataFrame([{feature: 0.0 for feature in feature_columns}], columns=feature_columns)
+    bundle["main_model"].predict(smoke_row)
 
-    row = {feature: 0.0 for feature in feature_columns}
-    for key, value in base_values.items():
-        if key in row:
-            row[key] = float(value)
-
-    province_key = (province or "").strip().lower()
-    if province_key:
-        dummy_col = f"province_{province_key}"
-        if dummy_col in row:
-            row[dummy_col] = 1.0
-
-    diagnostics = {
-        "latest_timestamp": str(ts),
-        "latest_salinity": float(sal[-1]),
-        "latest_temperature": float(temp[-1]),
-        "latest_ph": ph_value,
-        "history_points": int(len(readings_df)),
-        "province": province or "",
-    }
-    return pd.DataFrame([row], columns=feature_columns), diagnostics
+
+_ai2_loader: HotSwapLoader[dict] = HotSwapLoader(
+    name="ai2-risk-model",
+    build=_load_ai2_model_bundle,
+    signature=_ai2_artifact_signature,
+    validate=_validate_ai2_model_bundle,
+    poll_interval=MODEL_RELOAD_INTERVAL_SECONDS,
+)
+
+
+def _get_ai2_model_bundle() -> dict:
+    return _ai2_loader.get()
 
 
 def _infer_province_from_farm(farm: dict) -> Optional[str]:
@@ -351,56 +533,177 @@ def _infer_province_from_farm(farm: dict) -> Optional[str]:
     return FARM_CODE_PROVINCE.get(prefix)
 
 
-def _load_farm_readings_df(client: Client, farm_id: str) -> pd.DataFrame:
-    devices_res = client.table("iot_devices").select("id").eq("farm_id", farm_id).execute()
-    device_rows = devices_res.data or []
-    device_ids = [str(item["id"]) for item in device_rows if item.get("id")]
+farm_contexts: Optional[FarmContextCache] = (
+    FarmContextCache(
+        data_access,
+        _infer_province_from_farm,
+        ttl_seconds=float(os.environ.get("FARM_CONTEXT_TTL_SECONDS", "300")),
+        single_flight=_single_flight,
+    )
+    if data_access is not None
+    else None
+)
+
+
+async def _require_farm_context(farm_id: str) -> FarmContext:
+    if farm_contexts is None:
+        raise HTTPException(status_code=500, detail="Supabase is not configured.")
+    context = await farm_contexts.get(farm_id)
+    if context is None:
+        raise HTTPException(status_code=404, detail="Farm not found.")
+    return context
+
+
+async def _load_farm_readings_df(data: FarmDataAccess, device_ids: list[str]) -> pd.DataFrame:
     if not device_ids:
         raise HTTPException(status_code=422, detail="No IoT devices attached to this farm.")
 
-    readings_res = (
-        client.table("sensor_readings")
-        .select("device_id,salinity,ph,temperature,timestamp")
-        .in_("device_id", device_ids)
-        .order("timestamp", desc=False)
-        .limit(2000)
-        .execute()
-    )
-    readings_df = pd.DataFrame(readings_res.data or [])
+    cold = reading_state.cold_devices(device_ids)
+    if cold:
+        # The newest `capacity` rows of each cold device, however often the
+        # others report. Devices that returned nothing stay cold.
+        readings = await data.list_recent_readings_for_devices(
+            cold, columns=READING_COLUMNS, per_device=reading_state.capacity
+        )
+        reading_state.seed(sorted({str(row["device_id"]) for row in readings}), readings)
+    readings_df = reading_state.frame(device_ids)
     if readings_df.empty:
         raise HTTPException(status_code=422, detail="No sensor readings available for this farm.")
     return readings_df
 
 
-def _predict_ai2_for_farm(client: Client, farm_id: str, farm: dict) -> dict:
-    bundle = _get_ai2_model_bundle()
+async def _fetch_ai2_inputs(data: FarmDataAccess, device_ids: list[str]) -> tuple[dict, pd.DataFrame]:
+    bundle = await run_in_threadpool(_get_ai2_model_bundle)
+    if not bundle["metadata"].get("feature_columns", []):
+        raise HTTPException(status_code=500, detail="AI2 metadata missing feature_columns.")
+    readings_df = await _load_farm_readings_df(data, device_ids)
+    return bundle, readings_df
+
+
+async def _load_ai2_inputs(data: FarmDataAccess, context: FarmContext) -> tuple[dict, pd.DataFrame]:
+    # Concurrent requests for the same farm share one readings fetch;
+    # scoring the shared frame is cheap and stays per request.
+    return await _single_flight.do_async(
+        ("ai2", context.farm_id),
+        lambda: _fetch_ai2_inputs(data, context.device_ids),
+    )
+
+
+async def _predict_ai2_for_farm(data: FarmDataAccess, context: FarmContext) -> dict:
+    bundle, readings_df = await _load_ai2_inputs(data, context)
+    return await run_in_threadpool(_score_ai2_for_farm, bundle, context.farm_id, context.province, readings_df)
+
+
+async def _forecast_champion(province: str, as_of: str) -> ForecastResult:
+    return await _forecast_coalesced_async(province, as_of, "champion")
+
+
+def _score_ai2_for_farm(
+    bundle: dict,
+    farm_id: str,
+    province: Optional[str],
+    readings_df: pd.DataFrame,
+) -> dict:
+    outcome = _score_ai2_batch(bundle, readings_df.assign(farm_id=farm_id), {farm_id: province})[farm_id]
+    if isinstance(outcome, HTTPException):
+        raise outcome
+    return outcome
+
+
+def _score_ai2_batch(
+    bundle: dict,
+    readings_df: pd.DataFrame,
+    provinces: dict[str, Optional[str]],
+) -> dict[str, Union[dict, HTTPException]]:
+    """Score every farm in long-format readings with one predict_proba call; failures are returned per farm."""
     metadata = bundle["metadata"]
-    feature_columns = metadata.get("feature_columns", [])
     labels = metadata.get("labels", ["Low", "Medium", "High"])
-    if not feature_columns:
-        raise HTTPException(status_code=500, detail="AI2 metadata missing feature_columns.")
+    with stage("ai2_features"):
+        batch = build_ai2_features(readings_df, metadata.get("feature_columns", []), provinces)
 
-    province = _infer_province_from_farm(farm)
-    readings_df = _load_farm_readings_df(client, farm_id)
-    feature_row, diagnostics = _build_ai2_feature_row(readings_df, feature_columns, province)
+    outcomes: dict[str, Union[dict, HTTPException]] = {
+        farm_id: HTTPException(status_code=422, detail=message) for farm_id, message in batch.errors.items()
+    }
+    if not batch.keys:
+        return outcomes
+
+    with stage("ai2_predict"):
+        class_values, scores = predict_risk(bundle["main_model"], batch.features)
+    for position, farm_id in enumerate(batch.keys):
+        predicted_idx = int(class_values[position])
+        predicted_label = labels[predicted_idx] if 0 <= predicted_idx < len(labels) else str(predicted_idx)
+        outcomes[farm_id] = {
+            "farm_id": farm_id,
+            "risk_label": predicted_label,
+            "risk_score": float(scores[position]) if scores is not None else None,
+            "model_version": metadata.get("model_version", "unknown"),
+            "labels": labels,
+            "diagnostics": batch.diagnostics[position],
+        }
+    return outcomes
+
+
+def _season_stage(farm: dict, season: Optional[dict], dt_now: datetime) -> tuple[str, str, int]:
+    """Return (crop_mode, stage, season_age_days) for the farm's active season."""
+    season = season or {}
+    crop_mode = season.get("season_type")
+    if crop_mode not in {"rice", "shrimp"}:
+        crop_mode = "shrimp" if farm.get("farm_type") == "shrimp_only" else "rice"
 
-    model = bundle["main_model"]
-    y_pred = model.predict(feature_row)
-    predicted_idx = int(y_pred[0]) if hasattr(y_pred[0], "__int__") else int(float(y_pred[0]))
-    predicted_label = labels[predicted_idx] if 0 <= predicted_idx < len(labels) else str(predicted_idx)
+    start_date_raw = season.get("start_date")
+    if start_date_raw:
+        start_date = datetime.fromisoformat(str(start_date_raw).split("T")[0])
+    else:
+        start_date = dt_now - timedelta(days=45)
+    season_age_days = max(0, (dt_now.date() - start_date.date()).days)
+    if season_age_days <= 30:
+        stage = "early"
+    elif season_age_days <= 70:
+        stage = "mid"
+    else:
+        stage = "late"
+    return crop_mode, stage, season_age_days
 
-    risk_score = None
-    if hasattr(model, "predict_proba"):
-        probs = model.predict_proba(feature_row)
-        risk_score = float(np.max(probs[0])) if len(probs) > 0 else None
 
+def _decision_payload(
+    farm: dict,
+    province: str,
+    season: Optional[dict],
+    forecast_result: ForecastResult,
+    ai2: dict,
+    dt_now: datetime,
+) -> dict:
+    crop_mode, stage, season_age_days = _season_stage(farm, season, dt_now)
+    forecast_points = [ForecastPointResponse(**point.__dict__) for point in forecast_result.forecast]
+    decision = _build_ai3_decision(
+        crop_mode=crop_mode,
+        stage=stage,
+        forecast_points=forecast_points,
+        risk_label=str(ai2.get("risk_label", "Medium")),
+        risk_score=ai2.get("risk_score"),
+        current_date=dt_now,
+    )
     return {
-        "farm_id": farm_id,
-        "risk_label": predicted_label,
-        "risk_score": risk_score,
-        "model_version": metadata.get("model_version", "unknown"),
-        "labels": labels,
-        "diagnostics": diagnostics,
+        "farm_id": str(farm.get("id")),
+        "province": province,
+        "crop_mode": crop_mode,
+        "season_stage": stage,
+        "season_age_days": season_age_days,
+        "decision": decision["decision"],
+        "urgency": decision["urgency"],
+        "reason": decision["reason"],
+        "actions": decision["actions"],
+        "signals": decision["signals"],
+        "ai1": {
+            "as_of": forecast_result.as_of,
+            "model_version": forecast_result.model_version,
+            "model_set_used": forecast_result.model_set_used,
+        },
+        "ai2": {
+            "risk_label": ai2.get("risk_label"),
+            "risk_score": ai2.get("risk_score"),
+            "model_version": ai2.get("model_version"),
+        },
     }
 
 
@@ -515,6 +818,11 @@ def health_check():
     return {"status": "ok", "service": "ai-service"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/ai/reports/charts")
 def list_report_charts(request: Request):
     charts = sorted(path.name for path in CHARTS_DIR.glob("*.png"))
@@ -529,46 +837,91 @@ def list_report_charts(request: Request):
 
 
 @app.get("/api/ai/reports/metrics")
-def get_report_metrics():
-    return {"success": True, "data": _read_csv_report("metrics_summary.csv")}
+def get_report_metrics(request: Request):
+    return _csv_report_response(request, "metrics_summary.csv")
 
 
 @app.get("/api/ai/reports/backtest-metrics")
-def get_backtest_metrics():
-    return {"success": True, "data": _read_csv_report("backtest_metrics_summary.csv")}
+def get_backtest_metrics(request: Request):
+    return _csv_report_response(request, "backtest_metrics_summary.csv")
 
 
 @app.get("/api/ai/reports/lstm-metrics")
-def get_lstm_metrics():
-    return {"success": True, "data": _read_csv_report("lstm_pilot_metrics.csv")}
+def get_lstm_metrics(request: Request):
+    return _csv_report_response(request, "lstm_pilot_metrics.csv")
 
 
 @app.get("/api/ai/reports/regression-check")
-def get_regression_check():
-    return {"success": True, "data": _read_csv_report("regression_check.csv")}
+def get_regression_check(request: Request):
+    return _csv_report_response(request, "regression_check.csv")
 
 
 @app.get("/api/ai/reports/threshold-accuracy")
-def get_threshold_accuracy():
-    return {"success": True, "data": _read_csv_report("threshold_accuracy_summary.csv")}
+def get_threshold_accuracy(request: Request):
+    return _csv_report_response(request, "threshold_accuracy_summary.csv")
 
 
 @app.get("/api/ai/reports/acceptance-summary")
-def get_acceptance_summary():
-    return {"success": True, "data": _read_csv_report("acceptance_summary.csv")}
+def get_acceptance_summary(request: Request):
+    return _csv_report_response(request, "acceptance_summary.csv")
 
 
 @app.get("/api/ai/model/metadata")
-def get_model_metadata():
-    return {"success": True, "data": _read_model_metadata()}
+def get_model_metadata(request: Request):
+    return _report_cache.respond(request, "model-metadata", DEFAULT_METADATA_PATH, _read_model_metadata)
+
+
+@app.get("/api/ai/reports/cache/stats")
+def get_report_cache_stats():
+    return {"success": True, "data": _report_cache.stats()}
+
+
+@app.get("/api/ai/reports/predictions/stream")
+def stream_test_predictions(
+    province: Optional[str] = Query(default=None),
+    horizon: Optional[int] = Query(default=None, ge=1, le=7),
+    model: Optional[str] = Query(default=None),
+    date_from: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    limit: int = Query(default=TABLE_PAGE_DEFAULT_ROWS, ge=1, le=TABLE_PAGE_MAX_ROWS),
+    cursor: Optional[str] = Query(default=None),
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+):
+    equals = []
+    if province:
+        equals.append(("province", normalize_province_name(province)))
+    if horizon is not None:
+        equals.append(("horizon", str(horizon)))
+    if model:
+        equals.append(("model", model.strip()))
+    row_filter = RowFilter(equals=tuple(equals), date_from=date_from, date_to=date_to)
+    return _table_stream_response(
+        _predictions_table, row_filter, limit, cursor, format, "Test predictions not found. Train AI1 first."
+    )
+
+
+@app.get("/api/ai/data/train-features/stream")
+def stream_train_features(
+    province: Optional[str] = Query(default=None),
+    date_from: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    limit: int = Query(default=TABLE_PAGE_DEFAULT_ROWS, ge=1, le=TABLE_PAGE_MAX_ROWS),
+    cursor: Optional[str] = Query(default=None),
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+):
+    equals = (("province", normalize_province_name(province)),) if province else ()
+    row_filter = RowFilter(equals=equals, date_from=date_from, date_to=date_to)
+    return _table_stream_response(
+        _train_features_table, row_filter, limit, cursor, format, "Training feature dataset not found. Train AI1 first."
+    )
 
 
 @app.post("/api/ai/model/reload")
 def reload_model_cache():
-    global _forecast_service, _forecast_service_metadata_mtime
-    _forecast_service = None
-    _forecast_service_metadata_mtime = None
-    service = get_forecast_service()
+    try:
+        service = _forecast_loader.reload()
+    except ForecastError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.message)
     return {
         "success": True,
         "message": "Forecast model cache reloaded.",
@@ -576,6 +929,64 @@ def reload_model_cache():
     }
 
 
+@app.get("/api/ai/model/reload/status")
+def get_model_reload_status():
+    return {"success": True, "data": [_forecast_loader.status(), _ai2_loader.status()]}
+
+
+@app.get("/api/ai/forecast7d/cache")
+def get_forecast_cache_stats():
+    return {"success": True, "data": _forecast_result_cache.stats()}
+
+
+@app.post("/api/ai/farm-context/invalidate")
+def invalidate_farm_context(request: FarmContextInvalidateRequest):
+    if farm_contexts is None:
+        raise HTTPException(status_code=500, detail="Supabase is not configured.")
+    invalidated = farm_contexts.invalidate(request.farm_ids)
+    # Chat snapshots are derived from the farm context, so drop them too.
+    if request.farm_ids is None:
+        _chat_context_cache.clear()
+    else:
+        for farm_id in request.farm_ids:
+            _chat_context_cache.pop(farm_id)
+    return {"success": True, "invalidated": invalidated}
+
+
+@app.get("/api/ai/farm-context/stats")
+def get_farm_context_stats():
+    if farm_contexts is None:
+        raise HTTPException(status_code=500, detail="Supabase is not configured.")
+    return {"success": True, "data": farm_contexts.stats()}
+
+
+@app.post("/api/ai/readings/ingest")
+def ingest_sensor_readings(request: ReadingIngestRequest):
+    """Push new readings into the AI2 reading state of this process.
+
+    Readings written straight to Supabase are not seen by a device whose
+    buffer is warm; they reach AI2 once the buffer is older than
+    READING_STATE_MAX_AGE_SECONDS (60 s by default) and is re-read.
+    """
+    if len(request.readings) > READING_INGEST_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {READING_INGEST_MAX_ITEMS} readings are allowed per request.",
+        )
+    accepted = reading_state.ingest(reading.model_dump() for reading in request.readings)
+    return {"success": True, "accepted": accepted, "rejected": len(request.readings) - accepted}
+
+
+@app.get("/api/ai/readings/state/stats")
+def get_reading_state_stats():
+    return {"success": True, "data": reading_state.stats()}
+
+
+@app.get("/api/ai/coalescing/stats")
+def get_coalescing_stats(top: int = Query(20, ge=1, le=256)):
+    return {"success": True, "data": _single_flight.stats(top=top)}
+
+
 @app.get("/api/ai/forecast7d", response_model=Forecast7DResponse)
 def forecast_7d(
     province: str = Query(..., description="Province name"),
@@ -583,11 +994,7 @@ def forecast_7d(
     model_set: str = Query("champion", description="champion|baseline|xgboost"),
 ):
     try:
-        result: ForecastResult = get_forecast_service().forecast(
-            province=province,
-            as_of=as_of,
-            model_set=model_set,
-        )
+        result: ForecastResult = _forecast_coalesced(province, as_of, model_set)
         return Forecast7DResponse(
             province=result.province,
             as_of=result.as_of,
@@ -601,32 +1008,117 @@ def forecast_7d(
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+@app.post("/api/ai/forecast7d/batch")
+async def forecast_7d_batch(request: Forecast7DBatchRequest):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items must not be empty.")
+    if len(request.items) > FORECAST_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {FORECAST_BATCH_MAX_ITEMS} items are allowed per batch.",
+        )
+
+    # A failed farm lookup only fails the farm items; province items never need Supabase.
+    farm_ids = sorted({item.farm_id for item in request.items if item.farm_id and not item.province})
+    farm_provinces: dict[str, Optional[str]] = {}
+    farm_lookup_error: Optional[dict] = None
+    if farm_ids:
+        try:
+            farms = await _require_data_access().get_farms(farm_ids, columns="id,address,farm_code")
+        except HTTPException as exc:
+            farm_lookup_error = {"status_code": exc.status_code, "detail": exc.detail}
+        except Exception as exc:
+            farm_lookup_error = {"status_code": 502, "detail": f"Farm lookup failed: {exc}"}
+        else:
+            for farm in farms:
+                farm_provinces[str(farm.get("id"))] = _infer_province_from_farm(farm)
+
+    try:
+        pairs: list[tuple[str, Optional[str]]] = []
+        for item in request.items:
+            province = item.province or (farm_provinces.get(item.farm_id) if item.farm_id else None)
+            pairs.append((province or "", item.as_of))
+
+        service = await run_in_threadpool(get_forecast_service)
+        outcomes = await run_in_threadpool(service.forecast_many, pairs, request.model_set)
+    except HTTPException:
+        raise
+    except ForecastError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.message) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    data = []
+    for item, outcome in zip(request.items, outcomes):
+        entry = {"province": item.province, "farm_id": item.farm_id, "as_of": item.as_of}
+        if isinstance(outcome, ForecastError):
+            if item.farm_id and not item.province and farm_lookup_error is not None:
+                entry["error"] = farm_lookup_error
+            elif item.farm_id and not item.province and not farm_provinces.get(item.farm_id):
+                entry["error"] = {"status_code": 422, "detail": "Cannot infer province from farm."}
+            else:
+                entry["error"] = {"status_code": outcome.status_code, "detail": outcome.message}
+        else:
+            entry.update(
+                {
+                    "province": outcome.province,
+                    "as_of": outcome.as_of,
+                    "model_version": outcome.model_version,
+                    "model_set_used": outcome.model_set_used,
+                    "forecast": [dict(point.__dict__) for point in outcome.forecast],
+                }
+            )
+        data.append(entry)
+    return {"success": True, "data": data}
+
+
+@app.get("/api/ai/forecast7d/range")
+def forecast_7d_range(
+    province: str = Query(..., description="Province name"),
+    start: str = Query(..., description="First as_of date YYYY-MM-DD"),
+    end: Optional[str] = Query(None, description="Last as_of date YYYY-MM-DD (default today)"),
+    model_set: str = Query("champion", description="champion|baseline|xgboost"),
+):
+    try:
+        start_date = pd.to_datetime(start).normalize()
+        end_date = pd.to_datetime(end).normalize() if end else pd.Timestamp(service_today())
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="start/end must be YYYY-MM-DD.") from exc
+    if (end_date - start_date).days + 1 > FORECAST_RANGE_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {FORECAST_RANGE_MAX_DAYS} as_of days are allowed per request.",
+        )
+
+    try:
+        frame = get_forecast_service().forecast_range(
+            province=province,
+            start=start,
+            end=end,
+            model_set=model_set,
+        )
+    except ForecastError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.message) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    for column in ("as_of", "feature_date", "target_date"):
+        frame[column] = frame[column].dt.strftime("%Y-%m-%d")
+    return {"success": True, "data": frame.to_dict(orient="records")}
+
+
 @app.get("/api/ai/forecast7d/farm/{farm_id}", response_model=Forecast7DResponse)
-def forecast_7d_by_farm(
+async def forecast_7d_by_farm(
     farm_id: str,
     as_of: Optional[str] = Query(None, description="Optional date YYYY-MM-DD"),
     model_set: str = Query("champion", description="champion|baseline|xgboost"),
 ):
-    client = _require_supabase()
     try:
-        farm_res = client.table("farms").select("address,farm_code").eq("id", farm_id).single().execute()
-        farm = farm_res.data
-        if not farm:
-            raise HTTPException(status_code=404, detail="Farm not found.")
-
-        province = parse_province_from_address(farm.get("address", ""))
-        if not province:
-            farm_code = str(farm.get("farm_code", "")).upper()
-            prefix = farm_code.split("_")[0]
-            province = FARM_CODE_PROVINCE.get(prefix)
+        province = (await _require_farm_context(farm_id)).province
         if not province:
             raise HTTPException(status_code=422, detail="Cannot infer province from farm.")
 
-        result: ForecastResult = get_forecast_service().forecast(
-            province=province,
-            as_of=as_of,
-            model_set=model_set,
-        )
+        result: ForecastResult = await _forecast_coalesced_async(province, as_of, model_set)
         return Forecast7DResponse(
             province=result.province,
             as_of=result.as_of,
@@ -643,17 +1135,13 @@ def forecast_7d_by_farm(
 
 
 @app.get("/api/ai/risk/farm/{farm_id}")
-def predict_ai2_risk_by_farm(farm_id: str):
-    client = _require_supabase()
+async def predict_ai2_risk_by_farm(farm_id: str):
+    data = _require_data_access()
     try:
-        farm_res = client.table("farms").select("id,address,farm_code").eq("id", farm_id).single().execute()
-        farm = farm_res.data
-        if not farm:
-            raise HTTPException(status_code=404, detail="Farm not found.")
-
+        context = await _require_farm_context(farm_id)
         return {
             "success": True,
-            "data": _predict_ai2_for_farm(client, farm_id, farm),
+            "data": await _predict_ai2_for_farm(data, context),
         }
     except HTTPException:
         raise
@@ -662,93 +1150,31 @@ def predict_ai2_risk_by_farm(farm_id: str):
 
 
 @app.get("/api/ai/decision/farm/{farm_id}")
-def get_ai3_decision_by_farm(
+async def get_ai3_decision_by_farm(
     farm_id: str,
     current_date: Optional[str] = Query(None, description="Optional date YYYY-MM-DD"),
 ):
-    client = _require_supabase()
+    data = _require_data_access()
     try:
-        farm_res = client.table("farms").select("id,farm_type,address,farm_code").eq("id", farm_id).single().execute()
-        farm = farm_res.data
-        if not farm:
-            raise HTTPException(status_code=404, detail="Farm not found.")
+        dt_now = datetime.strptime(current_date, "%Y-%m-%d") if current_date else datetime.now()
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="current_date must be YYYY-MM-DD.") from exc
 
-        province = _infer_province_from_farm(farm)
+    try:
+        context = await _require_farm_context(farm_id)
+        farm = context.farm
+        province = context.province
         if not province:
             raise HTTPException(status_code=422, detail="Cannot infer province from farm.")
 
-        try:
-            dt_now = datetime.strptime(current_date, "%Y-%m-%d") if current_date else datetime.now()
-        except ValueError as exc:
-            raise HTTPException(status_code=422, detail="current_date must be YYYY-MM-DD.") from exc
-
-        season_res = (
-            client.table("seasons")
-            .select("season_type,start_date,variety,status")
-            .eq("farm_id", farm_id)
-            .eq("status", "active")
-            .maybe_single()
-            .execute()
-        )
-        season = season_res.data or {}
-        crop_mode = season.get("season_type")
-        if crop_mode not in {"rice", "shrimp"}:
-            crop_mode = "shrimp" if farm.get("farm_type") == "shrimp_only" else "rice"
-
-        start_date_raw = season.get("start_date")
-        if start_date_raw:
-            start_date = datetime.fromisoformat(str(start_date_raw).split("T")[0])
-        else:
-            start_date = dt_now - timedelta(days=45)
-        season_age_days = max(0, (dt_now.date() - start_date.date()).days)
-        if season_age_days <= 30:
-            stage = "early"
-        elif season_age_days <= 70:
-            stage = "mid"
-        else:
-            stage = "late"
-
-        forecast_result = get_forecast_service().forecast(
-            province=province,
-            as_of=dt_now.strftime("%Y-%m-%d"),
-            model_set="champion",
+        # The forecast is CPU-bound and the AI2 readings fetch is I/O-bound; run them together.
+        forecast_result, ai2 = await asyncio.gather(
+            _forecast_champion(province, dt_now.strftime("%Y-%m-%d")),
+            _predict_ai2_for_farm(data, context),
         )
-        forecast_points = [ForecastPointResponse(**point.__dict__) for point in forecast_result.forecast]
-
-        ai2 = _predict_ai2_for_farm(client, farm_id, farm)
-        decision = _build_ai3_decision(
-            crop_mode=crop_mode,
-            stage=stage,
-            forecast_points=forecast_points,
-            risk_label=str(ai2.get("risk_label", "Medium")),
-            risk_score=ai2.get("risk_score"),
-            current_date=dt_now,
-        )
-
         return {
             "success": True,
-            "data": {
-                "farm_id": farm_id,
-                "province": province,
-                "crop_mode": crop_mode,
-                "season_stage": stage,
-                "season_age_days": season_age_days,
-                "decision": decision["decision"],
-                "urgency": decision["urgency"],
-                "reason": decision["reason"],
-                "actions": decision["actions"],
-                "signals": decision["signals"],
-                "ai1": {
-                    "as_of": forecast_result.as_of,
-                    "model_version": forecast_result.model_version,
-                    "model_set_used": forecast_result.model_set_used,
-                },
-                "ai2": {
-                    "risk_label": ai2.get("risk_label"),
-                    "risk_score": ai2.get("risk_score"),
-                    "model_version": ai2.get("model_version"),
-                },
-            },
+            "data": _decision_payload(farm, province, context.active_season, forecast_result, ai2, dt_now),
         }
     except HTTPException:
         raise
@@ -758,76 +1184,347 @@ def get_ai3_decision_by_farm(
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+@app.post("/api/ai/decision/batch")
+async def get_ai3_decisions_batch(request: DecisionBatchRequest):
+    selectors = [bool(request.farm_ids), bool(request.user_id), bool(request.province)]
+    if sum(selectors) != 1:
+        raise HTTPException(status_code=400, detail="Provide exactly one of farm_ids, user_id or province.")
+    if request.farm_ids and len(request.farm_ids) > DECISION_BATCH_MAX_FARMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {DECISION_BATCH_MAX_FARMS} farms are allowed per batch.",
+        )
+    try:
+        dt_now = datetime.strptime(request.current_date, "%Y-%m-%d") if request.current_date else datetime.now()
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="current_date must be YYYY-MM-DD.") from exc
+
+    data = _require_data_access()
+    try:
+        if request.farm_ids:
+            farms = await data.get_farms(request.farm_ids, columns=FARM_COLUMNS)
+        else:
+            farms = await data.list_farms(user_id=request.user_id, columns=FARM_COLUMNS)
+            if len(farms) >= MAX_LIST_ROWS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Selection reaches the {MAX_LIST_ROWS}-farm listing cap; pass farm_ids or user_id.",
+                )
+        farm_provinces = {str(farm["id"]): _infer_province_from_farm(farm) for farm in farms}
+        if request.province:
+            wanted = normalize_province_name(request.province)
+            farms = [farm for farm in farms if farm_provinces[str(farm["id"])] == wanted]
+        if len(farms) > DECISION_BATCH_MAX_FARMS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Selection matches {len(farms)} farms; at most {DECISION_BATCH_MAX_FARMS} are allowed.",
+            )
+        farm_ids = [str(farm["id"]) for farm in farms]
+
+        # One forecast per province runs in the threadpool while the bulk
+        # device, season and readings queries are in flight.
+        as_of = dt_now.strftime("%Y-%m-%d")
+        provinces = sorted({farm_provinces[farm_id] for farm_id in farm_ids if farm_provinces[farm_id]})
+        forecasts_task = asyncio.ensure_future(
+            run_in_threadpool(
+                lambda: get_forecast_service().forecast_many([(province, as_of) for province in provinces])
+            )
+        )
+        bundle_task = asyncio.ensure_future(run_in_threadpool(_get_ai2_model_bundle))
+        try:
+            device_rows, season_rows = await asyncio.gather(
+                data.list_devices_for_farms(farm_ids),
+                data.list_active_seasons(farm_ids, columns=f"farm_id,{SEASON_COLUMNS}"),
+            )
+            device_farm = {str(row["id"]): str(row["farm_id"]) for row in device_rows}
+            since = datetime.now(timezone.utc) - timedelta(days=AI2_BATCH_LOOKBACK_DAYS)
+            cold = reading_state.cold_devices(list(device_farm))
+            if cold:
+                # Only the newest `capacity` rows per device fit in the state anyway.
+                readings = await data.list_recent_readings_for_devices(
+                    cold, since=since.isoformat(), columns=READING_COLUMNS, per_device=reading_state.capacity
+                )
+                # Devices without rows in the window stay cold so the
+                # single-farm path still looks further back for them.
+                reading_state.seed(sorted({str(row["device_id"]) for row in readings}), readings)
+            bundle = await bundle_task
+            forecast_outcomes = await forecasts_task
+        finally:
+            for task in (forecasts_task, bundle_task):
+                if not task.done():
+                    task.cancel()
+
+        readings_df = reading_state.frame(list(device_farm))
+        if not readings_df.empty:
+            readings_df = readings_df[readings_df["timestamp"] >= pd.Timestamp(since)]
+            readings_df = readings_df.assign(farm_id=readings_df["device_id"].map(device_farm))
+        farms_with_readings = set(readings_df["farm_id"]) if not readings_df.empty else set()
+
+        errors: dict[str, HTTPException] = {}
+        farms_with_devices = set(device_farm.values())
+        for farm_id in farm_ids:
+            if farm_id not in farms_with_devices:
+                errors[farm_id] = HTTPException(status_code=422, detail="No IoT devices attached to this farm.")
+            elif farm_id not in farms_with_readings:
+                errors[farm_id] = HTTPException(
+                    status_code=422, detail="No sensor readings available for this farm."
+                )
+        ai2_outcomes = (
+            await run_in_threadpool(_score_ai2_batch, bundle, readings_df, farm_provinces)
+            if farms_with_readings
+            else {}
+        )
+    except HTTPException:
+        raise
+    except ForecastError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.message) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    forecasts = dict(zip(provinces, forecast_outcomes))
+    seasons = {str(row["farm_id"]): row for row in season_rows}
+    results = []
+    for farm in farms:
+        farm_id = str(farm["id"])
+        province = farm_provinces[farm_id]
+        forecast_result = forecasts.get(province) if province else None
+        ai2 = ai2_outcomes.get(farm_id, errors.get(farm_id))
+        if not province:
+            error = HTTPException(status_code=422, detail="Cannot infer province from farm.")
+        elif isinstance(forecast_result, ForecastError):
+            error = HTTPException(status_code=forecast_result.status_code, detail=forecast_result.message)
+        elif isinstance(ai2, HTTPException):
+            error = ai2
+        else:
+            results.append(_decision_payload(farm, province, seasons.get(farm_id), forecast_result, ai2, dt_now))
+            continue
+        results.append({"farm_id": farm_id, "error": {"status_code": error.status_code, "detail": error.detail}})
+
+    return {
+        "success": True,
+        "data": results,
+        "meta": {"farm_count": len(farms), "province_count": len(provinces), "as_of": as_of},
+    }
+
+
+def _analysis_job_key(payload: dict) -> str:
+    # The farm id leads so one farm's jobs can be listed by key prefix.
+    return f"{payload['farm_id']}:{json.dumps(payload, sort_keys=True, separators=(',', ':'))}"
+
+
 @app.post("/api/ai/analyze")
 async def analyze_farm(request: AnalysisRequest):
     if not request.farm_id or not request.analysis_type:
         raise HTTPException(status_code=400, detail="farm_id and analysis_type are required.")
-    # Queue background flow and return immediately to keep UI responsive.
-    asyncio.create_task(queue_analysis(request.farm_id, request.analysis_type))
-    return {"success": True, "message": "AI Analysis queued"}
+    # Queue the analysis and return immediately to keep the UI responsive;
+    # repeated clicks while the same analysis is still pending reuse that job.
+    payload = {"farm_id": request.farm_id, "analysis_type": request.analysis_type}
+    job, created = await analysis_jobs.submit(ANALYSIS_JOB_KIND, _analysis_job_key(payload), payload)
+    if job is None:
+        raise HTTPException(status_code=429, detail="Too many analysis jobs are queued. Try again later.")
+    return {
+        "success": True,
+        "message": "AI Analysis queued" if created else "AI Analysis already queued",
+        "job_id": job.id,
+        "deduplicated": not created,
+    }
 
 
-async def queue_analysis(farm_id: str, analysis_type: str) -> None:
-    if supabase is None:
-        print("[AI] Supabase unavailable, skip storing analysis request.")
-        return
-    try:
-        farm_res = supabase.table("farms").select("user_id").eq("id", farm_id).single().execute()
-        user_id = farm_res.data["user_id"]
-        supabase.table("analysis_requests").insert(
+@app.get("/api/ai/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = await run_in_threadpool(analysis_jobs.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {"success": True, "data": job.to_dict()}
+
+
+@app.get("/api/ai/analyze/jobs")
+async def list_analysis_jobs(
+    farm_id: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=200),
+):
+    jobs = await run_in_threadpool(
+        analysis_jobs.store.list,
+        limit=limit,
+        dedupe_prefix=f"{farm_id}:" if farm_id else None,
+    )
+    return {
+        "success": True,
+        "data": [job.to_dict() for job in jobs],
+        "meta": analysis_jobs.stats(),
+    }
+
+
+async def queue_analysis(job: Job) -> None:
+    farm_id = job.payload["farm_id"]
+    analysis_type = job.payload["analysis_type"]
+    if data_access is None or farm_contexts is None:
+        raise RuntimeError("Supabase is not configured.")
+    # The request row is written once; retries only repeat the analysis itself.
+    if not job.payload.get("request_recorded"):
+        context = await farm_contexts.get(farm_id)
+        if context is None:
+            raise PermanentJobError(f"Farm not found: {farm_id}")
+        await data_access.insert_analysis_request(
             {
-                "user_id": user_id,
+                "user_id": context.farm["user_id"],
                 "farm_id": farm_id,
                 "analysis_type": analysis_type,
                 "status": "pending",
             }
-        ).execute()
-    except Exception as exc:
-        print(f"[AI] Failed to store analysis request: {exc}")
-        return
-
+        )
+        job.payload["request_recorded"] = True
     try:
         await process_analysis(farm_id, analysis_type)
-    except Exception as exc:
-        print(f"[AI] Failed to process analysis: {exc}")
+    except HTTPException as exc:
+        # 4xx means the farm or its data is unusable; retrying will not fix it.
+        if 400 <= exc.status_code < 500:
+            raise PermanentJobError(f"{exc.status_code}: {exc.detail}") from exc
+        raise
+
+
+ANALYSIS_JOB_KIND = "analysis"
+analysis_jobs = JobEngine(
+    store=JobStore(Path(os.environ.get("ANALYSIS_JOB_DB_PATH", str(DATA_DIR / "analysis_jobs.sqlite3")))),
+    handlers={ANALYSIS_JOB_KIND: queue_analysis},
+    workers=int(os.environ.get("ANALYSIS_JOB_WORKERS", "2")),
+    max_attempts=int(os.environ.get("ANALYSIS_JOB_MAX_ATTEMPTS", "3")),
+    retry_backoff_seconds=float(os.environ.get("ANALYSIS_JOB_RETRY_BACKOFF_SECONDS", "5")),
+    max_pending=int(os.environ.get("ANALYSIS_JOB_MAX_PENDING", "500")),
+)
+ANALYSIS_JOB_RETENTION_SECONDS = float(os.environ.get("ANALYSIS_JOB_RETENTION_DAYS", "7")) * 86400
 
 
 @app.get("/api/ai/recommendations/{farm_id}")
 async def get_recommendations(farm_id: str):
-    client = _require_supabase()
+    data = _require_data_access()
     try:
-        response = (
-            client.table("season_recommendations")
-            .select("*")
-            .eq("farm_id", farm_id)
-            .order("created_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-        if not response.data:
-            return {"success": True, "data": None}
-        return {"success": True, "data": response.data[0]}
+        return {"success": True, "data": await data.get_latest_season_recommendation(farm_id)}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
 @app.get("/api/ai/analysis-requests/{farm_id}")
 async def get_analysis_history(farm_id: str):
-    client = _require_supabase()
+    data = _require_data_access()
     try:
-        response = (
-            client.table("analysis_requests")
-            .select("*")
-            .eq("farm_id", farm_id)
-            .order("created_at", desc=True)
-            .limit(10)
-            .execute()
-        )
-        return {"success": True, "data": response.data}
+        return {"success": True, "data": await data.list_analysis_requests(farm_id, limit=10)}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+async def _build_chat_ai_context(data: FarmDataAccess, context: FarmContext) -> dict:
+    farm = context.farm
+    province = context.province
+    dt_now = datetime.now()
+    season = context.active_season or {}
+    season_type = str(season.get("season_type") or "").lower()
+    crop_mode = "shrimp" if season_type == "shrimp" else "rice"
+    start_date_raw = season.get("start_date")
+    try:
+        start_date = datetime.fromisoformat(str(start_date_raw).split("T")[0])
+    except Exception:
+        start_date = dt_now - timedelta(days=45)
+    age_days = max(0, (dt_now.date() - start_date.date()).days)
+    stage = "early" if age_days < 30 else "mid" if age_days < 75 else "late"
+
+    async def _ai1() -> Optional[ForecastResult]:
+        if not province:
+            return None
+        return await _forecast_champion(province, dt_now.strftime("%Y-%m-%d"))
+
+    # AI1 and AI2 are independent; a failure in either only drops its part.
+    ai1, ai2 = await asyncio.gather(_ai1(), _predict_ai2_for_farm(data, context), return_exceptions=True)
+    ai1 = None if isinstance(ai1, Exception) else ai1
+    ai2 = None if isinstance(ai2, Exception) else ai2
+
+    ai3 = None
+    if ai1 and ai2:
+        try:
+            forecast_points = [ForecastPointResponse(**point.__dict__) for point in ai1.forecast]
+            ai3 = _build_ai3_decision(
+                crop_mode=crop_mode,
+                stage=stage,
+                forecast_points=forecast_points,
+                risk_label=str(ai2.get("risk_label", "Medium")),
+                risk_score=ai2.get("risk_score"),
+                current_date=dt_now,
+            )
+        except Exception:
+            ai3 = None
+
+    return {
+        "farm": {
+            "id": farm.get("id"),
+            "name": farm.get("farm_name"),
+            "type": farm.get("farm_type"),
+            "province": province,
+            "crop_mode": crop_mode,
+            "season_stage": stage,
+        },
+        "ai1_forecast_7d": (
+            [
+                {
+                    "day_ahead": int(p.day_ahead),
+                    "date": str(p.date),
+                    "salinity_pred": float(p.salinity_pred),
+                }
+                for p in ai1.forecast
+            ]
+            if ai1
+            else None
+        ),
+        "ai2_risk": ai2,
+        "ai3_decision": ai3,
+    }
+
+
+# A chat conversation is a handful of messages within minutes; reuse the
+# serialized farm context for those instead of rebuilding it per message.
+_chat_context_cache = TTLCache(
+    maxsize=int(os.environ.get("CHAT_CONTEXT_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.environ.get("CHAT_CONTEXT_TTL_SECONDS", "120")),
+)
+
+
+def _chat_context_version() -> tuple[str, str, str]:
+    """Model versions and day a chat snapshot was built for; a change makes the snapshot stale."""
+    try:
+        ai1_version = str(get_forecast_service().metadata.get("model_version", "unknown"))
+    except Exception:
+        ai1_version = "missing"
+    try:
+        ai2_version = str(_get_ai2_model_bundle()["metadata"].get("model_version", "unknown"))
+    except Exception:
+        ai2_version = "missing"
+    return ai1_version, ai2_version, datetime.now().strftime("%Y-%m-%d")
+
+
+def _chat_context_complete(ai_context: dict) -> bool:
+    """False when AI2, or AI1/AI3 for a farm with a province, failed; such contexts are rebuilt next message."""
+    if ai_context.get("ai2_risk") is None:
+        return False
+    return not ai_context["farm"].get("province") or ai_context.get("ai3_decision") is not None
+
+
+async def _chat_context_snapshot(data: FarmDataAccess, context: FarmContext) -> tuple[str, float, bool]:
+    """Return `(context_json, age_seconds, cached)` for the farm's chat context."""
+    version = await run_in_threadpool(_chat_context_version)
+    cached = _chat_context_cache.get(context.farm_id)
+    if cached is not None and cached[0] == version:
+        return cached[1], float(_chat_context_cache.age(context.farm_id) or 0.0), True
+
+    async def _build() -> str:
+        ai_context = await _build_chat_ai_context(data, context)
+        context_json = json.dumps(ai_context, ensure_ascii=False)
+        if _chat_context_complete(ai_context):
+            _chat_context_cache.set(context.farm_id, (version, context_json))
+        return context_json
+
+    context_json = await _single_flight.do_async(("chat-context", context.farm_id, version), _build)
+    return context_json, 0.0, False
+
+
 @app.post("/api/ai/chat")
 async def chat_with_image(
     message: str = Form(...),
@@ -836,200 +1533,211 @@ async def chat_with_image(
 ):
     if not GEMINI_API_KEY:
         return {"success": False, "message": "Gemini API Key is not configured"}
-    if gemini_model is None:
-        _init_gemini_model()
-    if gemini_model is None:
-        return {"success": False, "message": "Gemini model chưa sẵn sàng."}
-    try:
-        content = [SYSTEM_PROMPT]
-
-        # Inject farm-specific AI1/AI2/AI3 context so Gemini can answer
-        # practical questions like "2 ngày nữa độ mặn bao nhiêu?".
-        if farm_id:
-            try:
-                client = _require_supabase()
-                farm_res = (
-                    client.table("farms")
-                    .select("id,farm_name,address,farm_code,farm_type")
-                    .eq("id", farm_id)
-                    .single()
-                    .execute()
+    content = [SYSTEM_PROMPT]
+    context_age_seconds: Optional[float] = None
+    context_cached = False
+
+    # Inject farm-specific AI1/AI2/AI3 context so Gemini can answer
+    # practical questions like "2 ngày nữa độ mặn bao nhiêu?".
+    if farm_id:
+        try:
+            data = _require_data_access()
+            context = await farm_contexts.get(farm_id) if farm_contexts is not None else None
+            if context is not None:
+                context_json, context_age_seconds, context_cached = await _chat_context_snapshot(data, context)
+                content.append(
+                    "Ngữ cảnh dữ liệu farm (JSON) để trả lời chính xác, không bịa số:\n" + context_json
                 )
-                farm = farm_res.data
-                if farm:
-                    province = _infer_province_from_farm(farm)
-                    dt_now = datetime.now()
-                    season_res = (
-                        client.table("seasons")
-                        .select("season_type,start_date")
-                        .eq("farm_id", farm_id)
-                        .eq("status", "active")
-                        .limit(1)
-                        .execute()
-                    )
-                    season = (season_res.data or [{}])[0] if season_res.data else {}
-                    season_type = str(season.get("season_type") or "").lower()
-                    crop_mode = "shrimp" if season_type == "shrimp" else "rice"
-                    start_date_raw = season.get("start_date")
-                    try:
-                        start_date = datetime.fromisoformat(str(start_date_raw).split("T")[0])
-                    except Exception:
-                        start_date = dt_now - timedelta(days=45)
-                    age_days = max(0, (dt_now.date() - start_date.date()).days)
-                    stage = "early" if age_days < 30 else "mid" if age_days < 75 else "late"
-
-                    ai1 = None
-                    if province:
-                        try:
-                            ai1 = get_forecast_service().forecast(
-                                province=province,
-                                as_of=dt_now.strftime("%Y-%m-%d"),
-                                model_set="champion",
-                            )
-                        except Exception:
-                            ai1 = None
-
-                    ai2 = None
-                    try:
-                        ai2 = _predict_ai2_for_farm(client, farm_id, farm)
-                    except Exception:
-                        ai2 = None
-
-                    ai3 = None
-                    if ai1 and ai2:
-                        try:
-                            forecast_points = [ForecastPointResponse(**point.__dict__) for point in ai1.forecast]
-                            ai3 = _build_ai3_decision(
-                                crop_mode=crop_mode,
-                                stage=stage,
-                                forecast_points=forecast_points,
-                                risk_label=str(ai2.get("risk_label", "Medium")),
-                                risk_score=ai2.get("risk_score"),
-                                current_date=dt_now,
-                            )
-                        except Exception:
-                            ai3 = None
-
-                    ai_context = {
-                        "farm": {
-                            "id": farm.get("id"),
-                            "name": farm.get("farm_name"),
-                            "type": farm.get("farm_type"),
-                            "province": province,
-                            "crop_mode": crop_mode,
-                            "season_stage": stage,
-                        },
-                        "ai1_forecast_7d": (
-                            [
-                                {
-                                    "day_ahead": int(p.day_ahead),
-                                    "date": str(p.date),
-                                    "salinity_pred": float(p.salinity_pred),
-                                }
-                                for p in ai1.forecast
-                            ]
-                            if ai1
-                            else None
-                        ),
-                        "ai2_risk": ai2,
-                        "ai3_decision": ai3,
-                    }
-                    content.append(
-                        "Ngữ cảnh dữ liệu farm (JSON) để trả lời chính xác, không bịa số:\n"
-                        + json.dumps(ai_context, ensure_ascii=False)
-                    )
-            except Exception as exc:
-                content.append(f"Không tải được dữ liệu farm_id={farm_id}: {exc}")
+        except Exception as exc:
+            content.append(f"Không tải được dữ liệu farm_id={farm_id}: {exc}")
 
-        content.append(
-            "Yêu cầu trả lời: dùng tiếng Việt gần gũi nông dân, ưu tiên số liệu trong ngữ cảnh; "
-            "nếu thiếu dữ liệu thì nói rõ thiếu gì."
-        )
-        content.append(message)
-        response = gemini_model.generate_content(content)
+    content.append(
+        "Yêu cầu trả lời: dùng tiếng Việt gần gũi nông dân, ưu tiên số liệu trong ngữ cảnh; "
+        "nếu thiếu dữ liệu thì nói rõ thiếu gì."
+    )
+    content.append(message)
+    try:
+        with stage("gemini"):
+            reply, model_name = await chat_llm.generate(content)
         return {
             "success": True,
-            "reply": response.text,
-            "model": gemini_model_name,
+            "reply": reply,
+            "model": model_name,
             "timestamp": datetime.now().isoformat(),
+            "context_age_seconds": round(context_age_seconds, 3) if context_age_seconds is not None else None,
+            "context_cached": context_cached,
         }
+    except LLMUnavailableError as exc:
+        return {"success": False, "message": str(exc)}
+    except LLMTimeoutError as exc:
+        return {"success": False, "message": f"Gemini error: {exc}"}
     except Exception as exc:
         error_text = str(exc)
         if "not found" in error_text.lower() and "models/" in error_text.lower():
-            _init_gemini_model()
+            chat_llm.reset()
         return {"success": False, "message": f"Gemini error: {error_text}"}
 
 
+@app.get("/api/ai/chat/stats")
+def get_chat_stats():
+    return {"success": True, "data": {**chat_llm.stats(), "context_cache": _chat_context_cache.stats()}}
+
+
 async def process_analysis(farm_id: str, analysis_type: str):
-    client = _require_supabase()
-    try:
-        farm_res = client.table("farms").select("*").eq("id", farm_id).single().execute()
-        farm = farm_res.data
-        if not farm:
-            return
+    data = _require_data_access()
+    context = await _require_farm_context(farm_id)
+    farm = context.farm
+    if not context.device_ids:
+        return
 
-        device_res = client.table("iot_devices").select("id").eq("farm_id", farm_id).limit(1).execute()
-        if not device_res.data:
-            return
-        device_id = device_res.data[0]["id"]
-
-        sensor_res = (
-            client.table("sensor_readings")
-            .select("salinity, ph, temperature, timestamp")
-            .eq("device_id", device_id)
-            .order("timestamp", desc=True)
-            .limit(48)
-            .execute()
-        )
-        readings = sensor_res.data
-        if not readings:
-            return
+    readings = await data.list_sensor_readings(
+        context.device_ids[:1],
+        columns="salinity, ph, temperature, timestamp",
+        limit=48,
+        newest_first=True,
+    )
+    if not readings:
+        return
 
-        current = readings[0]
-        avg_salinity = float(np.mean([row["salinity"] for row in readings]))
-        recommendation = ""
-        explanation = ""
-
-        if farm["farm_type"] == "shrimp_rice":
-            thresholds = BIOLOGICAL_THRESHOLDS["shrimp_rice"]
-            month = datetime.now().month
-            is_dry_season = month in [1, 2, 3, 4, 5, 6]
-            if is_dry_season:
-                if current["salinity"] < thresholds["shrimp_phase"]["min_salinity"]:
-                    recommendation = "Cảnh báo độ mặn thấp cho tôm"
-                    explanation = (
-                        f"Độ mặn hiện tại {current['salinity']}‰ thấp hơn ngưỡng 5‰. "
-                        "Cần theo dõi nguồn nước và bổ sung khoáng."
-                    )
-                else:
-                    recommendation = "Môi trường nuôi tôm an toàn"
-                    explanation = f"Độ mặn {current['salinity']}‰ nằm trong ngưỡng tối ưu."
+    current = readings[0]
+    avg_salinity = float(np.mean([row["salinity"] for row in readings]))
+    recommendation = ""
+    explanation = ""
+
+    if farm["farm_type"] == "shrimp_rice":
+        thresholds = BIOLOGICAL_THRESHOLDS["shrimp_rice"]
+        month = datetime.now().month
+        is_dry_season = month in [1, 2, 3, 4, 5, 6]
+        if is_dry_season:
+            if current["salinity"] < thresholds["shrimp_phase"]["min_salinity"]:
+                recommendation = "Cảnh báo độ mặn thấp cho tôm"
+                explanation = (
+                    f"Độ mặn hiện tại {current['salinity']}‰ thấp hơn ngưỡng 5‰. "
+                    "Cần theo dõi nguồn nước và bổ sung khoáng."
+                )
             else:
-                if current["salinity"] > thresholds["rice_phase"]["critical_salinity"]:
-                    recommendation = "CẢNH BÁO XÂM NHẬP MẶN"
-                    explanation = (
-                        f"Độ mặn {current['salinity']}‰ vượt ngưỡng an toàn cho lúa (2‰). "
-                        "Cần đóng cống ngăn mặn."
-                    )
-                elif 0.5 < current["salinity"] <= 1.0:
-                    recommendation = "Đang trong giai đoạn rửa mặn"
-                    explanation = "Độ mặn đang giảm dần, đợi dưới 0.5‰ để gieo sạ."
-                else:
-                    recommendation = "Vùng nuôi an toàn cho lúa"
-                    explanation = "Các chỉ số môi trường đang ở mức phù hợp."
+                recommendation = "Môi trường nuôi tôm an toàn"
+                explanation = f"Độ mặn {current['salinity']}‰ nằm trong ngưỡng tối ưu."
+        else:
+            if current["salinity"] > thresholds["rice_phase"]["critical_salinity"]:
+                recommendation = "CẢNH BÁO XÂM NHẬP MẶN"
+                explanation = (
+                    f"Độ mặn {current['salinity']}‰ vượt ngưỡng an toàn cho lúa (2‰). "
+                    "Cần đóng cống ngăn mặn."
+                )
+            elif 0.5 < current["salinity"] <= 1.0:
+                recommendation = "Đang trong giai đoạn rửa mặn"
+                explanation = "Độ mặn đang giảm dần, đợi dưới 0.5‰ để gieo sạ."
+            else:
+                recommendation = "Vùng nuôi an toàn cho lúa"
+                explanation = "Các chỉ số môi trường đang ở mức phù hợp."
+
+    await data.insert_season_recommendation(
+        {
+            "farm_id": farm_id,
+            "current_salinity_avg": avg_salinity,
+            "salinity_trend": "stable",
+            "recommended_action": recommendation,
+            "explanation": explanation,
+            "status": "suggested",
+        }
+    )
 
-        client.table("season_recommendations").insert(
-            {
-                "farm_id": farm_id,
-                "current_salinity_avg": avg_salinity,
-                "salinity_trend": "stable",
-                "recommended_action": recommendation,
-                "explanation": explanation,
-                "status": "suggested",
-            }
-        ).execute()
+
+_warmup_state: dict = {"status": "pending", "seconds": None, "errors": {}}
+_warmup_task: Optional[asyncio.Task] = None
+
+
+async def _warm_up() -> None:
+    """Load models and open external clients after the server starts accepting requests."""
+    started = time.perf_counter()
+    _warmup_state["status"] = "warming"
+    steps = {
+        "forecast_model": run_in_threadpool(get_forecast_service),
+        "ai2_model": run_in_threadpool(_get_ai2_model_bundle),
+    }
+    if GEMINI_API_KEY:
+        steps["gemini"] = chat_llm.ensure_model()
+    if data_access is not None:
+        steps["supabase"] = data_access.client()
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+
+    errors = {}
+    for name, result in zip(steps, results):
+        if isinstance(result, BaseException):
+            errors[name] = getattr(result, "detail", None) or getattr(result, "message", None) or str(result)
+        elif name == "gemini" and result is None:
+            errors[name] = "Gemini model could not be initialized."
+    for name, error in errors.items():
+        print(f"WARNING: warm-up step {name} failed: {error}")
+    elapsed = time.perf_counter() - started
+    _warmup_state.update(status="ready" if not errors else "degraded", seconds=round(elapsed, 4), errors=errors)
+    STARTUP_SECONDS.set(("warmup",), elapsed)
+
+
+async def _startup() -> None:
+    global _warmup_task
+    # Reloaders poll in their own threads; model loading itself happens in _warm_up.
+    _forecast_loader.start()
+    _ai2_loader.start()
+    await run_in_threadpool(analysis_jobs.store.prune, ANALYSIS_JOB_RETENTION_SECONDS)
+    await analysis_jobs.start()
+    _warmup_task = asyncio.ensure_future(_warm_up())
+    STARTUP_SECONDS.set(("serving",), time.perf_counter() - _IMPORT_STARTED)
+
+
+async def _shutdown() -> None:
+    if _warmup_task is not None and not _warmup_task.done():
+        _warmup_task.cancel()
+    await analysis_jobs.stop()
+    _forecast_loader.stop(timeout=5)
+    _ai2_loader.stop(timeout=5)
+    if data_access is not None:
+        await data_access.aclose()
+    chat_llm.shutdown()
+
+
+def preload_for_workers() -> dict:
+    """Load models and read-only feature state in the pre-fork parent (see app/serve.py)."""
+    started = time.perf_counter()
+    summary: dict = {"forecast_shared_bytes": 0, "errors": {}}
+    try:
+        summary["forecast_shared_bytes"] = get_forecast_service().share_memory()
+        # A rebuild thread would not survive fork() and could leave locks held.
+        _wait_for_forecast_table_rebuild()
     except Exception as exc:
-        print(f"AI Error: {exc}")
+        summary["errors"]["forecast_model"] = getattr(exc, "message", None) or str(exc)
+    try:
+        _get_ai2_model_bundle()
+    except Exception as exc:
+        summary["errors"]["ai2_model"] = getattr(exc, "detail", None) or str(exc)
+    # Recover jobs from a previous run once here rather than in every worker,
+    # then close the connection so no SQLite handle is inherited across fork().
+    analysis_jobs.store.requeue_running()
+    analysis_jobs.store.close()
+    analysis_jobs.recover_on_start = False
+    STARTUP_SECONDS.set(("preload",), time.perf_counter() - started)
+    return summary
+
+
+def after_fork_in_worker() -> None:
+    analysis_jobs.store.reopen()
+
+
+@app.get("/ready")
+def readiness_check():
+    """503 until warm-up has finished; `degraded` means some warm-up step failed but the service is up."""
+    body = {
+        "status": _warmup_state["status"],
+        "warmup_seconds": _warmup_state["seconds"],
+        "errors": _warmup_state["errors"],
+    }
+    if _warmup_state["status"] in {"pending", "warming"}:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+STARTUP_SECONDS.set(("import",), time.perf_counter() - _IMPORT_STARTED)
 
 
 if __name__ == "__main__":
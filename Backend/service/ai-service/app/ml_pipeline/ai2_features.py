@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import DEFAULT_DRY_MONTHS
+
+
+DEFAULT_AI2_PH = 7.4
+INVALID_READINGS_MESSAGE = "Sensor readings invalid for AI2 inference."
+
+
+@dataclass
+class AI2FeatureBatch:
+    """AI2 model inputs for many groups (usually farms), one row per group.
+
+    `errors` lists groups whose readings were present but unusable; groups
+    without any readings are not reported here at all.
+    """
+
+    keys: List[str]
+    features: pd.DataFrame
+    diagnostics: List[Dict[str, object]]
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+def _take_back(values: np.ndarray, ends: np.ndarray, counts: np.ndarray, steps: int, fallback: np.ndarray) -> np.ndarray:
+    """Value `steps` rows before each group's last row, or `fallback` when the group is too short."""
+    return np.where(counts > steps, values[np.maximum(ends - 1 - steps, 0)], fallback)
+
+
+def _tail_mean(values: np.ndarray, ends: np.ndarray, counts: np.ndarray, window: int) -> np.ndarray:
+    """Mean of each group's last `window` rows (fewer when the group is shorter)."""
+    steps = np.arange(window)
+    in_group = steps[None, :] < counts[:, None]
+    picked = values[np.maximum(ends[:, None] - 1 - steps[None, :], 0)]
+    return np.where(in_group, picked, 0.0).sum(axis=1) / np.minimum(counts, window)
+
+
+def build_ai2_features(
+    readings: pd.DataFrame,
+    feature_columns: Sequence[str],
+    provinces: Mapping[str, Optional[str]],
+    group_column: str = "farm_id",
+    dry_months: Sequence[int] = DEFAULT_DRY_MONTHS,
+) -> AI2FeatureBatch:
+    """Latest AI2 feature vector of every group in long-format `readings`.
+
+    `readings` holds `group_column`, `timestamp`, `salinity`, `temperature` and
+    `ph` columns. Rows are sorted once by (group, timestamp); lags and trailing
+    means are then gathered from group end offsets with array indexing instead
+    of a Python loop per farm.
+    """
+    columns = list(feature_columns)
+    empty = AI2FeatureBatch(keys=[], features=pd.DataFrame(columns=columns, dtype=float), diagnostics=[])
+    if readings.empty:
+        return empty
+
+    frame = pd.DataFrame(
+        {
+            "key": readings[group_column].astype(str).to_numpy(),
+            "timestamp": pd.to_datetime(readings["timestamp"], errors="coerce"),
+            "salinity": pd.to_numeric(readings["salinity"], errors="coerce"),
+            "temperature": pd.to_numeric(readings["temperature"], errors="coerce"),
+            "ph": pd.to_numeric(readings["ph"], errors="coerce")
+            if "ph" in readings.columns
+            else np.nan,
+        }
+    )
+    all_keys = pd.unique(frame["key"])
+    frame = frame.dropna(subset=["timestamp", "salinity", "temperature"])
+    frame = frame.sort_values(["key", "timestamp"], kind="mergesort").reset_index(drop=True)
+    errors = {str(key): INVALID_READINGS_MESSAGE for key in set(all_keys) - set(frame["key"])}
+    if frame.empty:
+        empty.errors = errors
+        return empty
+
+    key_values = frame["key"].to_numpy()
+    boundaries = np.flatnonzero(key_values[1:] != key_values[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(frame)]))
+    counts = ends - starts
+    last = ends - 1
+
+    sal = frame["salinity"].to_numpy(dtype=float)
+    temp = frame["temperature"].to_numpy(dtype=float)
+    ph = frame["ph"].to_numpy(dtype=float)
+
+    # Latest non-missing pH per group: carry the last valid row index forward.
+    valid_ph_index = np.maximum.accumulate(np.where(np.isnan(ph), -1, np.arange(len(ph))))[last]
+    has_ph = valid_ph_index >= starts
+    ph_latest = np.where(has_ph, ph[np.maximum(valid_ph_index, 0)], DEFAULT_AI2_PH)
+
+    sal_latest = sal[last]
+    sal_t_1 = _take_back(sal, ends, counts, 1, sal_latest)
+    sal_t_3 = _take_back(sal, ends, counts, 3, sal_t_1)
+    sal_t_7 = _take_back(sal, ends, counts, 7, sal_t_3)
+    latest_ts = frame["timestamp"].iloc[last].reset_index(drop=True)
+    months = latest_ts.dt.month.to_numpy(dtype=float)
+
+    base_values = {
+        "salinity": sal_latest,
+        "temperature": temp[last],
+        "ph": ph_latest,
+        "sal_t-1": sal_t_1,
+        "sal_t-3": sal_t_3,
+        "sal_t-7": sal_t_7,
+        "sal_3d_avg": _tail_mean(sal, ends, counts, 3),
+        "sal_7d_avg": _tail_mean(sal, ends, counts, 7),
+        "temp_7d_avg": _tail_mean(temp, ends, counts, 7),
+        "sal_change_1d": sal_latest - sal_t_1,
+        "sal_change_3d": sal_latest - sal_t_3,
+        "month": months,
+        "day_of_year": latest_ts.dt.dayofyear.to_numpy(dtype=float),
+        "is_dry_season": np.isin(months, list(dry_months)).astype(float),
+    }
+
+    keys = [str(key) for key in key_values[starts]]
+    matrix = np.zeros((len(keys), len(columns)), dtype=float)
+    positions = {column: idx for idx, column in enumerate(columns)}
+    for name, values in base_values.items():
+        if name in positions:
+            matrix[:, positions[name]] = values
+    group_provinces = [provinces.get(key) or "" for key in keys]
+    for row, province in enumerate(group_provinces):
+        dummy_position = positions.get(f"province_{province.strip().lower()}") if province.strip() else None
+        if dummy_position is not None:
+            matrix[row, dummy_position] = 1.0
+
+    diagnostics = [
+        {
+            "latest_timestamp": str(latest_ts.iloc[row]),
+            "latest_salinity": float(sal_latest[row]),
+            "latest_temperature": float(temp[last[row]]),
+            "latest_ph": float(ph_latest[row]),
+            "history_points": int(counts[row]),
+            "province": group_provinces[row],
+        }
+        for row in range(len(keys))
+    ]
+    return AI2FeatureBatch(
+        keys=keys,
+        features=pd.DataFrame(matrix, columns=columns),
+        diagnostics=diagnostics,
+        errors=errors,
+    )
+
+
+def predict_risk(model: object, features: pd.DataFrame) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Class values and top-class probabilities from a single model call.
+
+    With `predict_proba` available the label is the argmax of the probability
+    row, which is what `predict` returns for these classifiers, so `predict`
+    is not called a second time.
+    """
+    if not hasattr(model, "predict_proba"):
+        return np.asarray(model.predict(features)), None
+    probs = np.asarray(model.predict_proba(features))
+    best = np.argmax(probs, axis=1)
+    classes = getattr(model, "classes_", None)
+    class_values = np.asarray(classes)[best] if classes is not None else best
+    return class_values, probs[np.arange(len(best)), best]
@@ -13,7 +13,9 @@ CHARTS_DIR = REPORTS_DIR / "charts"
 
 DEFAULT_WEATHER_CSV = DATA_DIR / "weather_province_daily.csv"
 DEFAULT_PREPARED_DAILY_CSV = DATA_DIR / "prepared_daily_dataset.csv"
+DEFAULT_PREPARED_DAILY_NPZ = DATA_DIR / "prepared_daily_dataset.npz"
 DEFAULT_TRAIN_FEATURES_CSV = DATA_DIR / "train_feature_dataset.csv"
+DEFAULT_TRAIN_FEATURES_NPZ = DATA_DIR / "train_feature_dataset.npz"
 DEFAULT_PREDICTIONS_CSV = REPORTS_DIR / "predictions_test.csv"
 DEFAULT_METRICS_CSV = REPORTS_DIR / "metrics_summary.csv"
 DEFAULT_BACKTEST_METRICS_CSV = REPORTS_DIR / "backtest_metrics_summary.csv"
@@ -23,10 +25,12 @@ DEFAULT_THRESHOLD_METRICS_CSV = REPORTS_DIR / "threshold_accuracy_summary.csv"
 DEFAULT_ACCEPTANCE_SUMMARY_CSV = REPORTS_DIR / "acceptance_summary.csv"
 DEFAULT_REPORT_PATH = REPORTS_DIR / "report_ai1.md"
 DEFAULT_METADATA_PATH = MODELS_DIR / "metadata.json"
+DEFAULT_FORECAST_TABLE_PATH = MODELS_DIR / "forecast_table.npz"
 
 DEFAULT_DRY_MONTHS = (12, 1, 2, 3, 4)
 MIN_VALID_DAYS_PER_PROVINCE = 120
 FORECAST_HORIZONS: Sequence[int] = tuple(range(1, 8))
+FORECAST_TABLE_WINDOW_DAYS = 30
 BACKTEST_MIN_TRAIN_DAYS = 180
 BACKTEST_VAL_DAYS = 30
 BACKTEST_TEST_DAYS = 30
@@ -6,10 +6,13 @@ import re
 import unicodedata
 from datetime import date
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
 
+import numpy as np
 import pandas as pd
-from supabase import Client, create_client
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 
 PROVINCE_MAP: Dict[str, str] = {
@@ -257,6 +260,8 @@ def load_supabase_daily_dataset() -> pd.DataFrame:
     if not url or not service_key:
         raise ValueError("Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY để đọc dữ liệu Supabase.")
 
+    from supabase import create_client
+
     client = create_client(url, service_key)
 
     sensors = pd.DataFrame(
@@ -351,3 +356,67 @@ def build_daily_dataset(
     merged = merged.dropna(subset=["date", "province", "salinity_daily", "rain_mm", "temp_c"])
     merged = merged.sort_values(["province", "date"]).reset_index(drop=True)
     return merged[["date", "province", "salinity_daily", "rain_mm", "temp_c"]]
+
+
+COLUMNAR_FORMAT_VERSION = 1
+
+
+def save_columnar_frame(frame: pd.DataFrame, path: Path, float_dtype: str = "float32") -> Path:
+    """Write `frame` as an uncompressed .npz with typed columns.
+
+    Datetime columns are stored as datetime64[D], other numeric columns as
+    `float_dtype` (int32 for integer columns) and everything else as
+    categorical codes plus a string category table, so loading skips text
+    parsing. Pass float_dtype="float64" when downstream features must match
+    the CSV values bit for bit.
+    """
+    arrays: Dict[str, np.ndarray] = {}
+    kinds: List[str] = []
+    for idx, column in enumerate(frame.columns):
+        series = frame[column]
+        key = f"c{idx}"
+        if pd.api.types.is_datetime64_any_dtype(series):
+            arrays[key] = series.to_numpy(dtype="datetime64[D]")
+            kinds.append("date")
+        elif pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series):
+            arrays[key] = series.to_numpy(dtype=np.int32)
+            kinds.append("int")
+        elif pd.api.types.is_numeric_dtype(series):
+            arrays[key] = series.to_numpy(dtype=float_dtype)
+            kinds.append("float")
+        else:
+            categorical = pd.Categorical(series.astype("string"))
+            arrays[key] = np.asarray(categorical.codes, dtype=np.int32)
+            arrays[f"{key}_categories"] = np.asarray(categorical.categories, dtype=str)
+            kinds.append("category")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.tmp.npz")
+    np.savez(
+        tmp_path,
+        __version__=np.asarray(COLUMNAR_FORMAT_VERSION),
+        __columns__=np.asarray([str(column) for column in frame.columns], dtype=str),
+        __kinds__=np.asarray(kinds, dtype=str),
+        **arrays,
+    )
+    tmp_path.replace(path)
+    return path
+
+
+def load_columnar_frame(path: Path) -> pd.DataFrame:
+    with np.load(path, allow_pickle=False) as payload:
+        version = int(payload["__version__"])
+        if version != COLUMNAR_FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar dataset version {version}: {path}")
+        columns = payload["__columns__"].tolist()
+        kinds = payload["__kinds__"].tolist()
+        data: Dict[str, object] = {}
+        for idx, (column, kind) in enumerate(zip(columns, kinds)):
+            values = payload[f"c{idx}"]
+            if kind == "date":
+                data[column] = pd.to_datetime(values)
+            elif kind == "category":
+                data[column] = pd.Categorical.from_codes(values, categories=payload[f"c{idx}_categories"])
+            else:
+                data[column] = values
+    return pd.DataFrame(data, columns=columns)
@@ -161,8 +161,12 @@ def time_series_split(frame: pd.DataFrame, train_ratio: float = 0.70, val_ratio:
     return SplitResult(train=train, val=val, test=test, train_end_date=train_end_date, val_end_date=val_end_date)
 
 
+def province_dummy_column(province: str) -> str:
+    return f"province__{str(province).replace(' ', '_').lower()}"
+
+
 def province_dummy_columns(provinces: Sequence[str]) -> List[str]:
-    return [f"province__{province.replace(' ', '_').lower()}" for province in sorted(provinces)]
+    return [province_dummy_column(province) for province in sorted(provinces)]
 
 
 def encode_features(
@@ -179,3 +183,57 @@ def encode_features(
     dummies = dummies.loc[:, province_columns]
     encoded = pd.concat([x.reset_index(drop=True), dummies.reset_index(drop=True)], axis=1)
     return encoded
+
+
+@dataclass(frozen=True)
+class FeatureProjector:
+    """Precompiled equivalent of `encode_features` for a fixed feature spec.
+
+    Maps numeric rows laid out in `source_columns` order onto the encoded model
+    input order with plain numpy indexing; columns missing from the source are
+    left at 0 like the column-fill step of the DataFrame path.
+    """
+
+    source_columns: Tuple[str, ...]
+    columns: Tuple[str, ...]
+    source_positions: np.ndarray
+    target_positions: np.ndarray
+    province_positions: Dict[str, int]
+
+    @classmethod
+    def build(
+        cls,
+        source_columns: Sequence[str],
+        numeric_cols: Sequence[str],
+        expected_cols: Sequence[str],
+        province_columns: Sequence[str],
+    ) -> "FeatureProjector":
+        source_index = {column: idx for idx, column in enumerate(source_columns)}
+        target_index = {column: idx for idx, column in enumerate(expected_cols)}
+        pairs = [
+            (source_index[column], target_index[column])
+            for column in numeric_cols
+            if column in source_index and column in target_index
+        ]
+        province_positions = {
+            column: target_index[column] for column in province_columns if column in target_index
+        }
+        return cls(
+            source_columns=tuple(source_columns),
+            columns=tuple(expected_cols),
+            source_positions=np.asarray([src for src, _ in pairs], dtype=np.intp),
+            target_positions=np.asarray([dst for _, dst in pairs], dtype=np.intp),
+            province_positions=province_positions,
+        )
+
+    def project(self, values: np.ndarray, provinces: Sequence[str]) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values.reshape(1, -1)
+        projected = np.zeros((values.shape[0], len(self.columns)), dtype=float)
+        projected[:, self.target_positions] = values[:, self.source_positions]
+        for row, province in enumerate(provinces):
+            position = self.province_positions.get(province_dummy_column(province))
+            if position is not None:
+                projected[row, position] = 1.0
+        return projected
@@ -1,18 +1,32 @@
 from __future__ import annotations
 
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 from zoneinfo import ZoneInfo
 
-import joblib
+import numpy as np
 import pandas as pd
 
-from .config import DEFAULT_METADATA_PATH, DEFAULT_PREPARED_DAILY_CSV, DEFAULT_WEATHER_CSV
-from .data_loader import build_daily_dataset, normalize_province_name
-from .feature_builder import add_advanced_xgb_features, build_feature_frame, encode_features
+from .cache import TTLCache
+from .config import (
+    DEFAULT_FORECAST_TABLE_PATH,
+    DEFAULT_METADATA_PATH,
+    DEFAULT_PREPARED_DAILY_CSV,
+    DEFAULT_PREPARED_DAILY_NPZ,
+    DEFAULT_WEATHER_CSV,
+)
+from .data_loader import build_daily_dataset, load_columnar_frame, normalize_province_name
+from .feature_builder import FeatureProjector, add_advanced_xgb_features, build_feature_frame
+from .materialize import ForecastTable, dataset_content_key
+from .residual_model import AnchoredXGBRegressor
+from .shared_arrays import share_dataclass_arrays
+from .timing import stage
 
 
 @dataclass
@@ -31,6 +45,16 @@ class ForecastResult:
     forecast: List[ForecastPoint]
 
 
+@dataclass
+class ProvinceFeatures:
+    dates: np.ndarray
+    values: np.ndarray
+
+
+def service_today() -> date:
+    return datetime.now(ZoneInfo("Asia/Bangkok")).date()
+
+
 class ForecastError(Exception):
     def __init__(self, status_code: int, message: str):
         super().__init__(message)
@@ -39,59 +63,191 @@ class ForecastError(Exception):
 
 
 class ForecastService:
-    def __init__(self, metadata_path: Path = DEFAULT_METADATA_PATH):
+    def __init__(
+        self,
+        metadata_path: Path = DEFAULT_METADATA_PATH,
+        result_cache: Optional[TTLCache] = None,
+        preload_models: bool = False,
+        materialized_path: Optional[Path] = DEFAULT_FORECAST_TABLE_PATH,
+        flat_trees: bool = False,
+        on_dataset_change: Optional[Callable[["ForecastService"], None]] = None,
+    ):
         if not metadata_path.exists():
             raise ForecastError(404, "Model metadata not found. Train AI1 first.")
         self.metadata_path = metadata_path
         self.metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+        self.horizons: List[int] = sorted(int(horizon) for horizon in self.metadata.get("horizons", []))
         self.xgboost_models: Dict[int, object] = {}
         self.baseline_models: Dict[int, object] = {}
-        self._load_models()
-
-    def _load_models(self) -> None:
-        for horizon in self.metadata.get("horizons", []):
-            xgb_path = self.metadata_path.parent / f"salinity_day{horizon}.pkl"
-            baseline_path = self.metadata_path.parent / f"baseline_day{horizon}.pkl"
-            if not xgb_path.exists():
-                raise ForecastError(404, f"Missing model file: {xgb_path.name}")
-            if not baseline_path.exists():
-                raise ForecastError(404, f"Missing model file: {baseline_path.name}")
-            try:
-                self.xgboost_models[int(horizon)] = joblib.load(xgb_path)
-                self.baseline_models[int(horizon)] = joblib.load(baseline_path)
-            except Exception as exc:
-                message = str(exc)
-                if "libomp" in message or "Library not loaded" in message or "libxgboost" in message:
-                    raise ForecastError(
-                        500,
-                        "XGBoost Library could not be loaded. Mac users: run `brew install libomp`, then restart ai-service.",
-                    ) from exc
-                raise ForecastError(500, f"Failed to load model artifacts: {message}") from exc
+        self.result_cache = result_cache
+        self.flat_trees = flat_trees
+        self.source_columns = self._resolve_source_columns()
+        self.projectors: Dict[str, FeatureProjector] = {}
+        self._predictors: Dict[str, Dict[int, Callable[[np.ndarray], np.ndarray]]] = {
+            "xgboost": {},
+            "baseline_linear": {},
+        }
+        self._model_lock = threading.Lock()
+        self._feature_lock = threading.Lock()
+        self._feature_signature: Optional[Tuple[Tuple[str, int], ...]] = None
+        self.dataset_key: Optional[str] = None
+        self.on_dataset_change = on_dataset_change
+        self._province_features: Dict[str, ProvinceFeatures] = {}
+        self.materialized_path = materialized_path
+        self._table_lock = threading.Lock()
+        self._table_mtime_ns: Optional[int] = None
+        self._table: Optional[ForecastTable] = None
+        self._check_model_files()
+        self._build_projectors()
+        if preload_models:
+            self.preload_models()
 
-    def _load_daily_dataset(self) -> pd.DataFrame:
+    def _model_artifact_path(self, model_name: str, horizon: int) -> Path:
+        models_dir = self.metadata_path.parent
+        if model_name == "baseline_linear":
+            return models_dir / f"baseline_day{horizon}.pkl"
+
+        pickle_path = models_dir / f"salinity_day{horizon}.pkl"
+        descriptor_path = models_dir / f"salinity_day{horizon}.descriptor.json"
+        # Prefer the native booster unless an older training run left it behind a newer pickle.
+        if descriptor_path.exists() and (
+            not pickle_path.exists() or descriptor_path.stat().st_mtime_ns >= pickle_path.stat().st_mtime_ns
+        ):
+            return descriptor_path
+        return pickle_path
+
+    def _check_model_files(self) -> None:
+        for horizon in self.horizons:
+            for model_name in ("xgboost", "baseline_linear"):
+                path = self._model_artifact_path(model_name, horizon)
+                if not path.exists():
+                    raise ForecastError(404, f"Missing model file: {path.name}")
+
+    def _load_model(self, model_name: str, horizon: int) -> object:
+        path = self._model_artifact_path(model_name, horizon)
+        try:
+            if path.name.endswith(".descriptor.json"):
+                return AnchoredXGBRegressor.load_native(path)
+            # joblib (and the sklearn/xgboost classes it unpickles) is only needed once a pickle is read.
+            import joblib
+
+            return joblib.load(path)
+        except Exception as exc:
+            message = str(exc)
+            if "libomp" in message or "Library not loaded" in message or "libxgboost" in message:
+                raise ForecastError(
+                    500,
+                    "XGBoost Library could not be loaded. Mac users: run `brew install libomp`, then restart ai-service.",
+                ) from exc
+            raise ForecastError(500, f"Failed to load model artifacts: {message}") from exc
+
+    def _get_predictor(self, model_name: str, horizon: int) -> Callable[[np.ndarray], np.ndarray]:
+        """Return the compiled predictor for one horizon, loading its artifact on first use."""
+        predictor = self._predictors[model_name].get(horizon)
+        if predictor is not None:
+            return predictor
+
+        # Load outside the lock so preload_models() can restore artifacts in parallel.
+        model = self._load_model(model_name, horizon)
+        if self.flat_trees and isinstance(model, AnchoredXGBRegressor):
+            model.enable_flat_trees()
+        models = self.baseline_models if model_name == "baseline_linear" else self.xgboost_models
+        with self._model_lock:
+            if horizon not in self._predictors[model_name]:
+                models[horizon] = model
+                self._predictors[model_name][horizon] = _compile_predictor(
+                    model, self.projectors[model_name].columns
+                )
+            return self._predictors[model_name][horizon]
+
+    def preload_models(self, max_workers: Optional[int] = None) -> None:
+        """Load every horizon of both model families concurrently."""
+        jobs = [(model_name, horizon) for horizon in self.horizons for model_name in ("xgboost", "baseline_linear")]
+        if not jobs:
+            return
+        workers = max_workers or min(len(jobs), os.cpu_count() or 1, 8)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai1-model-load") as executor:
+            for _ in executor.map(lambda job: self._get_predictor(*job), jobs):
+                pass
+
+    def share_memory(self) -> int:
+        """Move the feature index, forecast table and flat trees into shared memory; returns bytes moved.
+
+        Call after everything is loaded and before forking workers. A later
+        rebuild, for example after the dataset changes, allocates private
+        arrays again.
+        """
+        moved = 0
+        with self._feature_lock:
+            for province, features in list(self._province_features.items()):
+                self._province_features[province], nbytes = share_dataclass_arrays(features)
+                moved += nbytes
+        with self._table_lock:
+            if self._table is not None:
+                self._table, nbytes = share_dataclass_arrays(self._table)
+                moved += nbytes
+        with self._model_lock:
+            for model in self.xgboost_models.values():
+                if isinstance(model, AnchoredXGBRegressor) and model.flat_trees is not None:
+                    model.flat_trees, nbytes = share_dataclass_arrays(model.flat_trees)
+                    moved += nbytes
+        return moved
+
+    def _resolve_source_columns(self) -> List[str]:
+        columns: List[str] = []
+        for model_name in ("xgboost", "baseline_linear"):
+            numeric_cols, _ = self._resolve_feature_spec(model_name)
+            columns.extend(column for column in numeric_cols if column not in columns)
+        return columns
+
+    def _build_projectors(self) -> None:
+        province_cols = self.metadata.get("province_dummy_columns", [])
+        for model_name in ("xgboost", "baseline_linear"):
+            numeric_cols, expected_cols = self._resolve_feature_spec(model_name)
+            self.projectors[model_name] = FeatureProjector.build(
+                self.source_columns,
+                numeric_cols,
+                expected_cols,
+                province_cols,
+            )
+
+    def _artifact_candidates(self, artifact_key: str, default_path: Path) -> List[Path]:
         artifacts = self.metadata.get("artifacts", {})
-        prepared_raw = artifacts.get("prepared_daily_csv", "")
+        artifact_raw = artifacts.get(artifact_key, "")
 
-        # Try multiple candidates for prepared dataset:
+        # Try multiple candidates for a prepared artifact:
         # 1) Path stored in metadata (may be absolute Windows path or relative)
-        # 2) Default prepared dataset path inside this repo.
-        prepared_candidates = []
-        if prepared_raw:
-            prepared_candidates.append(Path(prepared_raw))
+        # 2) Default artifact path inside this repo.
+        candidates = []
+        if artifact_raw:
+            candidates.append(Path(artifact_raw))
             # Handle Windows-style backslashes stored in metadata when running on POSIX.
-            if "\\" in prepared_raw:
-                prepared_candidates.append(Path(prepared_raw.replace("\\", "/")))
-        prepared_candidates.append(DEFAULT_PREPARED_DAILY_CSV)
+            if "\\" in artifact_raw:
+                candidates.append(Path(artifact_raw.replace("\\", "/")))
+        candidates.append(default_path)
+        return candidates
 
-        for candidate in prepared_candidates:
-            try:
-                if candidate and candidate.exists():
-                    frame = pd.read_csv(candidate)
-                    frame["date"] = pd.to_datetime(frame["date"], errors="coerce").dt.normalize()
-                    return frame
-            except Exception:
-                continue
+    def _prepared_daily_sources(self) -> List[Path]:
+        """Existing prepared daily files in load order: columnar first unless older than the CSV."""
 
+        def _first_existing(candidates: List[Path]) -> Optional[Path]:
+            for candidate in candidates:
+                try:
+                    if candidate and candidate.exists():
+                        return candidate
+                except OSError:
+                    continue
+            return None
+
+        csv_path = _first_existing(self._artifact_candidates("prepared_daily_csv", DEFAULT_PREPARED_DAILY_CSV))
+        npz_path = _first_existing(self._artifact_candidates("prepared_daily_npz", DEFAULT_PREPARED_DAILY_NPZ))
+        sources = [path for path in (npz_path, csv_path) if path is not None]
+        if npz_path is not None and csv_path is not None:
+            if npz_path.stat().st_mtime_ns < csv_path.stat().st_mtime_ns:
+                sources.reverse()
+        return sources
+
+    def _resolve_weather_csv(self) -> Optional[Path]:
         data_sources = self.metadata.get("data_sources", {})
         weather_raw = data_sources.get("weather_csv", "")
 
@@ -103,12 +259,40 @@ class ForecastService:
                 weather_candidates.append(Path(weather_raw.replace("\\", "/")))
         weather_candidates.append(DEFAULT_WEATHER_CSV)
 
-        weather_csv: Optional[Path] = None
         for candidate in weather_candidates:
             if candidate and candidate.exists():
-                weather_csv = candidate
-                break
+                return candidate
+        return None
+
+    def _dataset_signature(self) -> Tuple[Tuple[str, int], ...]:
+        """Identify the files backing the daily dataset by path and mtime."""
+        prepared_sources = self._prepared_daily_sources()
+        if prepared_sources:
+            source = prepared_sources[0]
+            return ((str(source), source.stat().st_mtime_ns),)
+
+        sources: List[Path] = []
+        weather_csv = self._resolve_weather_csv()
+        if weather_csv is not None:
+            sources.append(weather_csv)
+        local_dataset_raw = self.metadata.get("data_sources", {}).get("local_dataset")
+        if local_dataset_raw and Path(local_dataset_raw).exists():
+            sources.append(Path(local_dataset_raw))
+        return tuple((str(path), path.stat().st_mtime_ns) for path in sources)
+
+    def _load_daily_dataset(self) -> pd.DataFrame:
+        for candidate in self._prepared_daily_sources():
+            try:
+                if candidate.suffix == ".npz":
+                    return load_columnar_frame(candidate)
+                frame = pd.read_csv(candidate)
+                frame["date"] = pd.to_datetime(frame["date"], errors="coerce").dt.normalize()
+                return frame
+            except Exception:
+                continue
 
+        data_sources = self.metadata.get("data_sources", {})
+        weather_csv = self._resolve_weather_csv()
         if weather_csv is None:
             raise ForecastError(500, "Weather CSV not found to rebuild inference dataset.")
 
@@ -121,6 +305,66 @@ class ForecastService:
             use_supabase_fallback=use_supabase_fallback,
         )
 
+    def _build_province_features(self) -> Dict[str, ProvinceFeatures]:
+        with stage("load_daily_dataset"):
+            base_daily = self._load_daily_dataset()
+        with stage("build_feature_frame"):
+            feature_frame, feature_cols, _ = build_feature_frame(base_daily, include_targets=False)
+            feature_frame, _ = add_advanced_xgb_features(feature_frame, feature_cols)
+        xgb_numeric_cols = self.metadata.get(
+            "xgboost_numeric_feature_columns",
+            self.metadata.get("numeric_feature_columns", feature_cols),
+        )
+        feature_frame = feature_frame.dropna(subset=["date", *xgb_numeric_cols])
+        source_columns = [column for column in self.source_columns if column in feature_frame.columns]
+        if source_columns != self.source_columns:
+            missing = sorted(set(self.source_columns) - set(source_columns))
+            raise ForecastError(500, f"Inference dataset is missing feature columns: {missing}")
+
+        province_features: Dict[str, ProvinceFeatures] = {}
+        for province, group in feature_frame.groupby("province"):
+            ordered = group.sort_values("date").drop_duplicates(subset=["date"], keep="last")
+            province_features[str(province)] = ProvinceFeatures(
+                dates=ordered["date"].to_numpy(dtype="datetime64[D]"),
+                values=ordered.loc[:, source_columns].to_numpy(dtype=float),
+            )
+        return province_features
+
+    def _ensure_feature_index(self) -> Dict[str, ProvinceFeatures]:
+        """Return per-province feature rows indexed by date, rebuilding only when the dataset changes."""
+        signature = self._dataset_signature()
+        if self._feature_signature == signature and self._province_features:
+            return self._province_features
+        rebuilt = False
+        with self._feature_lock:
+            if self._feature_signature != signature or not self._province_features:
+                self._province_features = self._build_province_features()
+                self.dataset_key = dataset_content_key(Path(path) for path, _ in signature)
+                self._feature_signature = signature
+                rebuilt = True
+                if self.result_cache is not None:
+                    self.result_cache.clear()
+            province_features = self._province_features
+        if rebuilt and self.on_dataset_change is not None:
+            self.on_dataset_change(self)
+        return province_features
+
+    def materialized_table_current(self) -> bool:
+        """Whether the forecast table on disk matches this model version and the loaded dataset."""
+        self._ensure_feature_index()
+        return self._materialized_table() is not None
+
+    def _latest_feature_row(self, province: str, as_of: date) -> Tuple[date, np.ndarray]:
+        """Return the last feature row on or before `as_of` as (row date, values in source_columns order)."""
+        features = self._ensure_feature_index().get(province)
+        if features is None or len(features.dates) == 0:
+            raise ForecastError(422, "Not enough history to build forecast features.")
+
+        position = int(np.searchsorted(features.dates, np.datetime64(as_of, "D"), side="right")) - 1
+        if position < 0:
+            raise ForecastError(422, "No valid data available before as_of.")
+        return features.dates[position].astype(object), features.values[position]
+
     def _resolve_model_name(self, horizon: int, model_set: str) -> str:
         if model_set == "xgboost":
             return "xgboost"
@@ -152,75 +396,243 @@ class ForecastService:
         )
         return list(numeric_cols), list(expected_cols)
 
-    def forecast(
+    def _materialized_table(self) -> Optional[ForecastTable]:
+        """Return the precomputed forecast table if it matches this model version and dataset."""
+        path = self.materialized_path
+        try:
+            mtime_ns = path.stat().st_mtime_ns if path is not None else None
+        except OSError:
+            mtime_ns = None
+        if mtime_ns is None:
+            return None
+        if mtime_ns != self._table_mtime_ns:
+            with self._table_lock:
+                if mtime_ns != self._table_mtime_ns:
+                    try:
+                        self._table = ForecastTable.load(path)
+                    except (OSError, ValueError, KeyError) as exc:
+                        print(f"WARNING: Ignoring forecast table {path}: {exc}")
+                        self._table = None
+                    self._table_mtime_ns = mtime_ns
+
+        table = self._table
+        if table is None or table.horizons != self.horizons:
+            return None
+        if table.model_version != str(self.metadata.get("model_version", "unknown")):
+            return None
+        if self.dataset_key is None or table.dataset_signature != self.dataset_key:
+            return None
+        return table
+
+    def _build_result(
         self,
         province: str,
-        as_of: Optional[str] = None,
-        model_set: str = "champion",
+        as_of: date,
+        model_set: str,
+        predictions: Sequence[float],
     ) -> ForecastResult:
-        normalized_province = normalize_province_name(province or "")
-        if not normalized_province:
-            raise ForecastError(400, "province is required.")
+        points = [
+            ForecastPoint(
+                day_ahead=horizon,
+                date=(as_of + timedelta(days=horizon)).strftime("%Y-%m-%d"),
+                salinity_pred=round(float(value), 4),
+            )
+            for horizon, value in zip(self.horizons, predictions)
+        ]
+        return ForecastResult(
+            province=province,
+            as_of=as_of.strftime("%Y-%m-%d"),
+            model_version=self.metadata.get("model_version", "unknown"),
+            model_set_used=model_set,
+            forecast=points,
+        )
+
+    def _result_cache_key(self, province: str, as_of: date, model_set: str) -> Tuple[str, str, str, str]:
+        return (province, as_of.isoformat(), model_set, str(self.metadata.get("model_version", "unknown")))
+
+    def _normalize_model_set(self, model_set: str) -> str:
         requested_model_set = (model_set or "champion").strip().lower()
         if requested_model_set not in {"champion", "baseline", "xgboost"}:
             raise ForecastError(400, "model_set must be one of: champion, baseline, xgboost.")
+        return requested_model_set
+
+    def _resolve_request(self, province: str, as_of: Optional[str]) -> Tuple[str, date]:
+        normalized_province = normalize_province_name(province or "")
+        if not normalized_province:
+            raise ForecastError(400, "province is required.")
         if normalized_province not in self.metadata.get("provinces", []):
             raise ForecastError(404, f"No model/data for province: {province}")
 
-        base_daily = self._load_daily_dataset()
-        feature_frame, feature_cols, _ = build_feature_frame(base_daily, include_targets=False)
-        feature_frame, _ = add_advanced_xgb_features(feature_frame, feature_cols)
-        province_frame = feature_frame[feature_frame["province"] == normalized_province].copy()
-        xgb_numeric_cols = self.metadata.get(
-            "xgboost_numeric_feature_columns",
-            self.metadata.get("numeric_feature_columns", feature_cols),
-        )
-        province_frame = province_frame.dropna(subset=xgb_numeric_cols)
-        if province_frame.empty:
-            raise ForecastError(422, "Not enough history to build forecast features.")
-
         if as_of:
             try:
                 requested_as_of = pd.to_datetime(as_of).normalize().date()
             except Exception as exc:
                 raise ForecastError(400, "as_of must be YYYY-MM-DD.") from exc
         else:
-            requested_as_of = datetime.now(ZoneInfo("Asia/Bangkok")).date()
+            requested_as_of = service_today()
+        return normalized_province, requested_as_of
 
-        province_frame = province_frame[province_frame["date"].dt.date <= requested_as_of]
-        if province_frame.empty:
-            raise ForecastError(422, "No valid data available before as_of.")
+    def _predict_rows(self, values: np.ndarray, provinces: Sequence[str], model_set: str) -> np.ndarray:
+        """Predict every horizon for feature rows in `source_columns` order; returns (rows, horizons)."""
+        encoded_by_model: Dict[str, np.ndarray] = {}
+        predictions: List[np.ndarray] = []
+        for horizon in self.horizons:
+            model_name = self._resolve_model_name(horizon=horizon, model_set=model_set)
+            if model_name not in encoded_by_model:
+                with stage("encode_features"):
+                    encoded_by_model[model_name] = self.projectors[model_name].project(values, provinces)
+            predictor = self._get_predictor(model_name, horizon)
+            with stage("predict"):
+                predictions.append(np.asarray(predictor(encoded_by_model[model_name]), dtype=float))
+        return np.column_stack(predictions)
 
-        latest_row = province_frame.sort_values("date").iloc[[-1]].copy()
-        province_cols = self.metadata.get("province_dummy_columns", [])
+    def forecast(
+        self,
+        province: str,
+        as_of: Optional[str] = None,
+        model_set: str = "champion",
+        live: bool = False,
+    ) -> ForecastResult:
+        outcome = self.forecast_many([(province, as_of)], model_set=model_set, live=live)[0]
+        if isinstance(outcome, ForecastError):
+            raise outcome
+        return outcome
 
-        points: List[ForecastPoint] = []
-        for horizon in sorted(self.xgboost_models.keys()):
-            model_name = self._resolve_model_name(horizon=int(horizon), model_set=requested_model_set)
-            model = (
-                self.baseline_models[int(horizon)]
-                if model_name == "baseline_linear"
-                else self.xgboost_models[int(horizon)]
+    def forecast_many(
+        self,
+        requests: Sequence[Tuple[str, Optional[str]]],
+        model_set: str = "champion",
+        live: bool = False,
+    ) -> List[Union[ForecastResult, ForecastError]]:
+        """Forecast several (province, as_of) pairs with one predict call per horizon.
+
+        Results keep the order of ``requests``; a request that cannot be served is
+        returned as its ``ForecastError`` instead of failing the whole batch.
+        ``live=True`` skips the result cache and the materialized table so the
+        loaded models always predict.
+        """
+        requested_model_set = self._normalize_model_set(model_set)
+        # Refresh the feature index first so a changed dataset also drops cached results.
+        self._ensure_feature_index()
+        table = self._materialized_table() if requested_model_set == "champion" and not live else None
+
+        outcomes: List[Union[ForecastResult, ForecastError, None]] = [None] * len(requests)
+        resolved: List[Tuple[int, str, date]] = []
+        latest_rows: List[np.ndarray] = []
+        for idx, (province, as_of) in enumerate(requests):
+            try:
+                normalized_province, requested_as_of = self._resolve_request(province, as_of)
+                cache_key = self._result_cache_key(normalized_province, requested_as_of, requested_model_set)
+                cached = self.result_cache.get(cache_key) if self.result_cache is not None and not live else None
+                if cached is not None:
+                    outcomes[idx] = cached
+                    continue
+                materialized = table.lookup(normalized_province, requested_as_of) if table is not None else None
+                if materialized is not None:
+                    outcomes[idx] = self._build_result(
+                        normalized_province, requested_as_of, requested_model_set, materialized
+                    )
+                    continue
+                _, latest_values = self._latest_feature_row(normalized_province, requested_as_of)
+            except ForecastError as exc:
+                outcomes[idx] = exc
+                continue
+            resolved.append((idx, normalized_province, requested_as_of))
+            latest_rows.append(latest_values)
+
+        if resolved:
+            prediction_matrix = self._predict_rows(
+                np.vstack(latest_rows),
+                [province for _, province, _ in resolved],
+                requested_model_set,
             )
-            numeric_cols, expected_cols = self._resolve_feature_spec(model_name)
-            x_latest = encode_features(latest_row, numeric_cols, province_cols)
-            for column in expected_cols:
-                if column not in x_latest.columns:
-                    x_latest[column] = 0
-            x_latest = x_latest[expected_cols]
-            pred = float(model.predict(x_latest)[0])
-            points.append(
-                ForecastPoint(
-                    day_ahead=int(horizon),
-                    date=(requested_as_of + timedelta(days=int(horizon))).strftime("%Y-%m-%d"),
-                    salinity_pred=round(pred, 4),
+
+            for position, (idx, normalized_province, requested_as_of) in enumerate(resolved):
+                result = self._build_result(
+                    normalized_province,
+                    requested_as_of,
+                    requested_model_set,
+                    prediction_matrix[position],
                 )
-            )
+                if self.result_cache is not None:
+                    self.result_cache.set(
+                        self._result_cache_key(normalized_province, requested_as_of, requested_model_set),
+                        result,
+                    )
+                outcomes[idx] = result
 
-        return ForecastResult(
-            province=normalized_province,
-            as_of=requested_as_of.strftime("%Y-%m-%d"),
-            model_version=self.metadata.get("model_version", "unknown"),
-            model_set_used=requested_model_set,
-            forecast=points,
+        return outcomes  # type: ignore[return-value]
+
+    def forecast_range(
+        self,
+        province: str,
+        start: str,
+        end: Optional[str] = None,
+        model_set: str = "champion",
+    ) -> pd.DataFrame:
+        """Return the forecast that would have been issued on each as_of day in [start, end].
+
+        All feature rows are selected in one searchsorted call and every horizon
+        model runs once over the whole block. The result is long format, one row
+        per (as_of, day_ahead). Days before the first usable feature row are
+        skipped.
+        """
+        requested_model_set = self._normalize_model_set(model_set)
+        if not start:
+            raise ForecastError(400, "start is required.")
+        normalized_province, start_date = self._resolve_request(province, start)
+        _, end_date = self._resolve_request(province, end)
+        if end_date < start_date:
+            raise ForecastError(400, "end must not be before start.")
+
+        features = self._ensure_feature_index().get(normalized_province)
+        if features is None or len(features.dates) == 0:
+            raise ForecastError(422, "Not enough history to build forecast features.")
+
+        as_of_dates = np.arange(np.datetime64(start_date, "D"), np.datetime64(end_date, "D") + 1)
+        positions = np.searchsorted(features.dates, as_of_dates, side="right") - 1
+        usable = positions >= 0
+        if not usable.any():
+            raise ForecastError(422, "No valid data available before end.")
+        as_of_dates = as_of_dates[usable]
+        positions = positions[usable]
+
+        predictions = self._predict_rows(
+            features.values[positions],
+            [normalized_province] * len(positions),
+            requested_model_set,
+        )
+        horizons = np.asarray(self.horizons, dtype=np.int64)
+        repeated_as_of = np.repeat(as_of_dates, len(horizons))
+        day_ahead = np.tile(horizons, len(as_of_dates))
+        return pd.DataFrame(
+            {
+                "province": normalized_province,
+                "as_of": pd.to_datetime(repeated_as_of),
+                "feature_date": pd.to_datetime(np.repeat(features.dates[positions], len(horizons))),
+                "day_ahead": day_ahead,
+                "target_date": pd.to_datetime(repeated_as_of + day_ahead.astype("timedelta64[D]")),
+                "salinity_pred": np.round(predictions.ravel(), 4),
+                "model_version": str(self.metadata.get("model_version", "unknown")),
+                "model_set_used": requested_model_set,
+            }
         )
+
+
+def _compile_predictor(model: object, columns: Sequence[str]) -> Callable[[np.ndarray], np.ndarray]:
+    """Bind a loaded model to a predict function over encoded numpy matrices."""
+    columns = list(columns)
+    if isinstance(model, AnchoredXGBRegressor) and model.anchor_column in columns:
+        anchor_index = columns.index(model.anchor_column)
+        return lambda features: model.predict_array(features, anchor_index)
+
+    from sklearn.linear_model import LinearRegression
+
+    fitted_names = getattr(model, "feature_names_in_", None)
+    names_match = fitted_names is None or list(fitted_names) == columns
+    if isinstance(model, LinearRegression) and names_match and np.ndim(model.coef_) == 1:
+        coef = np.asarray(model.coef_, dtype=float)
+        intercept = float(model.intercept_)
+        return lambda features: features @ coef + intercept
+
+    return lambda features: np.asarray(model.predict(pd.DataFrame(features, columns=columns)), dtype=float)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .config import DEFAULT_FORECAST_TABLE_PATH, DEFAULT_METADATA_PATH, FORECAST_TABLE_WINDOW_DAYS
+
+
+if TYPE_CHECKING:
+    from .infer import ForecastService
+
+
+FORECAST_TABLE_FORMAT_VERSION = 1
+
+
+@dataclass
+class ForecastTable:
+    """Precomputed champion forecasts indexed by (province, as_of)."""
+
+    model_version: str
+    dataset_signature: str
+    horizons: List[int]
+    index: Dict[Tuple[str, str], int]
+    predictions: np.ndarray
+
+    def lookup(self, province: str, as_of: date) -> Optional[np.ndarray]:
+        position = self.index.get((province, as_of.isoformat()))
+        if position is None:
+            return None
+        return self.predictions[position]
+
+    @classmethod
+    def load(cls, path: Path) -> "ForecastTable":
+        with np.load(path, allow_pickle=False) as payload:
+            version = int(payload["__version__"])
+            if version != FORECAST_TABLE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported forecast table version {version}: {path}")
+            provinces = payload["provinces"].tolist()
+            as_of_dates = payload["as_of"].astype(str).tolist()
+            return cls(
+                model_version=str(payload["model_version"]),
+                dataset_signature=str(payload["dataset_signature"]),
+                horizons=[int(horizon) for horizon in payload["horizons"]],
+                index={key: position for position, key in enumerate(zip(provinces, as_of_dates))},
+                predictions=np.asarray(payload["predictions"], dtype=float),
+            )
+
+
+def dataset_content_key(paths: Iterable[Path]) -> str:
+    """Identify dataset files by name, size and content hash.
+
+    Paths and mtimes are left out, so a copied or redeployed dataset still
+    matches the table built from it.
+    """
+    entries = []
+    for path in paths:
+        digest = hashlib.sha256()
+        with path.open("rb") as handle:
+            for block in iter(lambda: handle.read(1 << 20), b""):
+                digest.update(block)
+        entries.append([path.name, path.stat().st_size, digest.hexdigest()])
+    return json.dumps(entries)
+
+
+def materialize_forecasts(
+    metadata_path: Path = DEFAULT_METADATA_PATH,
+    output_path: Path = DEFAULT_FORECAST_TABLE_PATH,
+    window_days: int = FORECAST_TABLE_WINDOW_DAYS,
+    end_date: Optional[date] = None,
+    service: Optional["ForecastService"] = None,
+) -> Path:
+    """Compute champion forecasts for every province over the last `window_days` as_of dates.
+
+    The window ends one day after `end_date` (today in the service timezone by
+    default) so the table still covers "today" right after midnight. An
+    already loaded `service` can be passed to reuse its models and feature index.
+    """
+    from .infer import ForecastError, ForecastService, service_today
+
+    if service is None:
+        service = ForecastService(metadata_path=metadata_path, materialized_path=None)
+    last_day = (end_date or service_today()) + timedelta(days=1)
+    as_of_dates = [last_day - timedelta(days=offset) for offset in range(max(window_days, 1), -1, -1)]
+    provinces = list(service.metadata.get("provinces", []))
+    requests = [(province, as_of.isoformat()) for province in provinces for as_of in as_of_dates]
+    outcomes = service.forecast_many(requests, model_set="champion", live=True)
+
+    rows = [outcome for outcome in outcomes if not isinstance(outcome, ForecastError)]
+    predictions = np.asarray(
+        [[point.salinity_pred for point in result.forecast] for result in rows],
+        dtype=float,
+    ).reshape(len(rows), len(service.horizons))
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f"{output_path.stem}.tmp.npz")
+    np.savez(
+        tmp_path,
+        __version__=np.asarray(FORECAST_TABLE_FORMAT_VERSION),
+        model_version=np.asarray(str(service.metadata.get("model_version", "unknown"))),
+        dataset_signature=np.asarray(service.dataset_key),
+        horizons=np.asarray(service.horizons, dtype=np.int32),
+        provinces=np.asarray([result.province for result in rows], dtype=str),
+        as_of=np.asarray([result.as_of for result in rows], dtype="datetime64[D]"),
+        predictions=predictions,
+    )
+    tmp_path.replace(output_path)
+    print(f"[AI1] Materialized {len(rows)} champion forecasts: {output_path}")
+    return output_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute AI1 champion forecasts for recent as_of dates.")
+    parser.add_argument(
+        "--window-days",
+        type=int,
+        default=FORECAST_TABLE_WINDOW_DAYS,
+        help="Number of as_of days before today to materialize.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=DEFAULT_FORECAST_TABLE_PATH,
+        help="Destination .npz table.",
+    )
+    args = parser.parse_args()
+    materialize_forecasts(output_path=args.output, window_days=args.window_days)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class HotSwapLoader(Generic[T]):
+    """Serve one loaded object while replacements are built off the request path.
+
+    A background thread polls `signature()`. When it changes and stays the same
+    for two polls in a row, so a half-written artifact set is not picked up,
+    a new object is built and passed to `validate()`. Only then is it swapped
+    in. Failed builds are logged and the current object keeps serving.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[], T],
+        signature: Callable[[], Hashable],
+        validate: Optional[Callable[[T], None]] = None,
+        on_swap: Optional[Callable[[T], None]] = None,
+        poll_interval: float = 5.0,
+    ):
+        self.name = name
+        self._build = build
+        self._signature = signature
+        self._validate = validate
+        self._on_swap = on_swap
+        self.poll_interval = float(poll_interval)
+        self._current: Optional[Tuple[Hashable, T]] = None
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pending_signature: Optional[Hashable] = None
+        self._failed_signature: Optional[Hashable] = None
+        self.loaded_at: Optional[str] = None
+        self.last_build_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.swaps = 0
+
+    def get(self) -> T:
+        current = self._current
+        if current is not None:
+            return current[1]
+        # Cold start: build once even when many requests arrive together.
+        with self._build_lock:
+            if self._current is None:
+                self._load(self._signature())
+            return self._current[1]  # type: ignore[index]
+
+    def current(self) -> Optional[T]:
+        """The object being served, or None before the first load; never builds."""
+        current = self._current
+        return None if current is None else current[1]
+
+    def reload(self) -> T:
+        """Build, validate and swap synchronously, regardless of the signature."""
+        with self._build_lock:
+            self._load(self._signature())
+            return self._current[1]  # type: ignore[index]
+
+    def poll(self) -> bool:
+        """Check the signature once; returns True when a new object was swapped in."""
+        try:
+            signature = self._signature()
+        except Exception as exc:
+            self.last_error = f"signature failed: {exc}"
+            return False
+
+        if self._current is not None and self._current[0] == signature:
+            self._pending_signature = None
+            return False
+        if signature == self._failed_signature:
+            return False
+        if self._current is not None and self._pending_signature != signature:
+            self._pending_signature = signature
+            return False
+
+        with self._build_lock:
+            if self._current is not None and self._current[0] == signature:
+                return False
+            try:
+                self._load(signature)
+            except Exception as exc:
+                self._failed_signature = signature
+                self.last_error = str(exc)
+                print(f"WARNING: {self.name} reload failed, keeping current version: {exc}")
+                return False
+            finally:
+                self._pending_signature = None
+        return True
+
+    def _load(self, signature: Hashable) -> None:
+        started = time.perf_counter()
+        value = self._build()
+        if self._validate is not None:
+            self._validate(value)
+        self._current = (signature, value)
+        self._failed_signature = None
+        self.last_error = None
+        self.last_build_seconds = round(time.perf_counter() - started, 4)
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.swaps += 1
+        if self._on_swap is not None:
+            self._on_swap(value)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        self.poll()
+        if self.poll_interval <= 0:
+            return
+        while not self._stop.wait(self.poll_interval):
+            self.poll()
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "loaded": self._current is not None,
+            "loaded_at_utc": self.loaded_at,
+            "last_build_seconds": self.last_build_seconds,
+            "swaps": self.swaps,
+            "last_error": self.last_error,
+            "poll_interval_seconds": self.poll_interval,
+        }
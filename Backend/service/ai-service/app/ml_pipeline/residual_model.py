@@ -1,10 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 
+from .tree_eval import FlatTreeEnsemble
+
 
 @dataclass
 class ResidualXGBRegressor:
@@ -27,11 +32,65 @@ class AnchoredXGBRegressor:
     delta_model: object
     delta_scale: float = 1.0
     clip_min: float = 0.0
+    flat_trees: Optional[FlatTreeEnsemble] = field(default=None, repr=False, compare=False)
+
+    def enable_flat_trees(self) -> "AnchoredXGBRegressor":
+        """Evaluate the delta booster with numpy node arrays instead of XGBoost's predict."""
+        self.flat_trees = FlatTreeEnsemble.from_booster(self.delta_model.get_booster())
+        return self
 
     def predict(self, features: pd.DataFrame) -> np.ndarray:
         anchor = np.asarray(features[self.anchor_column], dtype=float)
-        delta = np.asarray(self.delta_model.predict(features), dtype=float)
+        if self.flat_trees is not None:
+            feature_names = getattr(self.delta_model, "feature_names_in_", None)
+            ordered = features[list(feature_names)] if feature_names is not None else features
+            delta = self.flat_trees.predict(ordered.to_numpy(dtype=float))
+        else:
+            delta = np.asarray(self.delta_model.predict(features), dtype=float)
+        return self._combine(anchor, delta)
+
+    def predict_array(self, features: np.ndarray, anchor_index: int) -> np.ndarray:
+        """Predict from an already encoded matrix whose columns follow the training order."""
+        anchor = np.asarray(features[:, anchor_index], dtype=float)
+        if self.flat_trees is not None:
+            delta = self.flat_trees.predict(features)
+        else:
+            delta = np.asarray(self.delta_model.predict(features), dtype=float)
+        return self._combine(anchor, delta)
+
+    def _combine(self, anchor: np.ndarray, delta: np.ndarray) -> np.ndarray:
         combined = anchor + float(self.delta_scale) * delta
         if self.clip_min is not None:
             combined = np.maximum(combined, float(self.clip_min))
         return combined
+
+    def save_native(self, booster_path: Path, descriptor_path: Path) -> None:
+        """Save the delta booster in XGBoost's own format plus a JSON descriptor of the wrapper."""
+        self.delta_model.save_model(str(booster_path))
+        feature_names = getattr(self.delta_model, "feature_names_in_", None)
+        descriptor = {
+            "format": "anchored_xgb",
+            "format_version": 1,
+            "booster_file": booster_path.name,
+            "anchor_column": self.anchor_column,
+            "delta_scale": float(self.delta_scale),
+            "clip_min": None if self.clip_min is None else float(self.clip_min),
+            "feature_columns": [str(name) for name in feature_names] if feature_names is not None else None,
+        }
+        descriptor_path.write_text(json.dumps(descriptor, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load_native(cls, descriptor_path: Path) -> "AnchoredXGBRegressor":
+        from xgboost import XGBRegressor
+
+        descriptor = json.loads(descriptor_path.read_text(encoding="utf-8"))
+        if descriptor.get("format") != "anchored_xgb":
+            raise ValueError(f"Unsupported model descriptor: {descriptor_path.name}")
+        delta_model = XGBRegressor()
+        delta_model.load_model(str(descriptor_path.parent / descriptor["booster_file"]))
+        return cls(
+            anchor_column=str(descriptor["anchor_column"]),
+            delta_model=delta_model,
+            delta_scale=float(descriptor.get("delta_scale", 1.0)),
+            clip_min=descriptor.get("clip_min"),
+        )
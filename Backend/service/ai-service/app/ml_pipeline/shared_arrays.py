@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import dataclasses
+import mmap
+from typing import Any, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+def is_shared(array: np.ndarray) -> bool:
+    base = array
+    while isinstance(base, np.ndarray):
+        base = base.base
+    if isinstance(base, memoryview):
+        base = base.obj
+    return isinstance(base, mmap.mmap)
+
+
+def share_array(array: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Copy `array` into an anonymous shared mapping; returns (read-only view, bytes moved).
+
+    The mapping is MAP_SHARED, so processes forked afterwards read the same
+    physical pages. Those pages are also outside the Python heap, so refcount
+    and GC writes to objects never copy them. Object arrays and arrays that are
+    already shared are returned unchanged.
+    """
+    if array.dtype.hasobject or array.nbytes == 0 or is_shared(array):
+        return array, 0
+    buffer = mmap.mmap(-1, array.nbytes)
+    shared = np.frombuffer(buffer, dtype=array.dtype, count=array.size).reshape(array.shape)
+    shared[...] = array
+    shared.flags.writeable = False
+    return shared, array.nbytes
+
+
+def share_dataclass_arrays(value: T) -> Tuple[T, int]:
+    """Return a copy of dataclass `value` with every numpy field moved to shared memory."""
+    changes = {}
+    moved = 0
+    for field in dataclasses.fields(value):
+        current: Any = getattr(value, field.name)
+        if isinstance(current, np.ndarray):
+            changes[field.name], nbytes = share_array(current)
+            moved += nbytes
+    return (dataclasses.replace(value, **changes) if changes else value), moved
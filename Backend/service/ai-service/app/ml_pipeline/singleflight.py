@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Let concurrent callers with the same key share one in-flight computation.
+
+    The first caller for a key (the leader) runs the work; callers arriving
+    before it finishes wait for the same result or exception. `do` serves
+    threadpool code and `do_async` serves coroutines. Both share the same
+    in-flight table, so a sync and an async caller can coalesce with each other.
+    """
+
+    def __init__(self, max_tracked_keys: int = 256):
+        self.max_tracked_keys = int(max_tracked_keys)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._key_stats: "OrderedDict[Hashable, Dict[str, float]]" = OrderedDict()
+        self.executions = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._in_flight.get(key)
+            stats = self._key_stats.get(key)
+            if stats is None:
+                stats = {"executions": 0, "coalesced": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+                self._key_stats[key] = stats
+                while len(self._key_stats) > self.max_tracked_keys:
+                    self._key_stats.popitem(last=False)
+            else:
+                self._key_stats.move_to_end(key)
+            if future is not None:
+                self.coalesced += 1
+                stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self.executions += 1
+            stats["executions"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _record_wait(self, key: Hashable, seconds: float) -> None:
+        with self._lock:
+            stats = self._key_stats.get(key)
+            if stats is not None:
+                stats["wait_seconds"] += seconds
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"], seconds)
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        future, leader = self._join(key)
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as exc:
+                future.set_exception(exc)
+            finally:
+                self._finish(key, future)
+            return future.result()
+
+        started = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            self._record_wait(key, time.perf_counter() - started)
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future, leader = self._join(key)
+        if leader:
+            # Run the work as its own task so a cancelled leader request does not
+            # cancel the result its followers are waiting for.
+            task = asyncio.ensure_future(fn())
+
+            def _transfer(done: "asyncio.Future[T]") -> None:
+                if done.cancelled():
+                    future.set_exception(asyncio.CancelledError())
+                elif done.exception() is not None:
+                    future.set_exception(done.exception())
+                else:
+                    future.set_result(done.result())
+                self._finish(key, future)
+
+            task.add_done_callback(_transfer)
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        started = time.perf_counter()
+        try:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        finally:
+            self._record_wait(key, time.perf_counter() - started)
+
+    def stats(self, top: int = 20) -> Dict[str, object]:
+        with self._lock:
+            keys: List[Dict[str, object]] = [
+                {
+                    "key": list(key) if isinstance(key, tuple) else key,
+                    "executions": int(values["executions"]),
+                    "coalesced": int(values["coalesced"]),
+                    "avg_wait_ms": round(1000 * values["wait_seconds"] / values["coalesced"], 3)
+                    if values["coalesced"]
+                    else 0.0,
+                    "max_wait_ms": round(1000 * values["max_wait_seconds"], 3),
+                }
+                for key, values in self._key_stats.items()
+            ]
+            total = self.executions + self.coalesced
+            summary = {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+                "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+            }
+        keys.sort(key=lambda item: item["coalesced"], reverse=True)
+        summary["keys"] = keys[:top]
+        return summary
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import bisect
+import functools
+import inspect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+BACKGROUND_ENDPOINT = "background"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_float(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """A labelled, cumulative-bucket histogram rendered in Prometheus text format.
+
+    `observe` costs one bisect and a few additions under a lock, so it is
+    cheap enough to leave on for every request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Tuple[str, ...], seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[labels] = series
+            series[0][index] += 1
+            series[1][0] += seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        with self._lock:
+            return {labels: (list(counts), total[0]) for labels, (counts, total) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.snapshot().items()):
+            label_text = ",".join(
+                f'{name}="{_escape_label(value)}"' for name, value in zip(self.label_names, labels)
+            )
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format_float(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {_format_float(total)}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A labelled gauge, for one-off values such as startup durations."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            label_text = ",".join(
+                f'{name}="{_escape_label(label)}"' for name, label in zip(self.label_names, labels)
+            )
+            lines.append(f"{self.name}{{{label_text}}} {_format_float(value)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "ai_service_stage_duration_seconds",
+    "Time spent in one stage of request handling.",
+    ("endpoint", "stage"),
+)
+REQUEST_SECONDS = Histogram(
+    "ai_service_request_duration_seconds",
+    "End-to-end HTTP request handling time.",
+    ("endpoint", "method", "status"),
+)
+STARTUP_SECONDS = Gauge(
+    "ai_service_startup_seconds",
+    "Seconds spent in each startup phase of the current process.",
+    ("phase",),
+)
+METRICS: List[Any] = [REQUEST_SECONDS, STAGE_SECONDS, STARTUP_SECONDS]
+
+
+def _endpoint_label(scope: Dict[str, Any]) -> str:
+    # The route template keeps label cardinality bounded; raw paths carry ids.
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else "unmatched"
+
+
+class RequestTimings:
+    """Stage durations collected for the request in the current context."""
+
+    __slots__ = ("scope", "stages")
+
+    def __init__(self, scope: Dict[str, Any]):
+        self.scope = scope
+        self.stages: List[Tuple[str, float]] = []
+
+    @property
+    def endpoint(self) -> str:
+        return _endpoint_label(self.scope)
+
+    def server_timing(self, total_seconds: float) -> str:
+        totals: Dict[str, float] = {}
+        for stage, seconds in list(self.stages):
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Thread-pool calls made through run_in_threadpool/asyncio.to_thread copy the
+# context, so stages timed in worker threads still land on their request.
+_current_request: ContextVar[Optional[RequestTimings]] = ContextVar("ai_service_request_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    current = _current_request.get()
+    endpoint = current.endpoint if current is not None else BACKGROUND_ENDPOINT
+    STAGE_SECONDS.observe((endpoint, stage), seconds)
+    if current is not None:
+        current.stages.append((stage, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage `name` of the current request."""
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, perf_counter() - started)
+
+
+def timed(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator form of `stage` for sync and async functions."""
+
+    def decorate(func: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with stage(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+class TimingMiddleware:
+    """ASGI middleware that records request latency and collects stage timings.
+
+    With `server_timing` enabled, the collected stages are also returned in a
+    `Server-Timing` header. Stages that finish after the response has started,
+    such as streamed bodies, only reach the histograms.
+    """
+
+    def __init__(self, app: Callable[..., Any], server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(scope)
+        token = _current_request.set(timings)
+        started = perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = timings.server_timing(perf_counter() - started).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_request.reset(token)
+            REQUEST_SECONDS.observe((timings.endpoint, scope["method"], str(status)), perf_counter() - started)
+
+
+def render_metrics(metrics: Sequence[Any] = ()) -> str:
+    return "\n".join(line for metric in (metrics or METRICS) for line in metric.render()) + "\n"
@@ -22,15 +22,18 @@ from .config import (
     DEFAULT_ACCEPTANCE_RULES,
     DEFAULT_ACCEPTANCE_THRESHOLD_PCT,
     DEFAULT_ERROR_TOLERANCE_PPT,
+    DEFAULT_FORECAST_TABLE_PATH,
     DEFAULT_LSTM_METRICS_CSV,
     DEFAULT_METADATA_PATH,
     DEFAULT_METRICS_CSV,
     DEFAULT_PREDICTIONS_CSV,
     DEFAULT_PREPARED_DAILY_CSV,
+    DEFAULT_PREPARED_DAILY_NPZ,
     DEFAULT_REGRESSION_CHECK_CSV,
     DEFAULT_REPORT_PATH,
     DEFAULT_THRESHOLD_METRICS_CSV,
     DEFAULT_TRAIN_FEATURES_CSV,
+    DEFAULT_TRAIN_FEATURES_NPZ,
     DEFAULT_WEATHER_CSV,
     FORECAST_HORIZONS,
     LSTM_DROPOUTS,
@@ -47,7 +50,7 @@ from .config import (
     grid_product,
 )
 from .data_loader import build_daily_dataset
-from .data_loader import load_local_combined_csv, load_salinity_json_folder
+from .data_loader import load_local_combined_csv, load_salinity_json_folder, save_columnar_frame
 from .evaluate import (
     build_rolling_origin_windows,
     choose_champion_by_policy,
@@ -66,6 +69,7 @@ from .feature_builder import (
     province_dummy_columns,
     time_series_split,
 )
+from .materialize import materialize_forecasts
 from .report import (
     build_report_markdown,
     generate_actual_vs_pred_charts,
@@ -286,6 +290,10 @@ def _train_holdout_models(
         model_path = MODELS_DIR / f"salinity_day{horizon}.pkl"
         joblib.dump(baseline, baseline_path)
         joblib.dump(best_model, model_path)
+        best_model.save_native(
+            booster_path=MODELS_DIR / f"salinity_day{horizon}.ubj",
+            descriptor_path=MODELS_DIR / f"salinity_day{horizon}.descriptor.json",
+        )
         best_settings_map[f"day{horizon}"] = best_settings
         print(f"[AI1] Saved models for day{horizon}: {model_path.name}, {baseline_path.name}")
 
@@ -718,7 +726,10 @@ def run_training(
         use_supabase_fallback=use_supabase_fallback,
     )
     daily_df.to_csv(DEFAULT_PREPARED_DAILY_CSV, index=False)
-    print(f"[AI1] Saved prepared daily dataset: {DEFAULT_PREPARED_DAILY_CSV}")
+    # Inference rebuilds lag/rolling features from this table, so keep float64 to
+    # reproduce the CSV-derived features exactly; tree splits are sensitive to it.
+    save_columnar_frame(daily_df, DEFAULT_PREPARED_DAILY_NPZ, float_dtype="float64")
+    print(f"[AI1] Saved prepared daily dataset: {DEFAULT_PREPARED_DAILY_CSV}, {DEFAULT_PREPARED_DAILY_NPZ.name}")
 
     feature_frame, baseline_feature_cols, target_cols = build_feature_frame(daily_df, include_targets=True)
     feature_frame, xgb_feature_cols = add_advanced_xgb_features(feature_frame, baseline_feature_cols)
@@ -735,7 +746,8 @@ def run_training(
     provinces = sorted(train_frame["province"].unique())
     province_cols = province_dummy_columns(provinces)
     train_frame.to_csv(DEFAULT_TRAIN_FEATURES_CSV, index=False)
-    print(f"[AI1] Saved training feature dataset: {DEFAULT_TRAIN_FEATURES_CSV}")
+    save_columnar_frame(train_frame, DEFAULT_TRAIN_FEATURES_NPZ)
+    print(f"[AI1] Saved training feature dataset: {DEFAULT_TRAIN_FEATURES_CSV}, {DEFAULT_TRAIN_FEATURES_NPZ.name}")
 
     xgb_param_candidates = _quick_xgb_candidates() if quick_mode else list(grid_product(XGB_PARAM_GRID))
     (
@@ -859,7 +871,9 @@ def run_training(
         },
         "artifacts": {
             "prepared_daily_csv": str(DEFAULT_PREPARED_DAILY_CSV),
+            "prepared_daily_npz": str(DEFAULT_PREPARED_DAILY_NPZ),
             "train_feature_csv": str(DEFAULT_TRAIN_FEATURES_CSV),
+            "train_feature_npz": str(DEFAULT_TRAIN_FEATURES_NPZ),
             "metrics_csv": str(DEFAULT_METRICS_CSV),
             "predictions_csv": str(DEFAULT_PREDICTIONS_CSV),
             "backtest_metrics_csv": str(DEFAULT_BACKTEST_METRICS_CSV),
@@ -868,6 +882,7 @@ def run_training(
             "threshold_metrics_csv": str(DEFAULT_THRESHOLD_METRICS_CSV),
             "acceptance_summary_csv": str(DEFAULT_ACCEPTANCE_SUMMARY_CSV),
             "report_path": str(DEFAULT_REPORT_PATH),
+            "forecast_table": str(DEFAULT_FORECAST_TABLE_PATH),
         },
         "data_sources": {
             "weather_csv": str(weather_csv),
@@ -898,6 +913,8 @@ def run_training(
     write_report(markdown, DEFAULT_REPORT_PATH)
     print(f"[AI1] Report generated: {DEFAULT_REPORT_PATH}")
 
+    materialize_forecasts(metadata_path=DEFAULT_METADATA_PATH, output_path=DEFAULT_FORECAST_TABLE_PATH)
+
     return metadata
 
 
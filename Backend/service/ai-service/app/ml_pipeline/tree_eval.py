@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class FlatTreeEnsemble:
+    """XGBoost regression trees flattened into numpy node arrays.
+
+    Nodes of all trees share one set of arrays addressed by a global index.
+    Leaves point to themselves on both sides, so every row can step through
+    `depth` levels in lockstep without checking whether it reached a leaf.
+    """
+
+    feature: np.ndarray
+    threshold: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    default_left: np.ndarray
+    leaf_value: np.ndarray
+    roots: np.ndarray
+    base_score: float
+    depth: int
+
+    @classmethod
+    def from_booster(cls, booster: object) -> "FlatTreeEnsemble":
+        model = json.loads(booster.save_raw(raw_format="json"))
+        learner = model["learner"]
+        objective = learner.get("objective", {}).get("name")
+        if objective != "reg:squarederror":
+            raise ValueError(f"Unsupported objective for flat tree evaluation: {objective}")
+        model_param = learner.get("learner_model_param", {})
+        if int(model_param.get("num_target", "1")) != 1:
+            raise ValueError("Flat tree evaluation supports single-target boosters only.")
+        gradient_booster = learner["gradient_booster"]
+        if gradient_booster.get("name") != "gbtree":
+            raise ValueError(f"Unsupported booster type: {gradient_booster.get('name')}")
+
+        features: List[np.ndarray] = []
+        thresholds: List[np.ndarray] = []
+        lefts: List[np.ndarray] = []
+        rights: List[np.ndarray] = []
+        defaults: List[np.ndarray] = []
+        leaf_values: List[np.ndarray] = []
+        roots: List[int] = []
+        depth = 0
+        offset = 0
+        for tree in gradient_booster["model"]["trees"]:
+            if any(int(split_type) != 0 for split_type in tree.get("split_type", [])):
+                raise ValueError("Categorical splits are not supported by flat tree evaluation.")
+            left = np.asarray(tree["left_children"], dtype=np.int64)
+            right = np.asarray(tree["right_children"], dtype=np.int64)
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            is_leaf = left == -1
+            local = np.arange(len(left), dtype=np.int64)
+
+            features.append(np.where(is_leaf, 0, np.asarray(tree["split_indices"], dtype=np.int64)))
+            # Leaves store their value in split_conditions.
+            thresholds.append(np.where(is_leaf, np.float32(0.0), conditions))
+            leaf_values.append(np.where(is_leaf, conditions, np.float32(0.0)))
+            lefts.append(np.where(is_leaf, local, left) + offset)
+            rights.append(np.where(is_leaf, local, right) + offset)
+            defaults.append(np.asarray(tree["default_left"], dtype=bool))
+            roots.append(offset)
+            depth = max(depth, _tree_depth(left, right))
+            offset += len(left)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float32),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            default_left=np.concatenate(defaults),
+            leaf_value=np.concatenate(leaf_values).astype(np.float32),
+            roots=np.asarray(roots, dtype=np.intp),
+            base_score=float(str(model_param.get("base_score", "0")).strip("[]")),
+            depth=depth,
+        )
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        # XGBoost compares float32 inputs against float32 thresholds; do the same.
+        values = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        rows = np.arange(values.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (values.shape[0], self.roots.shape[0]))
+        for _ in range(self.depth):
+            split_values = values[rows, self.feature[nodes]]
+            go_left = np.where(
+                np.isnan(split_values),
+                self.default_left[nodes],
+                split_values < self.threshold[nodes],
+            )
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.leaf_value[nodes].sum(axis=1, dtype=np.float64) + self.base_score
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    depth = 0
+    stack = [(0, 0)]
+    while stack:
+        node, level = stack.pop()
+        if left[node] == -1:
+            depth = max(depth, level)
+            continue
+        stack.append((int(left[node]), level + 1))
+        stack.append((int(right[node]), level + 1))
+    return depth
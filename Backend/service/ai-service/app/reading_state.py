@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+READING_COLUMNS = "device_id,salinity,ph,temperature,timestamp"
+
+
+def _timestamp_ns(value: Any) -> Optional[int]:
+    """UTC nanoseconds for a reading timestamp; naive values are taken as UTC."""
+    try:
+        stamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return None
+    if stamp is pd.NaT:
+        return None
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize("UTC")
+    return int(stamp.value)
+
+
+def _as_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class DeviceRingBuffer:
+    """The latest `capacity` valid readings of one device, oldest first.
+
+    Appending a reading newer than the current newest is O(1): it overwrites
+    the oldest slot. Late or duplicate readings (same timestamp) take a slow
+    path that re-sorts the few buffered rows. The newest pH among evicted rows
+    is remembered, so `rows` can carry pH forward as if the full history were
+    still there.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = int(capacity)
+        self._timestamps = np.zeros(self.capacity, dtype=np.int64)
+        self._values = np.full((self.capacity, 3), np.nan)  # salinity, temperature, ph
+        self._head = 0
+        self._count = 0
+        self._evicted_ph = math.nan
+        self._evicted_ph_timestamp = -1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _ordered_slots(self) -> np.ndarray:
+        return (self._head - self._count + np.arange(self._count)) % self.capacity
+
+    def _evict(self, timestamp_ns: int, ph: float) -> None:
+        if not math.isnan(ph) and timestamp_ns > self._evicted_ph_timestamp:
+            self._evicted_ph = ph
+            self._evicted_ph_timestamp = timestamp_ns
+
+    def append(self, timestamp_ns: int, salinity: float, temperature: float, ph: float) -> None:
+        if self._count and timestamp_ns <= self._timestamps[(self._head - 1) % self.capacity]:
+            self._insert_out_of_order(timestamp_ns, salinity, temperature, ph)
+            return
+        if self._count == self.capacity:
+            self._evict(int(self._timestamps[self._head]), float(self._values[self._head, 2]))
+        self._timestamps[self._head] = timestamp_ns
+        self._values[self._head] = (salinity, temperature, ph)
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _insert_out_of_order(self, timestamp_ns: int, salinity: float, temperature: float, ph: float) -> None:
+        slots = self._ordered_slots()
+        timestamps = self._timestamps[slots]
+        values = self._values[slots]
+        keep = timestamps != timestamp_ns
+        position = int(np.searchsorted(timestamps[keep], timestamp_ns))
+        timestamps = np.insert(timestamps[keep], position, timestamp_ns)
+        values = np.insert(values[keep], position, (salinity, temperature, ph), axis=0)
+        for idx in range(len(timestamps) - self.capacity):
+            self._evict(int(timestamps[idx]), float(values[idx, 2]))
+        timestamps = timestamps[-self.capacity :]
+        values = values[-self.capacity :]
+        self._count = len(timestamps)
+        self._timestamps[: self._count] = timestamps
+        self._values[: self._count] = values
+        self._head = self._count % self.capacity
+
+    def rows(self) -> tuple[np.ndarray, np.ndarray]:
+        """Timestamps and (salinity, temperature, ph) rows, with missing pH carried forward."""
+        slots = self._ordered_slots()
+        values = self._values[slots]
+        ph = values[:, 2]
+        observed = np.where(np.isnan(ph), -1, np.arange(len(ph)))
+        last_observed = np.maximum.accumulate(observed) if len(ph) else observed
+        values[:, 2] = np.where(last_observed >= 0, ph[np.maximum(last_observed, 0)], self._evicted_ph)
+        return self._timestamps[slots], values
+
+
+class ReadingStateStore:
+    """In-process ring buffers of recent sensor readings, keyed by device id.
+
+    AI2 features only look at the last few readings of a farm, so a buffer of
+    `capacity` readings per device is enough to rebuild them exactly. Buffers
+    are filled by `ingest` (the readings ingest endpoint) and by `seed` after a
+    bounded query for devices that are cold. A device counts as cold until it
+    has been seeded, and again once `max_age_seconds` pass without a seed or an
+    ingest, so readings written to Supabase by other paths are picked up
+    within that window. State is per process; every worker warms up on its own.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 16,
+        max_age_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = int(capacity)
+        self.max_age_seconds = float(max_age_seconds)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, DeviceRingBuffer] = {}
+        self._refreshed_at: Dict[str, float] = {}
+        self.ingested = 0
+        self.rejected = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _append_rows(self, rows: Iterable[Dict[str, Any]]) -> List[str]:
+        touched: List[str] = []
+        for row in rows:
+            device_id = str(row.get("device_id") or "")
+            timestamp_ns = _timestamp_ns(row.get("timestamp"))
+            salinity = _as_float(row.get("salinity"))
+            temperature = _as_float(row.get("temperature"))
+            if not device_id or timestamp_ns is None or math.isnan(salinity) or math.isnan(temperature):
+                self.rejected += 1
+                continue
+            buffer = self._buffers.get(device_id)
+            if buffer is None:
+                buffer = DeviceRingBuffer(self.capacity)
+                self._buffers[device_id] = buffer
+            buffer.append(timestamp_ns, salinity, temperature, _as_float(row.get("ph")))
+            touched.append(device_id)
+        return touched
+
+    def ingest(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Append new readings; returns how many were accepted.
+
+        Ingest keeps an already seeded device warm but does not warm a cold
+        one, because its older history is still unknown.
+        """
+        with self._lock:
+            touched = self._append_rows(rows)
+            now = self._clock()
+            for device_id in set(touched):
+                if device_id in self._refreshed_at:
+                    self._refreshed_at[device_id] = now
+            self.ingested += len(touched)
+            return len(touched)
+
+    def seed(self, device_ids: Sequence[str], rows: Iterable[Dict[str, Any]]) -> None:
+        """Merge queried readings into the buffers and mark `device_ids` warm."""
+        # Oldest first, so every row takes the in-order append path.
+        ordered = sorted(rows, key=lambda row: _timestamp_ns(row.get("timestamp")) or 0)
+        with self._lock:
+            self._append_rows(ordered)
+            now = self._clock()
+            for device_id in device_ids:
+                self._buffers.setdefault(str(device_id), DeviceRingBuffer(self.capacity))
+                self._refreshed_at[str(device_id)] = now
+
+    def cold_devices(self, device_ids: Sequence[str]) -> List[str]:
+        with self._lock:
+            now = self._clock()
+            cold = [
+                str(device_id)
+                for device_id in device_ids
+                if now - self._refreshed_at.get(str(device_id), -math.inf) > self.max_age_seconds
+            ]
+            self.misses += len(cold)
+            self.hits += len(device_ids) - len(cold)
+            return cold
+
+    def frame(self, device_ids: Sequence[str]) -> pd.DataFrame:
+        """Buffered readings of `device_ids` in long format, ready for the AI2 feature builder."""
+        ids: List[str] = []
+        timestamps: List[np.ndarray] = []
+        values: List[np.ndarray] = []
+        with self._lock:
+            for device_id in dict.fromkeys(str(item) for item in device_ids):
+                buffer = self._buffers.get(device_id)
+                if buffer is None or not len(buffer):
+                    continue
+                device_timestamps, device_values = buffer.rows()
+                ids.extend([device_id] * len(device_timestamps))
+                timestamps.append(device_timestamps)
+                values.append(device_values)
+        if not ids:
+            return pd.DataFrame(columns=["device_id", "timestamp", "salinity", "temperature", "ph"])
+        stacked = np.concatenate(values)
+        return pd.DataFrame(
+            {
+                "device_id": ids,
+                "timestamp": pd.to_datetime(np.concatenate(timestamps), utc=True),
+                "salinity": stacked[:, 0],
+                "temperature": stacked[:, 1],
+                "ph": stacked[:, 2],
+            }
+        )
+
+    def invalidate(self, device_ids: Optional[Iterable[str]] = None) -> int:
+        """Drop the given devices, or every device when `device_ids` is None; returns the count dropped."""
+        with self._lock:
+            if device_ids is None:
+                dropped = len(self._buffers)
+                self._buffers.clear()
+                self._refreshed_at.clear()
+                return dropped
+            dropped = 0
+            for device_id in set(str(item) for item in device_ids):
+                self._refreshed_at.pop(device_id, None)
+                if self._buffers.pop(device_id, None) is not None:
+                    dropped += 1
+            return dropped
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            now = self._clock()
+            lookups = self.hits + self.misses
+            return {
+                "devices": len(self._buffers),
+                "warm_devices": sum(
+                    1 for refreshed in self._refreshed_at.values() if now - refreshed <= self.max_age_seconds
+                ),
+                "capacity": self.capacity,
+                "max_age_seconds": self.max_age_seconds,
+                "ingested": self.ingested,
+                "rejected": self.rejected,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+
+
+def file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    signature: Optional[Tuple[int, int]]
+    body: bytes
+    etag: str
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/"x" and "x" match.
+    candidates = [item.strip() for item in if_none_match.split(",")]
+    return "*" in candidates or any(item.removeprefix("W/") == etag for item in candidates)
+
+
+class FileResponseCache:
+    """Pre-serialized JSON bodies for endpoints that render a file on disk.
+
+    An entry is reused while the file's (mtime, size) signature is unchanged,
+    so a report rewritten by training is picked up on the next request. Each
+    body carries a content-hash ETag. A request whose If-None-Match still
+    matches gets an empty 304 reply.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, CachedBody] = {}
+        self.hits = 0
+        self.renders = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable, path: Path, render: Callable[[Path], Any]) -> CachedBody:
+        signature = file_signature(path)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached.signature == signature:
+                self.hits += 1
+                return cached
+        # Same encoding as FastAPI's JSONResponse.
+        body = json.dumps(
+            render(path), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+        entry = CachedBody(signature=signature, body=body, etag=f'"{hashlib.sha1(body).hexdigest()}"')
+        with self._lock:
+            self._entries[key] = entry
+            self.renders += 1
+        return entry
+
+    def respond(self, request: Request, key: Hashable, path: Path, render: Callable[[Path], Any]) -> Response:
+        entry = self.get(key, path, render)
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, entry.etag):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "renders": self.renders,
+                "not_modified": self.not_modified,
+            }
@@ -0,0 +1,122 @@
+"""Pre-fork server: load models once, then fork uvicorn workers that share them.
+
+Run with `python -m app.serve`. The parent imports the app and loads the AI1
+service, the AI2 bundle and the feature index. Large numeric arrays go into
+shared memory. The parent then freezes the GC and forks `AI_WORKERS` workers
+on one listening socket. Workers share the loaded pages copy-on-write instead
+of each loading its own copy. The parent only supervises: it restarts workers
+that die and forwards SIGTERM/SIGINT on shutdown.
+"""
+from __future__ import annotations
+
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+_SERVICE_ROOT = Path(__file__).resolve().parent.parent
+if str(_SERVICE_ROOT) not in sys.path:
+    sys.path.insert(0, str(_SERVICE_ROOT))
+
+# A worker that exits sooner than this after starting is not restarted
+# immediately, so a crash loop does not spin the CPU.
+RESPAWN_BACKOFF_SECONDS = 1.0
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    from app import main as service
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    service.after_fork_in_worker()
+    config = uvicorn.Config(service.app, lifespan="on", log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, log_level)
+        except BaseException as exc:
+            print(f"ERROR: worker {os.getpid()} crashed: {exc}", file=sys.stderr)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info") -> None:
+    from app import main as service
+
+    summary = service.preload_for_workers()
+    for name, error in summary["errors"].items():
+        print(f"WARNING: preload of {name} failed, workers will retry: {error}")
+    print(
+        f"Preloaded models; {summary['forecast_shared_bytes'] / 1e6:.1f} MB of arrays in shared memory. "
+        f"Starting {workers} workers on {host}:{port}."
+    )
+    # Objects loaded so far are never collected; keeping the GC off them stops
+    # collections in the workers from writing to, and so copying, shared pages.
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind_socket(host, port)
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def _shutdown(signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    for _ in range(max(1, workers)):
+        children[_spawn(sock, log_level)] = time.monotonic()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        print(f"WARNING: worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting.")
+        if time.monotonic() - started < RESPAWN_BACKOFF_SECONDS:
+            time.sleep(RESPAWN_BACKOFF_SECONDS)
+        if not stopping:
+            children[_spawn(sock, log_level)] = time.monotonic()
+    sock.close()
+
+
+if __name__ == "__main__":
+    serve(
+        host=os.environ.get("AI_HOST", "0.0.0.0"),
+        port=int(os.environ.get("AI_PORT", "8000")),
+        workers=int(os.environ.get("AI_WORKERS", os.environ.get("WEB_CONCURRENCY", "2"))),
+        log_level=os.environ.get("AI_LOG_LEVEL", "info"),
+    )
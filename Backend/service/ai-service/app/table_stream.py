@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import base64
+import csv
+import io
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.report_cache import file_signature
+
+
+class CursorError(ValueError):
+    """A page cursor issued for an older version of the file."""
+
+
+def encode_cursor(offset: int, signature: Optional[Tuple[int, int]]) -> str:
+    raw = json.dumps({"o": offset, "s": list(signature) if signature else None}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, signature: Optional[Tuple[int, int]]) -> int:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(payload["o"])
+        cursor_signature = payload.get("s")
+    except (ValueError, KeyError, TypeError) as exc:
+        raise ValueError("Invalid cursor.") from exc
+    if cursor_signature != (list(signature) if signature else None):
+        raise CursorError("The table changed since this cursor was issued; start again without a cursor.")
+    return offset
+
+
+@dataclass(frozen=True)
+class RowFilter:
+    """Equality filters on named columns plus an inclusive ISO date range."""
+
+    equals: Tuple[Tuple[str, str], ...] = ()
+    date_column: str = "date"
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+
+    def compile(self, header: Sequence[str]) -> "_CompiledFilter":
+        positions = {name: idx for idx, name in enumerate(header)}
+        missing = [name for name, _ in self.equals if name not in positions]
+        if missing:
+            raise ValueError(f"Unknown filter columns: {missing}")
+        date_position = positions.get(self.date_column)
+        if (self.date_from or self.date_to) and date_position is None:
+            raise ValueError(f"Table has no {self.date_column} column to filter on.")
+        return _CompiledFilter(
+            equals=tuple((positions[name], value) for name, value in self.equals),
+            date_position=date_position,
+            date_from=self.date_from,
+            date_to=self.date_to,
+        )
+
+
+@dataclass(frozen=True)
+class _CompiledFilter:
+    equals: Tuple[Tuple[int, str], ...]
+    date_position: Optional[int]
+    date_from: Optional[str]
+    date_to: Optional[str]
+
+    def __call__(self, row: Sequence[str]) -> bool:
+        for position, value in self.equals:
+            if position >= len(row) or row[position] != value:
+                return False
+        if self.date_position is not None and (self.date_from or self.date_to):
+            # ISO dates compare correctly as strings; timestamps keep their date prefix.
+            day = row[self.date_position][:10] if self.date_position < len(row) else ""
+            if self.date_from and day < self.date_from:
+                return False
+            if self.date_to and day > self.date_to:
+                return False
+        return True
+
+
+class CsvTable:
+    """Incremental, filtered reads of a large CSV file with byte-offset cursors.
+
+    The file is read line by line from a byte offset, so memory stays bounded
+    by the output chunk size whatever the file size. Cursors embed the file
+    signature and are rejected once the file is rewritten, or when their
+    offset is not on a row boundary. Rows must not contain embedded newlines,
+    which holds for the pandas-written artifacts this serves.
+    """
+
+    def __init__(self, path: Path, chunk_rows: int = 500):
+        self.path = Path(path)
+        self.chunk_rows = int(chunk_rows)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def signature(self) -> Optional[Tuple[int, int]]:
+        return file_signature(self.path)
+
+    def header(self) -> Tuple[List[str], int]:
+        """Column names and the byte offset of the first data row."""
+        with self.path.open("rb") as handle:
+            first = handle.readline()
+        return next(csv.reader([first.decode("utf-8-sig")])), len(first)
+
+    def is_row_start(self, offset: int) -> bool:
+        """True when `offset` is the start of a line or the end of the file."""
+        with self.path.open("rb") as handle:
+            size = handle.seek(0, io.SEEK_END)
+            if offset <= 0 or offset > size:
+                return False
+            if offset == size:
+                return True
+            handle.seek(offset - 1)
+            return handle.read(1) == b"\n"
+
+    def _rows(self, start: int, end: Optional[int] = None) -> Iterator[Tuple[int, List[str]]]:
+        """Yield (offset after the row, parsed row) from `start` up to `end`."""
+        with self.path.open("rb") as handle:
+            handle.seek(start)
+            offset = start
+            for raw in handle:
+                offset += len(raw)
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if line:
+                    yield offset, next(csv.reader([line]))
+                if end is not None and offset >= end:
+                    return
+
+    def page_end(self, start: int, row_filter: _CompiledFilter, limit: int) -> Tuple[Optional[int], int]:
+        """Offset just after the `limit`-th matching row from `start`, or None at end of file; plus the row count."""
+        matched = 0
+        for offset, row in self._rows(start):
+            if row_filter(row):
+                matched += 1
+                if matched >= limit:
+                    return offset, matched
+        return None, matched
+
+    def iter_ndjson(self, header: Sequence[str], start: int, end: Optional[int], row_filter: _CompiledFilter) -> Iterator[bytes]:
+        lines: List[str] = []
+        for _, row in self._rows(start, end):
+            if row_filter(row):
+                lines.append(json.dumps(dict(zip(header, row)), ensure_ascii=False))
+                if len(lines) >= self.chunk_rows:
+                    yield ("\n".join(lines) + "\n").encode("utf-8")
+                    lines = []
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+    def iter_csv(self, header: Sequence[str], start: int, end: Optional[int], row_filter: _CompiledFilter) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(header)
+        pending = 1
+        for _, row in self._rows(start, end):
+            if row_filter(row):
+                writer.writerow(row)
+                pending += 1
+                if pending >= self.chunk_rows:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+                    pending = 0
+        if pending:
+            yield buffer.getvalue().encode("utf-8")
+
+
+def stream_page(
+    table: CsvTable,
+    row_filter: RowFilter,
+    limit: int,
+    cursor: Optional[str] = None,
+    fmt: str = "ndjson",
+) -> Tuple[Iterator[bytes], Dict[str, str]]:
+    """Body iterator and headers for one page; `X-Next-Cursor` is set when more rows may follow.
+
+    The page end is found with a counting pass first, so the cursor can go in
+    a response header. The body pass then re-reads only that byte range.
+    """
+    signature = table.signature()
+    header, data_start = table.header()
+    compiled = row_filter.compile(header)
+    start = decode_cursor(cursor, signature) if cursor else data_start
+    if start < data_start or not table.is_row_start(start):
+        raise ValueError("Invalid cursor.")
+    end, count = table.page_end(start, compiled, limit)
+    headers = {"X-Row-Count": str(count)}
+    if end is not None:
+        headers["X-Next-Cursor"] = encode_cursor(end, signature)
+    if fmt == "csv":
+        return table.iter_csv(header, start, end, compiled), headers
+    return table.iter_ndjson(header, start, end, compiled), headers
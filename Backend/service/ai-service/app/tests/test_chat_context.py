@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import unittest
+from unittest import mock
+
+from app import main
+from app.farm_context import FarmContext
+from app.ml_pipeline.cache import TTLCache
+
+
+def _ai_context(ai1: bool = True, ai2: bool = True) -> dict:
+    return {
+        "farm": {"id": "farm-1", "province": "Soc Trang"},
+        "ai1_forecast_7d": [{"day_ahead": 1, "date": "2024-05-02", "salinity_pred": 4.2}] if ai1 else None,
+        "ai2_risk": {"risk_label": "Low"} if ai2 else None,
+        "ai3_decision": {"action": "keep"} if ai1 and ai2 else None,
+    }
+
+
+class TestChatContextSnapshot(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = TTLCache(maxsize=8, ttl_seconds=120, clock=lambda: self.now)
+        self.context = FarmContext(farm_id="farm-1", farm={"id": "farm-1"}, province="Soc Trang")
+        self.build = mock.AsyncMock(return_value=_ai_context())
+        for patcher in (
+            mock.patch.object(main, "_chat_context_cache", self.cache),
+            mock.patch.object(main, "_chat_context_version", return_value=("v1", "v1", "2024-05-01")),
+            mock.patch.object(main, "_build_chat_ai_context", self.build),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_hit_until_ttl_expires(self):
+        first = await main._chat_context_snapshot(None, self.context)
+        self.now = 30.0
+        second = await main._chat_context_snapshot(None, self.context)
+        self.assertFalse(first[2])
+        self.assertEqual(second, (first[0], 30.0, True))
+        self.assertEqual(self.build.await_count, 1)
+
+        self.now = 120.0
+        third = await main._chat_context_snapshot(None, self.context)
+        self.assertFalse(third[2])
+        self.assertEqual(self.build.await_count, 2)
+
+    async def test_degraded_context_is_not_cached(self):
+        for degraded in (_ai_context(ai1=False), _ai_context(ai2=False)):
+            self.build.return_value = degraded
+            context_json, _, cached = await main._chat_context_snapshot(None, self.context)
+            self.assertFalse(cached)
+            self.assertIn('"ai3_decision": null', context_json)
+            self.assertEqual(len(self.cache), 0)
+
+        self.build.return_value = _ai_context()
+        await main._chat_context_snapshot(None, self.context)
+        self.assertTrue((await main._chat_context_snapshot(None, self.context))[2])
+        self.assertEqual(self.build.await_count, 3)
+
+    async def test_farm_without_province_is_cached_without_ai1(self):
+        self.build.return_value = {**_ai_context(ai1=False), "farm": {"id": "farm-1", "province": None}}
+        await main._chat_context_snapshot(None, self.context)
+        self.assertTrue((await main._chat_context_snapshot(None, self.context))[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import unittest
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from app.data_access import FarmDataAccess
+from app.farm_context import FarmContextCache
+from app.ml_pipeline.ai2_features import build_ai2_features
+from app.reading_state import ReadingStateStore
+
+
+class TestFarmDataAccess(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests: list[httpx.Request] = []
+        self.delay = 0.0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if request.method == "POST":
+                return httpx.Response(201, json=[])
+            table = request.url.path.rsplit("/", 1)[-1]
+            rows = {
+                "farms": [{"id": "f1", "address": "Ben Tre"}],
+                "iot_devices": [{"id": "d1"}, {"id": "d2"}],
+                "sensor_readings": [{"device_id": "d1", "salinity": 3.2}],
+                "seasons": [{"season_type": "shrimp", "status": "active"}],
+            }[table]
+            return httpx.Response(200, json=rows)
+
+        self.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        self.data = FarmDataAccess("http://supabase.test", "service-key", http_client=self.http_client)
+
+    async def asyncTearDown(self):
+        await self.data.aclose()
+        await self.http_client.aclose()
+
+    async def test_queries_and_inserts(self):
+        self.assertEqual(await self.data.get_farm("f1", columns="id,address"), {"id": "f1", "address": "Ben Tre"})
+        self.assertEqual(await self.data.list_farm_device_ids("f1"), ["d1", "d2"])
+        readings = await self.data.list_sensor_readings(["d1", "d2"], limit=48, newest_first=True)
+        self.assertEqual(readings[0]["salinity"], 3.2)
+        self.assertEqual((await self.data.get_active_season("f1"))["season_type"], "shrimp")
+        await self.data.insert_analysis_request({"farm_id": "f1", "status": "pending"})
+
+        readings_request = self.requests[2]
+        self.assertEqual(readings_request.url.path, "/rest/v1/sensor_readings")
+        self.assertEqual(readings_request.url.params["device_id"], "in.(d1,d2)")
+        self.assertEqual(readings_request.url.params["order"], "timestamp.desc")
+        self.assertEqual(readings_request.url.params["limit"], "48")
+        self.assertEqual(self.requests[-1].method, "POST")
+        self.assertEqual(self.requests[-1].headers["apikey"], "service-key")
+
+    async def test_bulk_queries_are_chunked(self):
+        farm_ids = [f"f{i}" for i in range(250)] + ["f0"]
+        devices = await self.data.list_devices_for_farms(farm_ids)
+        readings = await self.data.list_recent_readings_for_devices(["d1", "d2"], since="2024-03-01", per_device=4)
+
+        self.assertEqual(len(devices), 6)
+        self.assertEqual(len(readings), 1)
+        farm_filters = [request.url.params["farm_id"] for request in self.requests[:3]]
+        self.assertEqual(sorted(len(value.split(",")) for value in farm_filters), [50, 100, 100])
+        self.assertEqual(self.requests[-1].url.params["timestamp"], "gte.2024-03-01")
+
+    async def test_paged_reads_survive_the_postgrest_row_cap(self):
+        # 3 devices x 1500 hourly readings, served like PostgREST with max-rows=1000.
+        base = pd.Timestamp("2024-03-01", tz="UTC")
+        table = [
+            {"device_id": f"d{device}", "timestamp": (base + pd.Timedelta(hours=hour)).isoformat(), "salinity": hour}
+            for hour in range(1500)
+            for device in range(3)
+        ]
+        served: list[httpx.Request] = []
+
+        async def capped(request: httpx.Request) -> httpx.Response:
+            served.append(request)
+            params = request.url.params
+            if request.url.path.endswith("/farms"):
+                rows = [{"id": f"f{idx:05d}"} for idx in range(2500)]
+            elif request.url.path.endswith("/iot_devices"):
+                wanted = set(params["farm_id"][len("in.(") : -1].split(","))
+                self.assertEqual(params["order"], "id.asc")
+                rows = [
+                    {"id": f"{farm}-d{device:02d}", "farm_id": farm}
+                    for farm in sorted(wanted)
+                    for device in range(12)
+                ]
+            else:
+                wanted = set(params["device_id"][len("in.(") : -1].split(","))
+                since = params.get("timestamp", "gte.")[len("gte.") :]
+                rows = [row for row in table if row["device_id"] in wanted and row["timestamp"] >= since]
+                self.assertEqual(params["order"], "timestamp.desc,device_id.asc")
+                rows.sort(key=lambda row: row["device_id"])
+                rows.sort(key=lambda row: row["timestamp"], reverse=True)
+            offset = int(params.get("offset", 0))
+            limit = min(int(params.get("limit", 1000)), 1000)
+            return httpx.Response(200, json=rows[offset : offset + limit])
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(capped)) as http_client:
+            data = FarmDataAccess("http://supabase.test", "service-key", http_client=http_client)
+            newest = await data.list_recent_readings_for_devices(
+                ["d0", "d1", "d2"], since=base.isoformat(), per_device=16
+            )
+            self.assertEqual(len(served), 1)
+            self.assertEqual(len(newest), 48)
+            self.assertEqual({row["salinity"] for row in newest}, set(range(1484, 1500)))
+
+            window = await data.list_recent_readings_for_devices(["d0", "d1", "d2"], since=base.isoformat())
+            self.assertEqual(len(window), 4500)
+            self.assertEqual(window[0]["salinity"], 1499)
+            self.assertEqual(window[-1]["salinity"], 0)
+
+            # A chatty device must not crowd out one that rarely reports.
+            table.extend(
+                {"device_id": "d3", "timestamp": (base - pd.Timedelta(days=day)).isoformat(), "salinity": -day}
+                for day in range(1, 4)
+            )
+            served.clear()
+            skewed = await data.list_recent_readings_for_devices(["d0", "d3", "d4"], per_device=16)
+            self.assertEqual(sorted(row["salinity"] for row in skewed if row["device_id"] == "d3"), [-3, -2, -1])
+            self.assertEqual(sum(row["device_id"] == "d0" for row in skewed), 16)
+            self.assertNotIn("timestamp", served[0].url.params)
+            self.assertEqual(len(served), 2)
+
+            # 100 farms x 12 devices is more than one response can carry.
+            devices = await data.list_devices_for_farms([f"f{idx:03d}" for idx in range(150)])
+            self.assertEqual(len(devices), 1800)
+            self.assertEqual(len({row["id"] for row in devices}), 1800)
+
+            self.assertEqual(len(await data.list_farms()), 2500)
+            self.assertEqual(len(await data.list_farms(max_rows=1200)), 1200)
+            await data.aclose()
+
+    async def test_slow_round_trips_overlap(self):
+        self.delay = 0.2
+        started = time.perf_counter()
+        farms = await asyncio.gather(*[self.data.get_farm("f1") for _ in range(10)])
+        elapsed = time.perf_counter() - started
+
+        self.assertTrue(all(farm["id"] == "f1" for farm in farms))
+        self.assertLess(elapsed, 1.0)
+
+    async def test_farm_context_cache_hits_and_invalidation(self):
+        contexts = FarmContextCache(self.data, lambda farm: farm["address"], ttl_seconds=60)
+        first, second = await asyncio.gather(contexts.get("f1"), contexts.get("f1"))
+        self.assertIs(first, second)
+        self.assertEqual(first.province, "Ben Tre")
+        self.assertEqual(first.device_ids, ["d1", "d2"])
+        self.assertEqual(first.active_season["season_type"], "shrimp")
+        self.assertEqual(len(self.requests), 3)
+
+        self.assertIs(await contexts.get("f1"), first)
+        self.assertEqual(len(self.requests), 3)
+
+        self.assertEqual(contexts.invalidate(["f1", "unknown"]), 1)
+        self.assertIsNot(await contexts.get("f1"), first)
+        self.assertEqual(len(self.requests), 6)
+
+        # A load already running when the farm is invalidated must not be
+        # joined by later callers or stored over the invalidation.
+        self.delay = 0.05
+        for invalidate in (lambda: contexts.invalidate(["f1"]), lambda: contexts.invalidate()):
+            contexts.invalidate()
+            stale = asyncio.ensure_future(contexts.get("f1"))
+            await asyncio.sleep(0.01)
+            invalidate()
+            fresh = asyncio.ensure_future(contexts.get("f1"))
+            await stale
+            requests_before = len(self.requests)
+            self.assertIsNot(await contexts.get("f1"), await stale)
+            self.assertIs(await contexts.get("f1"), await fresh)
+            self.assertEqual(len(self.requests), requests_before)
+
+
+class TestReadingStateStore(unittest.TestCase):
+    def test_buffers_rebuild_full_history_features(self):
+        rng = np.random.default_rng(3)
+        timestamps = pd.date_range("2024-03-01", periods=40, freq="h", tz="UTC")
+        rows = [
+            {
+                "device_id": f"d{idx % 3}",
+                "timestamp": ts.isoformat(),
+                "salinity": float(rng.gamma(2, 2)),
+                "temperature": float(rng.normal(29, 1)),
+                "ph": float(rng.normal(7.5, 0.2)) if idx % 4 == 0 else None,
+            }
+            for idx, ts in enumerate(timestamps)
+        ]
+        clock = [0.0]
+        state = ReadingStateStore(capacity=8, max_age_seconds=60, clock=lambda: clock[0])
+        self.assertEqual(state.cold_devices(["d0", "d1", "d2"]), ["d0", "d1", "d2"])
+        state.seed(["d0", "d1", "d2"], rows[:30][::-1])
+        # Late arrivals and a duplicate take the out-of-order path.
+        self.assertEqual(state.ingest(rows[30:35] + rows[38:] + rows[35:38] + [rows[20]]), 11)
+        self.assertEqual(state.cold_devices(["d0", "d1", "d2"]), [])
+
+        columns = ["salinity", "ph", "sal_t-1", "sal_t-3", "sal_t-7", "sal_3d_avg", "sal_7d_avg", "temp_7d_avg"]
+        full = build_ai2_features(pd.DataFrame(rows).assign(farm_id="f1"), columns, {})
+        buffered = build_ai2_features(state.frame(["d0", "d1", "d2"]).assign(farm_id="f1"), columns, {})
+        np.testing.assert_allclose(buffered.features.to_numpy(), full.features.to_numpy())
+        self.assertEqual(len(state.frame(["d0"])), 8)
+
+        clock[0] = 61.0
+        self.assertEqual(state.cold_devices(["d0"]), ["d0"])
+        self.assertEqual(state.ingest([{"device_id": "d0", "timestamp": "bad", "salinity": 1, "temperature": 2}]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
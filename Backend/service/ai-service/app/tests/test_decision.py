@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi import HTTPException
+
+from app import main
+from app.data_access import FarmDataAccess
+from app.farm_context import FarmContextCache
+from app.ml_pipeline.infer import ForecastError, ForecastPoint, ForecastResult
+from app.reading_state import ReadingStateStore
+
+BRANCH_DELAY = 0.3
+
+
+class TestDecisionFanOut(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.readings_status = 200
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            table = request.url.path.rsplit("/", 1)[-1]
+            if table == "sensor_readings":
+                await asyncio.sleep(BRANCH_DELAY)
+                if self.readings_status != 200:
+                    return httpx.Response(self.readings_status, json={"message": "upstream failure"})
+            rows = {
+                "farms": [{"id": "f1", "farm_type": "shrimp", "address": "Tran De, Soc Trang"}],
+                "iot_devices": [{"id": "d1"}, {"id": "d2"}],
+                "sensor_readings": [
+                    {"device_id": "d1", "salinity": 3.2, "ph": 7.8, "temperature": 29.0, "timestamp": "2024-05-01T00:00:00+00:00"}
+                ],
+                "seasons": [{"season_type": "shrimp", "start_date": "2024-04-01", "status": "active"}],
+            }[table]
+            return httpx.Response(200, json=rows)
+
+        self.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        data = FarmDataAccess("http://supabase.test", "service-key", http_client=self.http_client)
+        self.forecast_calls = 0
+        self.forecast_error: ForecastError | None = None
+
+        async def forecast(province: str, as_of: str) -> ForecastResult:
+            self.forecast_calls += 1
+            if self.forecast_error is not None:
+                raise self.forecast_error
+            await asyncio.sleep(BRANCH_DELAY)
+            points = [ForecastPoint(day_ahead=day, date=f"2024-05-0{day + 1}", salinity_pred=4.0) for day in range(1, 8)]
+            return ForecastResult(province, as_of, "test", "xgboost", points)
+
+        patches = (
+            mock.patch.object(main, "data_access", data),
+            mock.patch.object(main, "farm_contexts", FarmContextCache(data, main._infer_province_from_farm)),
+            mock.patch.object(main, "reading_state", ReadingStateStore()),
+            mock.patch.object(main, "_forecast_champion", forecast),
+            mock.patch.object(main, "_get_ai2_model_bundle", return_value={"metadata": {"feature_columns": ["salinity"]}}),
+            mock.patch.object(main, "_score_ai2_for_farm", return_value={"risk_label": "Low", "risk_score": 0.1}),
+        )
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.http_client.aclose()
+
+    async def test_forecast_and_readings_run_concurrently(self):
+        started = time.perf_counter()
+        response = await main.get_ai3_decision_by_farm("f1", current_date="2024-05-01")
+        elapsed = time.perf_counter() - started
+
+        self.assertTrue(response["success"])
+        self.assertEqual(response["data"]["province"], "Soc Trang")
+        self.assertEqual(self.forecast_calls, 1)
+        # Sequential branches would take at least 2 * BRANCH_DELAY.
+        self.assertLess(elapsed, BRANCH_DELAY * 1.7)
+
+    async def test_only_devices_with_readings_turn_warm(self):
+        await main.get_ai3_decision_by_farm("f1", current_date="2024-05-01")
+        self.assertEqual(main.reading_state.cold_devices(["d1", "d2"]), ["d2"])
+
+    async def test_failing_forecast_fails_fast(self):
+        self.forecast_error = ForecastError(404, "Unknown province.")
+        started = time.perf_counter()
+        with self.assertRaises(HTTPException) as raised:
+            await main.get_ai3_decision_by_farm("f1", current_date="2024-05-01")
+        self.assertEqual((raised.exception.status_code, raised.exception.detail), (404, "Unknown province."))
+        self.assertLess(time.perf_counter() - started, BRANCH_DELAY)
+
+    async def test_failing_readings_fetch_is_reported(self):
+        self.readings_status = 503
+        with self.assertRaises(HTTPException) as raised:
+            await main.get_ai3_decision_by_farm("f1", current_date="2024-05-01")
+        self.assertEqual(raised.exception.status_code, 500)
+        self.assertEqual(self.forecast_calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
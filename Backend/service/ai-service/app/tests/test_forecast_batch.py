@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import unittest
+from unittest import mock
+
+from app import main
+from app.ml_pipeline.infer import ForecastError, ForecastPoint, ForecastResult
+
+
+def _forecast_many(pairs, model_set):
+    return [
+        ForecastResult(province, "2024-05-01", "test", model_set, [ForecastPoint(1, "2024-05-02", 4.0)])
+        if province
+        else ForecastError(400, "province is required.")
+        for province, _ in pairs
+    ]
+
+
+class TestForecastBatch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        service = mock.Mock(forecast_many=mock.Mock(side_effect=_forecast_many))
+        patcher = mock.patch.object(main, "get_forecast_service", return_value=service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = main.Forecast7DBatchRequest(
+            items=[{"province": "Soc Trang"}, {"farm_id": "f1"}],
+            model_set="champion",
+        )
+
+    async def test_farm_lookup_failure_only_fails_farm_items(self):
+        data = mock.Mock(get_farms=mock.AsyncMock(side_effect=RuntimeError("connection reset")))
+        for data_access, status in ((None, 500), (data, 502)):
+            with mock.patch.object(main, "data_access", data_access):
+                response = await main.forecast_7d_batch(self.request)
+            province_item, farm_item = response["data"]
+            self.assertEqual(province_item["province"], "Soc Trang")
+            self.assertNotIn("error", province_item)
+            self.assertEqual(farm_item["error"]["status_code"], status)
+
+    async def test_farm_items_resolve_their_province(self):
+        data = mock.Mock(get_farms=mock.AsyncMock(return_value=[{"id": "f1", "address": "Hoa Binh, Bac Lieu"}]))
+        with mock.patch.object(main, "data_access", data):
+            response = await main.forecast_7d_batch(self.request)
+        self.assertEqual([item["province"] for item in response["data"]], ["Soc Trang", "Bac Lieu"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app import main
+from app.ml_pipeline.infer import ForecastError
+from app.ml_pipeline.reloader import HotSwapLoader
+
+
+def _stale_service() -> mock.Mock:
+    service = mock.Mock(materialized_path=Path("forecast_table.npz"), metadata_path=Path("metadata.json"))
+    service.materialized_table_current.return_value = False
+    return service
+
+
+class TestForecastTableRebuild(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.rebuilt = []
+
+        def materialize(service, **_kwargs):
+            self.rebuilt.append(service)
+            self.release.wait(5)
+
+        patcher = mock.patch.object(main, "materialize_forecasts", side_effect=lambda **kwargs: materialize(**kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _loader(self, service: mock.Mock, validate=None) -> HotSwapLoader:
+        loader = HotSwapLoader(
+            name="forecast-service-test",
+            build=lambda: service,
+            signature=lambda: "v1",
+            validate=validate,
+            on_swap=main._on_forecast_service_swap,
+            poll_interval=0,
+        )
+        patcher = mock.patch.object(main, "_forecast_loader", loader)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return loader
+
+    def test_candidate_failing_validation_never_rebuilds(self):
+        service = _stale_service()
+
+        def validate(candidate):
+            # The feature index rebuild happens during validation.
+            if candidate.on_dataset_change is not None:
+                candidate.on_dataset_change(candidate)
+            raise ForecastError(500, "broken candidate")
+
+        service.on_dataset_change = None
+        loader = self._loader(service, validate=validate)
+        with self.assertRaises(ForecastError):
+            loader.reload()
+        main._wait_for_forecast_table_rebuild()
+        self.assertEqual(self.rebuilt, [])
+        self.assertIsNot(service.result_cache, main._forecast_result_cache)
+
+    def test_rebuild_requested_during_a_rebuild_is_queued(self):
+        service = _stale_service()
+        self._loader(service).reload()
+        self.assertIs(service.result_cache, main._forecast_result_cache)
+        self.assertIs(service.on_dataset_change, main._schedule_forecast_table_rebuild)
+
+        # The dataset changes again while the first rebuild is still running.
+        main._schedule_forecast_table_rebuild(service)
+        main._schedule_forecast_table_rebuild(service)
+        self.release.set()
+        main._wait_for_forecast_table_rebuild()
+        self.assertEqual(self.rebuilt, [service, service])
+
+    def test_retired_service_does_not_rebuild(self):
+        self._loader(_stale_service())
+        main._schedule_forecast_table_rebuild(_stale_service())
+        main._wait_for_forecast_table_rebuild()
+        self.assertEqual(self.rebuilt, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi import HTTPException
+
+from app import main
+from app.jobs import FAILED, PENDING, RUNNING, SUCCEEDED, Job, JobEngine, JobStore, PermanentJobError
+
+
+class TestJobEngine(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "jobs.sqlite3"
+        self.store = JobStore(self.db_path)
+
+    async def asyncTearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    async def test_dedupes_pending_jobs_and_retries_with_backoff(self):
+        calls: list[tuple[str, int, bool]] = []
+        release = asyncio.Event()
+
+        async def handler(job: Job) -> None:
+            await release.wait()
+            calls.append((job.payload["farm_id"], job.attempts, bool(job.payload.get("recorded"))))
+            job.payload["recorded"] = True
+            if job.payload["farm_id"] == "f1" and job.attempts == 1:
+                raise RuntimeError("supabase timeout")
+            if job.payload["farm_id"] == "f3":
+                raise RuntimeError("always broken")
+
+        engine = JobEngine(self.store, {"analysis": handler}, workers=2, retry_backoff_seconds=0.05, poll_interval=0.02)
+        first, created = await engine.submit("analysis", "f1", {"farm_id": "f1"})
+        duplicates = await asyncio.gather(*[engine.submit("analysis", "f1", {"farm_id": "f1"}) for _ in range(5)])
+        self.assertTrue(created)
+        self.assertTrue(all(job.id == first.id and not dup_created for job, dup_created in duplicates))
+        third, _ = await engine.submit("analysis", "f3", {"farm_id": "f3"})
+        with self.assertRaises(ValueError):
+            await engine.submit("unknown", "f1", {})
+
+        await engine.start()
+        release.set()
+        for _ in range(200):
+            statuses = {self.store.get(first.id).status, self.store.get(third.id).status}
+            if statuses <= {SUCCEEDED, FAILED}:
+                break
+            await asyncio.sleep(0.02)
+        await engine.stop()
+
+        done = self.store.get(first.id)
+        self.assertEqual((done.status, done.attempts), (SUCCEEDED, 2))
+        self.assertIn(("f1", 2, True), calls)
+        failed = self.store.get(third.id)
+        self.assertEqual((failed.status, failed.attempts), (FAILED, 3))
+        self.assertEqual(failed.last_error, "RuntimeError: always broken")
+
+    async def test_jobs_survive_restart_and_pending_limit(self):
+        job, _ = self.store.add("analysis", "f1", {"farm_id": "f1"}, max_attempts=3, max_pending=2)
+        self.store.add("analysis", "f2", {"farm_id": "f2"}, max_attempts=3, max_pending=2)
+        self.assertEqual(self.store.add("analysis", "f3", {}, max_attempts=3, max_pending=2), (None, False))
+        claimed = self.store.claim()
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (job.id, RUNNING, 1))
+        self.store.close()
+
+        # A new process finds the interrupted job and puts it back in the queue.
+        self.store = JobStore(self.db_path)
+        self.assertEqual(self.store.requeue_running(), 1)
+        restored = self.store.get(job.id)
+        self.assertEqual((restored.status, restored.attempts), (PENDING, 0))
+        self.assertEqual(self.store.counts(), {PENDING: 2})
+        self.assertEqual([item.id for item in self.store.list("f1")], [job.id])
+
+    async def test_permanent_errors_fail_without_retry(self):
+        async def handler(job: Job) -> None:
+            raise PermanentJobError("Farm not found: f1")
+
+        engine = JobEngine(self.store, {"analysis": handler}, retry_backoff_seconds=0.01, poll_interval=0.02)
+        job, _ = await engine.submit("analysis", "f1:a", {"farm_id": "f1"})
+        await engine.start()
+        for _ in range(100):
+            if self.store.get(job.id).status == FAILED:
+                break
+            await asyncio.sleep(0.02)
+        await engine.stop()
+        failed = self.store.get(job.id)
+        self.assertEqual((failed.status, failed.attempts), (FAILED, 1))
+
+    async def test_analysis_jobs_dedupe_per_type_and_list_per_farm(self):
+        submitted = []
+        for farm_id, analysis_type in (("f1", "salinity"), ("f1", "risk"), ("f1", "salinity"), ("f10", "risk")):
+            payload = {"farm_id": farm_id, "analysis_type": analysis_type}
+            submitted.append(self.store.add("analysis", main._analysis_job_key(payload), payload, max_attempts=3))
+        self.assertEqual([created for _, created in submitted], [True, True, False, True])
+        self.assertEqual(submitted[2][0].id, submitted[0][0].id)
+        listed = self.store.list(dedupe_prefix="f1:")
+        self.assertEqual({job.payload["analysis_type"] for job in listed}, {"salinity", "risk"})
+        self.assertEqual({job.payload["farm_id"] for job in listed}, {"f1"})
+
+    async def test_analysis_client_errors_are_permanent(self):
+        payload = {"farm_id": "f1", "analysis_type": "salinity", "request_recorded": True}
+        job, _ = self.store.add("analysis", main._analysis_job_key(payload), payload, max_attempts=3)
+        with mock.patch.object(main, "data_access", mock.Mock()), mock.patch.object(main, "farm_contexts", mock.Mock()):
+            with mock.patch.object(main, "process_analysis", side_effect=HTTPException(422, "No readings.")):
+                with self.assertRaises(PermanentJobError):
+                    await main.queue_analysis(job)
+            with mock.patch.object(main, "process_analysis", side_effect=HTTPException(503, "Busy.")):
+                with self.assertRaises(HTTPException):
+                    await main.queue_analysis(job)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from app.llm import LLMGateway, LLMTimeoutError, LLMUnavailableError
+
+
+class _FakeModel:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, content):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return SimpleNamespace(text=f"echo: {content[-1]}")
+
+
+class TestLLMGateway(unittest.IsolatedAsyncioTestCase):
+    async def test_calls_run_off_loop_with_a_concurrency_cap(self):
+        model = _FakeModel(delay=0.2)
+        gateway = LLMGateway(lambda: (model, "fake-model"), max_concurrency=2)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.ensure_future(ticker())
+        started = time.perf_counter()
+        replies = await asyncio.gather(*[gateway.generate(["system", f"q{idx}"]) for idx in range(4)])
+        elapsed = time.perf_counter() - started
+        ticking.cancel()
+        gateway.shutdown()
+
+        self.assertEqual(replies[3], ("echo: q3", "fake-model"))
+        self.assertEqual(model.peak, 2)
+        self.assertGreater(elapsed, 0.35)
+        self.assertGreater(ticks, 20)
+
+    async def test_timeout_keeps_slot_until_upstream_returns(self):
+        model = _FakeModel(delay=0.3)
+        gateway = LLMGateway(
+            lambda: (model, "fake-model"),
+            max_concurrency=1,
+            timeout_seconds=0.05,
+            queue_timeout_seconds=0.05,
+        )
+        with self.assertRaises(LLMTimeoutError):
+            await gateway.generate(["hello"])
+        with self.assertRaises(LLMUnavailableError):
+            await gateway.generate(["hello again"])
+        await asyncio.sleep(0.3)
+        model.delay = 0.0
+        self.assertEqual(await gateway.generate(["later"]), ("echo: later", "fake-model"))
+        self.assertEqual((gateway.timeouts, gateway.rejected), (1, 1))
+        gateway.shutdown()
+
+    async def test_failed_init_is_retried_after_cooldown(self):
+        builds = []
+
+        def factory():
+            builds.append(time.monotonic())
+            return (None, "") if len(builds) == 1 else (_FakeModel(0.0), "fake-model")
+
+        gateway = LLMGateway(factory, init_retry_seconds=0.1)
+        with self.assertRaises(LLMUnavailableError):
+            await gateway.generate(["hi"])
+        with self.assertRaises(LLMUnavailableError):
+            await gateway.generate(["hi"])
+        self.assertEqual(len(builds), 1)
+        await asyncio.sleep(0.12)
+        self.assertEqual((await gateway.generate(["hi"]))[1], "fake-model")
+        gateway.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,21 +1,39 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import shutil
 import tempfile
+import threading
+import time
 import unittest
+from datetime import date
 from pathlib import Path
+from unittest import mock
 
+import joblib
 import numpy as np
 import pandas as pd
 
+from app.ml_pipeline.ai2_features import build_ai2_features, predict_risk
+from app.ml_pipeline.cache import TTLCache
 from app.ml_pipeline.data_loader import normalize_province_name, parse_province_from_address
-from app.ml_pipeline.data_loader import load_salinity_json_folder
+from app.ml_pipeline.data_loader import load_columnar_frame, load_salinity_json_folder, save_columnar_frame
 from app.ml_pipeline.evaluate import build_rolling_origin_windows
 from app.ml_pipeline.feature_builder import (
+    add_advanced_xgb_features,
     build_feature_frame,
+    encode_features,
     filter_valid_provinces,
     time_series_split,
 )
-from app.ml_pipeline.infer import ForecastService
+from app.ml_pipeline.infer import ForecastError, ForecastService
+from app.ml_pipeline.materialize import dataset_content_key, materialize_forecasts
+from app.ml_pipeline.reloader import HotSwapLoader
+from app.ml_pipeline.singleflight import SingleFlight
+from app.ml_pipeline.residual_model import AnchoredXGBRegressor
+from app.ml_pipeline.shared_arrays import is_shared
+from app.ml_pipeline.tree_eval import FlatTreeEnsemble
 from app.ml_pipeline.train import run_training
 
 
@@ -47,6 +65,26 @@ class TestDataLoader(unittest.TestCase):
             self.assertIn("Hau Giang", set(result["province"]))
             self.assertIn("Can Tho", set(result["province"]))
 
+    def test_columnar_frame_roundtrip(self):
+        frame = pd.DataFrame(
+            {
+                "date": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"]),
+                "province": ["Soc Trang", "Bac Lieu", "Soc Trang"],
+                "salinity_daily": [4.14, 4.34, 3.9],
+                "month": [1, 1, 1],
+            }
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_columnar_frame(frame, Path(tmpdir) / "daily.npz", float_dtype="float64")
+            loaded = load_columnar_frame(path)
+
+        self.assertEqual(list(loaded.columns), list(frame.columns))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(loaded["date"]))
+        self.assertIsInstance(loaded["province"].dtype, pd.CategoricalDtype)
+        self.assertEqual(loaded["province"].astype(str).tolist(), frame["province"].tolist())
+        np.testing.assert_array_equal(loaded["salinity_daily"].to_numpy(), frame["salinity_daily"].to_numpy())
+        self.assertEqual(loaded["month"].dtype, np.int32)
+
 
 class TestFeatureBuilder(unittest.TestCase):
     def _build_sample_daily(self) -> pd.DataFrame:
@@ -111,6 +149,9 @@ class TestTrainingIntegration(unittest.TestCase):
                 quick_mode=True,
             )
 
+        self.assertTrue(Path("app/data/prepared_daily_dataset.npz").exists())
+        self.assertTrue(Path("app/data/train_feature_dataset.npz").exists())
+
         models_dir = Path("app/models")
         for horizon in range(1, 8):
             self.assertTrue((models_dir / f"salinity_day{horizon}.pkl").exists())
@@ -132,6 +173,22 @@ class TestTrainingIntegration(unittest.TestCase):
             self.assertEqual(result.model_set_used, model_set)
             self.assertEqual(len(result.forecast), 7)
 
+        for horizon in range(1, 8):
+            self.assertTrue((models_dir / f"salinity_day{horizon}.ubj").exists())
+            self.assertTrue((models_dir / f"salinity_day{horizon}.descriptor.json").exists())
+        native = service._load_model("xgboost", 1)
+        pickled = joblib.load(models_dir / "salinity_day1.pkl")
+        self.assertIsInstance(native, AnchoredXGBRegressor)
+        x_sample = pd.DataFrame(
+            np.random.default_rng(0).random((4, len(metadata["xgboost_feature_columns"]))),
+            columns=metadata["xgboost_feature_columns"],
+        )
+        np.testing.assert_allclose(native.predict(x_sample), pickled.predict(x_sample), rtol=1e-6)
+
+        preloaded = ForecastService(preload_models=True)
+        self.assertEqual(sorted(preloaded.xgboost_models), list(range(1, 8)))
+        self.assertEqual(sorted(preloaded.baseline_models), list(range(1, 8)))
+
     def test_rolling_backtest_windows(self):
         dates = pd.date_range("2024-01-01", periods=365, freq="D")
         windows = build_rolling_origin_windows(
@@ -147,5 +204,320 @@ class TestTrainingIntegration(unittest.TestCase):
             self.assertLess(window.val_end_date, window.test_end_date)
 
 
+class TestAI2Features(unittest.TestCase):
+    def test_batch_features_match_per_farm_definitions(self):
+        timestamps = pd.date_range("2024-03-01", periods=10, freq="D")
+        readings = pd.DataFrame(
+            {
+                "farm_id": ["f1"] * 10 + ["f2"] + ["f3"],
+                "timestamp": list(timestamps[::-1]) + [timestamps[0], "not-a-date"],
+                "salinity": list(np.arange(10.0)[::-1]) + [4.0, 1.0],
+                "temperature": [28.0 + i for i in range(10)][::-1] + [30.0, 30.0],
+                "ph": [7.0] * 8 + [np.nan, np.nan] + [np.nan, 7.0],
+            }
+        )
+        columns = ["salinity", "ph", "sal_t-1", "sal_t-7", "sal_3d_avg", "temp_7d_avg", "sal_change_3d",
+                   "month", "is_dry_season", "province_ben tre"]
+        batch = build_ai2_features(readings, columns, {"f1": "Ben Tre", "f2": None})
+
+        self.assertEqual(batch.keys, ["f1", "f2"])
+        self.assertEqual(batch.errors, {"f3": "Sensor readings invalid for AI2 inference."})
+        f1 = batch.features.iloc[0]
+        self.assertEqual(f1["salinity"], 9.0)
+        self.assertEqual(f1["ph"], 7.0)
+        self.assertEqual(f1["sal_t-1"], 8.0)
+        self.assertEqual(f1["sal_t-7"], 2.0)
+        self.assertAlmostEqual(f1["sal_3d_avg"], 8.0)
+        self.assertAlmostEqual(f1["temp_7d_avg"], 34.0)
+        self.assertEqual(f1["sal_change_3d"], 3.0)
+        self.assertEqual((f1["month"], f1["is_dry_season"], f1["province_ben tre"]), (3.0, 1.0, 1.0))
+        f2 = batch.features.iloc[1]
+        self.assertEqual((f2["salinity"], f2["sal_t-1"], f2["sal_t-7"], f2["ph"]), (4.0, 4.0, 4.0, 7.4))
+        self.assertEqual(f2["province_ben tre"], 0.0)
+        self.assertEqual(batch.diagnostics[0]["history_points"], 10)
+
+    def test_predict_risk_uses_probability_argmax(self):
+        class _Model:
+            classes_ = np.array([0, 1])
+
+            def predict_proba(self, features):
+                return np.array([[0.2, 0.8], [0.9, 0.1]])
+
+            def predict(self, features):
+                raise AssertionError("predict should not be called")
+
+        classes, scores = predict_risk(_Model(), pd.DataFrame({"x": [1.0, 2.0]}))
+        self.assertEqual(classes.tolist(), [1, 0])
+        self.assertEqual(scores.tolist(), [0.8, 0.9])
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction_and_ttl_expiry(self):
+        now = [0.0]
+        cache = TTLCache(maxsize=2, ttl_seconds=10, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+        now[0] = 4.0
+        self.assertEqual(cache.age("c"), 4.0)
+        now[0] = 11.0
+        # Expired but not yet evicted: no age, just like `get` reports a miss.
+        self.assertIsNone(cache.age("c"))
+        self.assertIsNone(cache.get("a"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual((stats["evictions"], stats["expirations"]), (1, 1))
+
+
+class TestHotSwapLoader(unittest.TestCase):
+    def test_swaps_only_settled_and_valid_versions(self):
+        state = {"signature": 1, "valid": True}
+
+        def validate(value):
+            if not state["valid"]:
+                raise ValueError("smoke prediction failed")
+
+        loader = HotSwapLoader(
+            name="test",
+            build=lambda: f"v{state['signature']}",
+            signature=lambda: state["signature"],
+            validate=validate,
+        )
+        self.assertEqual(loader.get(), "v1")
+
+        state["signature"] = 2
+        self.assertFalse(loader.poll())
+        self.assertEqual(loader.get(), "v1")
+        self.assertTrue(loader.poll())
+        self.assertEqual(loader.get(), "v2")
+
+        state.update(signature=3, valid=False)
+        loader.poll()
+        self.assertFalse(loader.poll())
+        self.assertEqual(loader.get(), "v2")
+        self.assertIn("smoke prediction failed", loader.status()["last_error"])
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_callers_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow_forecast():
+            calls.append(threading.get_ident())
+            time.sleep(0.2)
+            return "forecast"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do(("ai1", "Ben Tre"), slow_forecast)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["forecast"] * 5)
+        self.assertEqual(len(calls), 1)
+
+        async def failing_fetch():
+            calls.append("async")
+            await asyncio.sleep(0.05)
+            raise ValueError("no readings")
+
+        async def run_async():
+            return await asyncio.gather(
+                *[flight.do_async(("ai2", "farm-1"), failing_fetch) for _ in range(4)],
+                return_exceptions=True,
+            )
+
+        outcomes = asyncio.run(run_async())
+        self.assertTrue(all(isinstance(outcome, ValueError) for outcome in outcomes))
+        self.assertEqual(calls.count("async"), 1)
+
+        stats = flight.stats()
+        self.assertEqual((stats["executions"], stats["coalesced"], stats["in_flight"]), (2, 7, 0))
+        self.assertEqual(stats["keys"][0]["key"], ["ai1", "Ben Tre"])
+        self.assertGreater(stats["keys"][0]["max_wait_ms"], 0.0)
+
+
+class TestForecastService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.service = ForecastService()
+
+    def test_feature_index_matches_full_rebuild(self):
+        daily = self.service._load_daily_dataset()
+        frame, feature_cols, _ = build_feature_frame(daily, include_targets=False)
+        frame, _ = add_advanced_xgb_features(frame, feature_cols)
+        frame = frame.dropna(subset=self.service.metadata["xgboost_numeric_feature_columns"])
+
+        province = self.service.metadata["provinces"][0]
+        province_frame = frame[frame["province"] == province].sort_values("date")
+        as_of = province_frame["date"].iloc[len(province_frame) // 2]
+        expected = province_frame[province_frame["date"] <= as_of].iloc[-1]
+
+        row_date, values = self.service._latest_feature_row(province, as_of.date())
+        self.assertEqual(row_date, expected["date"].date())
+        sal_idx = self.service.source_columns.index("sal_t-1")
+        self.assertAlmostEqual(values[sal_idx], expected["sal_t-1"], places=9)
+
+        province_cols = self.service.metadata["province_dummy_columns"]
+        for model_name in ("baseline_linear", "xgboost"):
+            numeric_cols, expected_cols = self.service._resolve_feature_spec(model_name)
+            encoded = encode_features(expected.to_frame().T, numeric_cols, province_cols)
+            projected = self.service.projectors[model_name].project(values, [province])
+            self.assertEqual(list(self.service.projectors[model_name].columns), expected_cols)
+            np.testing.assert_allclose(projected[0], encoded[expected_cols].to_numpy(dtype=float)[0])
+
+    def test_forecast_reuses_feature_index(self):
+        province = self.service.metadata["provinces"][0]
+        self.service.forecast(province=province)
+        with mock.patch("app.ml_pipeline.infer.build_feature_frame") as rebuild:
+            self.service.forecast(province=province)
+            self.service.forecast(province=province, as_of="2024-06-01")
+        rebuild.assert_not_called()
+
+    def test_result_cache_shares_forecasts(self):
+        service = ForecastService(result_cache=TTLCache(maxsize=8, ttl_seconds=60))
+        province = service.metadata["provinces"][0]
+        first = service.forecast(province=province, as_of="2024-06-01")
+        second = service.forecast(province=province.upper(), as_of="2024-06-01")
+        self.assertIs(first, second)
+        self.assertEqual(service.result_cache.stats()["hits"], 1)
+
+    def test_forecast_many_matches_single_forecasts(self):
+        provinces = self.service.metadata["provinces"][:3]
+        requests = [(province, "2024-06-01") for province in provinces] + [("Nowhere", None)]
+        outcomes = self.service.forecast_many(requests, model_set="champion")
+
+        self.assertEqual(len(outcomes), len(requests))
+        self.assertIsInstance(outcomes[-1], ForecastError)
+        self.assertEqual(outcomes[-1].status_code, 404)
+        for (province, as_of), outcome in zip(requests[:-1], outcomes[:-1]):
+            single = self.service.forecast(province=province, as_of=as_of)
+            self.assertEqual(outcome.province, single.province)
+            self.assertEqual(
+                [point.salinity_pred for point in outcome.forecast],
+                [point.salinity_pred for point in single.forecast],
+            )
+
+    def test_forecast_range_matches_daily_forecasts(self):
+        province = self.service.metadata["provinces"][1]
+        frame = self.service.forecast_range(province, start="2024-05-01", end="2024-05-10", model_set="xgboost")
+        self.assertEqual(len(frame), 10 * len(self.service.horizons))
+
+        for as_of, group in frame.groupby("as_of"):
+            single = self.service.forecast(province=province, as_of=as_of.strftime("%Y-%m-%d"), model_set="xgboost")
+            self.assertEqual(group["day_ahead"].tolist(), [point.day_ahead for point in single.forecast])
+            self.assertEqual(
+                group["target_date"].dt.strftime("%Y-%m-%d").tolist(),
+                [point.date for point in single.forecast],
+            )
+            np.testing.assert_allclose(
+                group["salinity_pred"].to_numpy(),
+                [point.salinity_pred for point in single.forecast],
+            )
+
+        with self.assertRaises(ForecastError):
+            self.service.forecast_range(province, start="2024-05-10", end="2024-05-01")
+
+    def test_flat_trees_match_xgboost_predict(self):
+        service = ForecastService(materialized_path=None)
+        service.preload_models()
+        province = service.metadata["provinces"][0]
+        _, row = service._latest_feature_row(province, date(2024, 6, 30))
+        encoded = service.projectors["xgboost"].project(np.vstack([row] * 4), [province] * 4)
+        encoded[1, :] = np.nan
+        encoded[2, ::2] = np.nan
+        encoded[3] += np.random.default_rng(0).normal(scale=5.0, size=encoded.shape[1])
+
+        for horizon, model in service.xgboost_models.items():
+            flat = FlatTreeEnsemble.from_booster(model.delta_model.get_booster())
+            np.testing.assert_allclose(
+                flat.predict(encoded),
+                model.delta_model.predict(encoded),
+                atol=1e-5,
+                err_msg=f"day{horizon}",
+            )
+
+        flat_service = ForecastService(materialized_path=None, flat_trees=True)
+        for outcome, expected in zip(
+            flat_service.forecast_many([(province, "2024-06-30")], model_set="xgboost"),
+            service.forecast_many([(province, "2024-06-30")], model_set="xgboost"),
+        ):
+            np.testing.assert_allclose(
+                [point.salinity_pred for point in outcome.forecast],
+                [point.salinity_pred for point in expected.forecast],
+                atol=2e-4,
+            )
+
+    def test_share_memory_keeps_forecasts(self):
+        service = ForecastService(materialized_path=None, flat_trees=True)
+        service.preload_models()
+        requests = [(province, "2024-06-30") for province in service.metadata["provinces"]]
+        before = service.forecast_many(requests, model_set="xgboost")
+
+        self.assertGreater(service.share_memory(), 0)
+        self.assertEqual(service.share_memory(), 0)
+        features = next(iter(service._province_features.values()))
+        self.assertTrue(is_shared(features.values))
+        self.assertFalse(features.values.flags.writeable)
+        self.assertTrue(is_shared(next(iter(service.xgboost_models.values())).flat_trees.threshold))
+        self.assertEqual(service.forecast_many(requests, model_set="xgboost"), before)
+
+    def test_materialized_table_serves_champion_forecasts(self):
+        live = ForecastService(materialized_path=None)
+        province = live.metadata["provinces"][0]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            table_path = materialize_forecasts(
+                output_path=Path(tmp_dir) / "forecast_table.npz",
+                window_days=3,
+                end_date=date(2024, 6, 1),
+            )
+            service = ForecastService(materialized_path=table_path)
+            with mock.patch.object(service, "_latest_feature_row") as live_path:
+                served = service.forecast(province=province, as_of="2024-05-30")
+            live_path.assert_not_called()
+            with mock.patch.object(service, "_materialized_table") as table:
+                service.forecast(province=province, as_of="2024-05-30", live=True)
+            table.assert_not_called()
+
+            expected = live.forecast(province=province, as_of="2024-05-30")
+            self.assertEqual(served, expected)
+            # as_of dates outside the window fall back to live inference.
+            self.assertEqual(
+                service.forecast(province=province, as_of="2024-03-01"),
+                live.forecast(province=province, as_of="2024-03-01"),
+            )
+
+    def test_dataset_change_is_reported_once_per_rebuild(self):
+        changes = []
+        service = ForecastService(materialized_path=None, on_dataset_change=changes.append)
+        province = service.metadata["provinces"][0]
+        service.forecast(province=province, as_of="2024-05-30")
+        service.forecast(province=province, as_of="2024-05-29")
+        self.assertEqual(changes, [service])
+        self.assertIsNotNone(service.dataset_key)
+
+    def test_dataset_content_key_ignores_location_and_mtime(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first = Path(tmp_dir) / "a" / "features.csv"
+            second = Path(tmp_dir) / "b" / "features.csv"
+            first.parent.mkdir()
+            second.parent.mkdir()
+            first.write_text("date,value\n2024-01-01,1\n", encoding="utf-8")
+            shutil.copyfile(first, second)
+            os.utime(second, ns=(0, 0))
+            self.assertEqual(dataset_content_key([first]), dataset_content_key([second]))
+
+            second.write_text("date,value\n2024-01-01,2\n", encoding="utf-8")
+            self.assertNotEqual(dataset_content_key([first]), dataset_content_key([second]))
+
+
 if __name__ == "__main__":
     unittest.main()
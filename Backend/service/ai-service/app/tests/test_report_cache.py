@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi import Request
+
+from app.report_cache import FileResponseCache
+
+
+def _request(if_none_match: str = "") -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class TestFileResponseCache(unittest.TestCase):
+    def test_renders_once_per_file_version_and_answers_304(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "metrics.csv"
+            path.write_text("model,mae\nxgb,0.5\n", encoding="utf-8")
+            renders = []
+
+            def render(report_path: Path) -> dict:
+                renders.append(report_path)
+                return {"success": True, "data": report_path.read_text(encoding="utf-8").splitlines()}
+
+            cache = FileResponseCache()
+            first = cache.respond(_request(), "metrics", path, render)
+            second = cache.respond(_request(), "metrics", path, render)
+            self.assertEqual(len(renders), 1)
+            self.assertEqual(first.body, second.body)
+            self.assertEqual(json.loads(first.body)["data"][1], "xgb,0.5")
+            etag = first.headers["etag"]
+
+            not_modified = cache.respond(_request(f'"other", W/{etag}'), "metrics", path, render)
+            self.assertEqual((not_modified.status_code, not_modified.body), (304, b""))
+
+            path.write_text("model,mae\nxgb,0.4\n", encoding="utf-8")
+            os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000))
+            changed = cache.respond(_request(etag), "metrics", path, render)
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotEqual(changed.headers["etag"], etag)
+            self.assertEqual(len(renders), 2)
+            self.assertEqual(cache.stats()["not_modified"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
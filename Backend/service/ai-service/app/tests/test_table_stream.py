@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.table_stream import CsvTable, CursorError, RowFilter, encode_cursor, stream_page
+
+
+class TestCsvTableStream(unittest.TestCase):
+    def test_cursor_pages_cover_filtered_rows_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "predictions.csv"
+            lines = ["date,province,horizon,predicted"]
+            for day in range(1, 11):
+                for province in ("Ben Tre", "Ca Mau"):
+                    lines.append(f"2024-01-{day:02d},{province},1,{day / 10}")
+            path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            table = CsvTable(path, chunk_rows=2)
+            row_filter = RowFilter(equals=(("province", "Ca Mau"),), date_from="2024-01-03", date_to="2024-01-09")
+
+            rows, cursor, pages = [], None, 0
+            while True:
+                body, headers = stream_page(table, row_filter, limit=3, cursor=cursor)
+                rows.extend(json.loads(line) for line in b"".join(body).decode("utf-8").splitlines())
+                pages += 1
+                cursor = headers.get("X-Next-Cursor")
+                if cursor is None:
+                    break
+            self.assertEqual([row["date"][-2:] for row in rows], ["03", "04", "05", "06", "07", "08", "09"])
+            self.assertEqual({row["province"] for row in rows}, {"Ca Mau"})
+            self.assertEqual(pages, 3)
+
+            body, headers = stream_page(table, row_filter, limit=2, fmt="csv")
+            self.assertEqual(
+                b"".join(body).decode("utf-8").splitlines(),
+                ["date,province,horizon,predicted", "2024-01-03,Ca Mau,1,0.3", "2024-01-04,Ca Mau,1,0.4"],
+            )
+
+            # A forged offset inside a row would yield a corrupt first record.
+            _, data_start = table.header()
+            for offset in (data_start + 3, path.stat().st_size + 1):
+                with self.assertRaisesRegex(ValueError, "Invalid cursor"):
+                    stream_page(table, row_filter, limit=2, cursor=encode_cursor(offset, table.signature()))
+            body, _ = stream_page(table, row_filter, limit=2, cursor=encode_cursor(path.stat().st_size, table.signature()))
+            self.assertEqual(b"".join(body), b"")
+
+            path.write_text("\n".join(lines[:5]) + "\n", encoding="utf-8")
+            os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000))
+            with self.assertRaises(CursorError):
+                stream_page(table, row_filter, limit=2, cursor=headers["X-Next-Cursor"])
+
+
+if __name__ == "__main__":
+    unittest.main()
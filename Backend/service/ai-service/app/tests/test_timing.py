@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from app.ml_pipeline.timing import Histogram, TimingMiddleware, render_metrics, stage
+
+
+class _Route:
+    path = "/api/ai/items/{item_id}"
+
+
+async def _endpoint(scope, receive, send):
+    scope["route"] = _Route()
+    with stage("lookup"):
+        await asyncio.to_thread(lambda: None)
+    with stage("lookup"):
+        pass
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+class TestTiming(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("demo_seconds", "Demo.", ("stage",), buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(("load",), seconds)
+        lines = histogram.render()
+        self.assertIn('demo_seconds_bucket{stage="load",le="0.1"} 2', lines)
+        self.assertIn('demo_seconds_bucket{stage="load",le="1.0"} 3', lines)
+        self.assertIn('demo_seconds_bucket{stage="load",le="+Inf"} 4', lines)
+        self.assertIn('demo_seconds_count{stage="load"} 4', lines)
+        self.assertIn('demo_seconds_sum{stage="load"} 3.65', lines)
+
+    def test_middleware_attributes_stages_to_the_route(self):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        middleware = TimingMiddleware(_endpoint, server_timing=True)
+        asyncio.run(middleware({"type": "http", "method": "GET", "path": "/api/ai/items/7"}, receive, send))
+
+        header = dict(messages[0]["headers"])[b"server-timing"].decode()
+        self.assertRegex(header, r"^lookup;dur=\d+\.\d, total;dur=\d+\.\d$")
+        metrics = render_metrics()
+        self.assertIn(
+            'ai_service_stage_duration_seconds_count{endpoint="/api/ai/items/{item_id}",stage="lookup"} 2', metrics
+        )
+        self.assertIn(
+            'ai_service_request_duration_seconds_count{endpoint="/api/ai/items/{item_id}",method="GET",status="200"} 1',
+            metrics,
+        )
+
+    def test_importing_main_defers_heavy_clients(self):
+        probe = (
+            "import sys, app.main as main; "
+            "print(sorted(name for name in ('google.generativeai', 'supabase', 'joblib', 'sklearn') if name in sys.modules)); "
+            "print('ai_service_startup_seconds{phase=\"import\"}' in main.render_metrics())"
+        )
+        completed = subprocess.run(
+            [sys.executable, "-c", probe],
+            cwd=Path(__file__).resolve().parents[2],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(completed.stdout.splitlines()[-2:], ["[]", "True"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -459,24 +459,18 @@ export const Analysis: React.FC = () => {
       if (province) setManualProvince(province);
       let rootError: any = null;
 
-      if (province && (aiSupportedProvinces.length === 0 || aiSupportedProvinces.includes(province))) {
-        try {
-          const data = await aiService.getForecast7d(province, undefined, 'champion');
-          setForecast(data);
-          setSelectedProvince(data.province || province);
-          return;
-        } catch (provinceError: any) {
-          rootError = provinceError;
-        }
-      }
-
+      // The farm endpoint only re-derives the province, so ask it only when
+      // the page could not infer a supported province itself.
       try {
-        const farmData = await aiService.getForecast7dByFarm(farmId, undefined, 'champion');
-        setForecast(farmData);
-        setSelectedProvince(farmData.province || province || '');
+        const data =
+          province && (aiSupportedProvinces.length === 0 || aiSupportedProvinces.includes(province))
+            ? await aiService.getForecast7d(province, undefined, 'champion')
+            : await aiService.getForecast7dByFarm(farmId, undefined, 'champion');
+        setForecast(data);
+        setSelectedProvince(data.province || province || '');
         return;
-      } catch (farmError: any) {
-        rootError = rootError || farmError;
+      } catch (forecastError: any) {
+        rootError = forecastError;
       }
 
       if (!shouldUseIotFallback(rootError)) {